@@ -1,4 +1,5 @@
 from .airtouch2.at2 import At2Aircon
+from .airtouch2.common.EventBus import StateChanged, Topic
 from .airtouch2.protocol.at2.enums import ACMode
 from .conversions import (
     AT2_TO_HA_MODE,
@@ -7,8 +8,10 @@ from .conversions import (
     HA_FAN_SPEED_TO_AT2
 )
 from .const import DOMAIN
+from .runtime_data import Airtouch2RuntimeData
+from .write_throttle import StateWriteThrottle
 
-from typing import final
+from typing import Any, final
 import asyncio
 import logging
 
@@ -24,6 +27,10 @@ from homeassistant.helpers.entity import DeviceInfo
 
 _LOGGER = logging.getLogger(__name__)
 
+# hvac modes are the same for every AC, the mode table has more than one AT2 mode per HA mode
+_HVAC_MODES: list[HVACMode] = [*dict.fromkeys(AT2_TO_HA_MODE.values()), HVACMode.OFF]
+
+
 @final
 class Airtouch2ClimateEntity(ClimateEntity):
     """Representation of an AirTouch 2 AC."""
@@ -39,131 +46,113 @@ class Airtouch2ClimateEntity(ClimateEntity):
     _attr_precision: float = PRECISION_WHOLE
     _attr_target_temperature_step: float = 1.0
     _attr_temperature_unit: str = UnitOfTemperature.CELSIUS
+    _attr_hvac_modes: list[HVACMode] = _HVAC_MODES
 
     def __init__(
-        self, airtouch2_aircon: At2Aircon
+        self, airtouch2_aircon: At2Aircon, runtime_data: Airtouch2RuntimeData
     ) -> None:
         """Initialize the climate device."""
         _LOGGER.debug(f"Initializing climate device '{airtouch2_aircon.info.name}'")
         self._ac = airtouch2_aircon
+        # the entry's own client and monitor, there is one per controller
+        self._client = runtime_data.client
+        self._monitor = runtime_data.monitor
+        self._attr_unique_id = f"at2_ac_{self._ac.info.number}"
+        # skips writes of updates that change nothing visible and rate limits measured temperature changes
+        self._throttle = StateWriteThrottle(
+            self.async_write_ha_state,
+            {"current_temperature": runtime_data.write_throttle.temperature_deadband},
+            runtime_data.write_throttle.min_write_interval,
+        )
+        self._attr_name = None
+        self._attr_device_info = None
+        self._attr_fan_modes = None
+        self._fan_speeds = None
+        self._refresh_attrs()
+
+    def _refresh_attrs(self) -> None:
+        """Recompute the entity attributes from the AC's state."""
+        info = self._ac.info
+        optimistic = self._ac.optimistic_info
+        name = f"AC {info.name}"
+        if name != self._attr_name:
+            self._attr_name = name
+            self._attr_device_info = DeviceInfo(
+                identifiers={(DOMAIN, self._attr_unique_id)},
+                name=name,
+                manufacturer="Polyaire",
+                model="Airtouch 2",
+                sw_version=f"AC {info.number}",
+            )
+        self._attr_hvac_mode = AT2_TO_HA_MODE[optimistic.mode] if optimistic.active else HVACMode.OFF
+        self._attr_current_temperature = info.measured_temp
+        self._attr_target_temperature = optimistic.set_temp
+        self._attr_fan_mode = AT2_TO_HA_FAN_SPEED[optimistic.fan_speed]
+        if info.supported_fan_speeds != self._fan_speeds:
+            self._fan_speeds = info.supported_fan_speeds
+            self._attr_fan_modes = [AT2_TO_HA_FAN_SPEED[s] for s in info.supported_fan_speeds]
+        self._attr_supported_features = _supported_features(optimistic.mode)
+        self._attr_extra_state_attributes = {"restored": self._ac.restored}
+
+    def _visible_state(self) -> dict[str, Any]:
+        """Everything HA shows for this entity, to compare with what was last written."""
+        return {
+            "name": self._attr_name,
+            "hvac_mode": self._attr_hvac_mode,
+            "current_temperature": self._attr_current_temperature,
+            "target_temperature": self._attr_target_temperature,
+            "fan_mode": self._attr_fan_mode,
+            "fan_modes": self._attr_fan_modes,
+            "supported_features": self._attr_supported_features,
+            "restored": self._ac.restored,
+        }
 
     #
     # Entity overrides:
     #
 
-    @property
-    def unique_id(self) -> str:
-        """Return unique ID for this device."""
-        return f"at2_ac_{self._ac.info.number}"
-
-    @property
-    def name(self):
-        """Return the name of the entity."""
-        return f"AC {self._ac.info.name}"
-
-    @property
-    def device_info(self) -> DeviceInfo:
-        """Return device info for this device."""
-        return DeviceInfo(
-            identifiers={(DOMAIN, self.unique_id)},
-            name=self.name,
-            manufacturer="Polyaire",
-            model="Airtouch 2",
-            sw_version=f"AC {self._ac.info.number}",
-        )
-    
-    @property
-    def available(self) -> bool:
-        """Return if entity is available."""
-        # Check if we have recent data from the AC
-        return self._ac.info is not None
-    
-    @property
-    def should_poll(self) -> bool:
-        """Return True if entity has to be polled for state."""
-        return False
-    
     async def async_update(self) -> None:
         """Update the entity state."""
-        # Force a state write to ensure HA has the latest data
-        self.async_write_ha_state()
+        # HA writes the state after this
+        self._refresh_attrs()
 
     async def async_added_to_hass(self) -> None:
         """Call when entity is added."""
         # Add callback for when aircon receives new data.
         # Removes callback on remove.
         self.async_on_remove(self._ac.add_callback(self._on_aircon_update))
-        
+        self.async_on_remove(self._client.events.subscribe(
+            Topic.STATE_CHANGED, self._on_state_changed, self._ac.device_key))
+        self.async_on_remove(self._throttle.cancel)
+        self._throttle.written(self._visible_state())
+
+    def _on_state_changed(self, event: StateChanged) -> None:
+        """Tell the connection monitor the controller is alive when it reports the AC's state."""
+        # unconfirmed changes are commands sent, pending ones expiring and republished state, not received data
+        if event.confirmed:
+            self._monitor.update_last_seen()
+
     def _on_aircon_update(self) -> None:
-        """Handle aircon update and notify connection monitor."""
-        # Update connection monitor that we received data
-        try:
-            for data in self.hass.data[DOMAIN].values():
-                if isinstance(data, dict) and "monitor" in data:
-                    data["monitor"].update_last_seen()
-                    break
-        except Exception:
-            pass  # Ignore errors in connection monitoring
-        
-        # Schedule state update on the event loop
-        if self.hass:
-            self.hass.async_create_task(self._async_update_ha_state())
-    
-    async def _async_update_ha_state(self) -> None:
-        """Update Home Assistant state asynchronously."""
-        self.async_write_ha_state()
+        """Handle aircon update."""
+        # already on the event loop, called back by the client
+        self._refresh_attrs()
+        # the effects of commands are shown straight away
+        self._throttle.update(self._visible_state(), urgent=self._ac.pending)
 
     #
     # ClimateEntity overrides:
     #
 
-    @property
-    def hvac_mode(self) -> str:
-        """Return hvac operation ie. heat, cool mode."""
-        if not self._ac.info.active:
-            return HVACMode.OFF
-
-        return AT2_TO_HA_MODE[self._ac.info.mode]
-
-    @property
-    def hvac_modes(self) -> list[HVACMode]:
-        """Return the list of available hvac operation modes."""
-        return list(AT2_TO_HA_MODE.values()) + [HVACMode.OFF]
-
-    @property
-    def current_temperature(self) -> float:
-        """Return the current temperature."""
-        return self._ac.info.measured_temp
-
-    @property
-    def target_temperature(self) -> float:
-        """Return the temperature we try to reach."""
-        return self._ac.info.set_temp
-
-    @property
-    def fan_mode(self) -> str:
-        """Return fan mode of this AC."""
-        return AT2_TO_HA_FAN_SPEED[self._ac.info.fan_speed]
-
-    @property
-    def fan_modes(self) -> list[str]:
-        """Return the list of available fan modes."""
-        return [AT2_TO_HA_FAN_SPEED[s] for s in self._ac.info.supported_fan_speeds]
-
     async def async_set_temperature(self, **kwargs) -> None:
         """Set new target temperature."""
         temp = int(kwargs.get(ATTR_TEMPERATURE, 0))
         if temp > 0:  # Only set if we have a valid temperature
             await self._ac.set_set_temp(temp)
             _LOGGER.debug("Set temperature to %d for AC %s", temp, self._ac.info.name)
-            # Immediately update the state for responsive UI
-            self.async_write_ha_state()
 
     async def async_set_fan_mode(self, fan_mode: str) -> None:
         """Set new target fan mode."""
         await self._ac.set_fan_speed(HA_FAN_SPEED_TO_AT2[fan_mode])
-        # Immediately update the state for responsive UI
-        self.async_write_ha_state()
 
     async def async_set_hvac_mode(self, hvac_mode: HVACMode) -> None:
         """Set new target hvac mode."""
@@ -176,46 +165,33 @@ class Airtouch2ClimateEntity(ClimateEntity):
                 _LOGGER.error("Unsupported HVAC mode: %s", hvac_mode)
                 return
             
-            # Always ensure AC is on when setting a mode (turn on if needed)
-            if not self._ac.info.active:
-                await self._ac.turn_on()
-                _LOGGER.debug("Turned on AC %s for mode change", self._ac.info.name)
+            # Always ensure AC is on when setting a mode, this is a no-op if it is (or is about to be) on
+            await self._ac.turn_on()
             
             # Set the mode
             await self._ac.set_mode(HA_MODE_TO_AT2[hvac_mode])
             _LOGGER.debug("Set mode to %s for AC %s", hvac_mode, self._ac.info.name)
-            
-        # Immediately update the state for responsive UI
-        self.async_write_ha_state()
 
     async def async_turn_on(self):
         """Turn on."""
-        if not self._ac.info.active:
-            await self._ac.turn_on()
-            _LOGGER.debug("Turned on AC %s", self._ac.info.name)
-            # Immediately update the state for responsive UI
-            self.async_write_ha_state()
+        await self._ac.turn_on()
+        _LOGGER.debug("Turned on AC %s", self._ac.info.name)
 
     async def async_turn_off(self):
         """Turn off."""
-        if self._ac.info.active:
-            await self._ac.turn_off()
-            _LOGGER.debug("Turned off AC %s", self._ac.info.name)
-            # Immediately update the state for responsive UI
-            self.async_write_ha_state()
-
-    @property
-    def supported_features(self) -> ClimateEntityFeature:
-        """Return the list of supported features."""
-        mode: ACMode = self._ac.info.mode
-
-        # Dry mode supports no features
-        if mode == ACMode.DRY:
-            # only because there's no ClimateEntityFeature.NONE
-            return ClimateEntityFeature.TARGET_TEMPERATURE
-
-        # Fan mode doesn't support target temperature
-        if mode == ACMode.FAN:
-            return ClimateEntityFeature.FAN_MODE
-
-        return ClimateEntityFeature.TURN_OFF | ClimateEntityFeature.TURN_ON | ClimateEntityFeature.TARGET_TEMPERATURE | ClimateEntityFeature.FAN_MODE
\ No newline at end of file
+        await self._ac.turn_off()
+        _LOGGER.debug("Turned off AC %s", self._ac.info.name)
+
+
+def _supported_features(mode: ACMode) -> ClimateEntityFeature:
+    """The features an AC supports in 'mode'."""
+    # Dry mode supports no features
+    if mode == ACMode.DRY:
+        # only because there's no ClimateEntityFeature.NONE
+        return ClimateEntityFeature.TARGET_TEMPERATURE
+
+    # Fan mode doesn't support target temperature
+    if mode == ACMode.FAN:
+        return ClimateEntityFeature.FAN_MODE
+
+    return ClimateEntityFeature.TURN_OFF | ClimateEntityFeature.TURN_ON | ClimateEntityFeature.TARGET_TEMPERATURE | ClimateEntityFeature.FAN_MODE
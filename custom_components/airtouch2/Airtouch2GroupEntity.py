@@ -7,10 +7,13 @@ from typing import Any, final
 _VERSION_ID = "v2024.09.18-fixes"
 
 from .airtouch2.at2 import At2Group
+from .airtouch2.common.EventBus import StateChanged, Topic
 from homeassistant.components.fan import FanEntity, FanEntityFeature
 from homeassistant.helpers.entity import DeviceInfo
 
 from .const import DOMAIN
+from .runtime_data import Airtouch2RuntimeData
+from .write_throttle import StateWriteThrottle
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -24,40 +27,84 @@ class AirTouch2GroupEntity(FanEntity):
     #
     _attr_should_poll: bool = False
 
-    def __init__(self, group: At2Group) -> None:
+    #
+    # FanEntity attributes:
+    #
+    _attr_speed_count: int = 10
+    _attr_supported_features: FanEntityFeature = (
+        FanEntityFeature.TURN_ON
+        | FanEntityFeature.TURN_OFF
+        | FanEntityFeature.SET_SPEED
+    )
+
+    def __init__(self, group: At2Group, runtime_data: Airtouch2RuntimeData) -> None:
         """Initialize the fan entity."""
         self._group = group
+        # the entry's own client and monitor, there is one per controller
+        self._client = runtime_data.client
+        self._monitor = runtime_data.monitor
         _LOGGER.debug(f"Initializing AirTouch2 group entity {_VERSION_ID}")
+        self._attr_unique_id = f"airtouch2_group_{self._group.info.number}"
+        # skips writes of updates that change nothing visible and rate limits damper changes
+        self._throttle = StateWriteThrottle(
+            self.async_write_ha_state,
+            {"percentage": runtime_data.write_throttle.damper_deadband},
+            runtime_data.write_throttle.min_write_interval,
+        )
+        self._attr_name = None
+        self._attr_device_info = None
+        self._refresh_attrs()
+
+    def _refresh_attrs(self) -> None:
+        """Recompute the entity attributes from the group's state."""
+        name = f"{self._group.info.name}"
+        if name != self._attr_name:
+            self._attr_name = name
+            self._attr_device_info = DeviceInfo(
+                identifiers={(DOMAIN, self._attr_unique_id)},
+                name=name,
+                manufacturer="Polyaire",
+                model="Airtouch 2",
+            )
+        info = self._group.optimistic_info
+        self._attr_is_on = info.active
+        self._attr_percentage = info.damp * 10 if info.active else 0
+        self._attr_extra_state_attributes = {"restored": self._group.restored}
+
+    def _visible_state(self) -> dict[str, Any]:
+        """Everything HA shows for this entity, to compare with what was last written."""
+        return {
+            "name": self._attr_name,
+            "is_on": self._attr_is_on,
+            "percentage": self._attr_percentage,
+            "restored": self._group.restored,
+        }
 
     #
     # Entity overrides:
     #
 
-    @property
-    def unique_id(self) -> str:
-        """Return unique ID for this device."""
-        return f"airtouch2_group_{self._group.info.number}"
-
-    @property
-    def name(self):
-        """Return the name of this group."""
-        return f"{self._group.info.name}"
-
-    @property
-    def device_info(self) -> DeviceInfo:
-        """Return device info for this device."""
-        return DeviceInfo(
-            identifiers={(DOMAIN, self.unique_id)},
-            name=self.name,
-            manufacturer="Polyaire",
-            model="Airtouch 2",
-        )
-
     async def async_added_to_hass(self) -> None:
         """Call when entity is added."""
         # Add callback for when group receives new data.
         # Removes callback on remove.
-        self.async_on_remove(self._group.add_callback(self.async_write_ha_state))
+        self.async_on_remove(self._group.add_callback(self._on_group_update))
+        self.async_on_remove(self._client.events.subscribe(
+            Topic.STATE_CHANGED, self._on_state_changed, self._group.device_key))
+        self.async_on_remove(self._throttle.cancel)
+        self._throttle.written(self._visible_state())
+
+    def _on_state_changed(self, event: StateChanged) -> None:
+        """Tell the connection monitor the controller is alive when it reports the group's state."""
+        # unconfirmed changes are commands sent, pending ones expiring and republished state, not received data
+        if event.confirmed:
+            self._monitor.update_last_seen()
+
+    def _on_group_update(self) -> None:
+        """Write the new state to HA, unless nothing visible changed since the last write."""
+        self._refresh_attrs()
+        # the effects of commands are shown straight away
+        self._throttle.update(self._visible_state(), urgent=self._group.pending)
 
     #
     # FanEntity overrides
@@ -71,9 +118,8 @@ class AirTouch2GroupEntity(FanEntity):
         damp = int(percentage / 10)
         # clamp between 1 and 10
         damp = max(min(damp, 10), 1)
+        # the group's callback writes the optimistic state as soon as the command is queued
         await self._group.set_damp(damp)
-        # Immediately update the state for responsive UI
-        self.async_write_ha_state()
 
     async def async_turn_on(
         self,
@@ -82,39 +128,9 @@ class AirTouch2GroupEntity(FanEntity):
         **kwargs: Any,
     ) -> None:
         """Turn on the group."""
-        if not self._group.info.active:
-            await self._group.turn_on()
+        await self._group.turn_on()
         if percentage:
             await self.async_set_percentage(percentage)
-        else:
-            # Immediately update the state for responsive UI
-            self.async_write_ha_state()
-
-    @property
-    def is_on(self):
-        """Return if group is on."""
-        return self._group.info.active
-
-    @property
-    def percentage(self) -> int:
-        """Return current percentage of the group damper."""
-        if not self._group.info.active:
-            return 0
-        return self._group.info.damp * 10
-
-    @property
-    def speed_count(self) -> int:
-        """Return the number of speeds the fan supports."""
-        return 10
-
-    @property
-    def supported_features(self) -> FanEntityFeature:
-        """Fan supported features."""
-        return (
-            FanEntityFeature.TURN_ON
-            | FanEntityFeature.TURN_OFF
-            | FanEntityFeature.SET_SPEED
-        )
 
     #
     # ToggleEntity overrides:
@@ -122,7 +138,4 @@ class AirTouch2GroupEntity(FanEntity):
 
     async def async_turn_off(self, **kwargs: Any) -> None:
         """Turn off the group."""
-        if self._group.info.active:
-            await self._group.turn_off()
-            # Immediately update the state for responsive UI
-            self.async_write_ha_state()
\ No newline at end of file
+        await self._group.turn_off()
\ No newline at end of file
@@ -2,35 +2,113 @@
 from __future__ import annotations
 
 import logging
+from typing import Optional
+
+import voluptuous as vol
 
 from .airtouch2.at2 import At2Client
+from .airtouch2.common.EventBus import StateChanged, Topic
+from .airtouch2.discovery import ControllerProtocol, create_client
 
+from homeassistant.components import persistent_notification
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import CONF_HOST, Platform
-from homeassistant.core import HomeAssistant, ServiceCall
-from homeassistant.exceptions import ConfigEntryNotReady
-from homeassistant.helpers import device_registry as dr
-
-from .const import DOMAIN
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, ServiceCall, callback
+from homeassistant.helpers import config_validation as cv, device_registry as dr
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import Store
+
+from .const import (
+    CONF_OFFLOAD_SLOW_CALLBACKS,
+    CONF_PROTOCOL,
+    CONF_SYSTEM_NAME,
+    DEFAULT_OFFLOAD_SLOW_CALLBACKS,
+    DOMAIN,
+    SUPPORTED_PROTOCOLS,
+)
 from .connection_monitor import AirTouch2ConnectionMonitor
+from .profiler import DEFAULT_PROFILE_SECONDS, MAX_PROFILE_SECONDS, async_profile
+from .runtime_data import Airtouch2RuntimeData
+from .scanner import async_get_scanner, async_local_network
+from .write_throttle import WriteThrottleSettings
 
 _LOGGER = logging.getLogger(__name__)
 
-PLATFORMS: list[Platform] = [Platform.CLIMATE, Platform.FAN]
+PLATFORMS: list[Platform] = [Platform.CLIMATE, Platform.FAN, Platform.SENSOR]
+
+TOPOLOGY_STORE_VERSION = 1
+# Seconds to wait before writing a changed topology, so a burst of discovery is written once
+TOPOLOGY_SAVE_DELAY = 5.0
+# Seconds after the first state change that changed state is written, it only needs to be recent enough to start
+# from. Not a delay that restarts on each change, state changes with most frames so it would never be written
+SNAPSHOT_SAVE_DELAY = 60.0
+
+SERVICE_PROFILE = "profile"
+PROFILE_SCHEMA = vol.Schema(
+    {
+        vol.Optional("seconds", default=DEFAULT_PROFILE_SECONDS): vol.All(
+            vol.Coerce(float), vol.Range(min=1, max=MAX_PROFILE_SECONDS)
+        ),
+        vol.Optional("loop_lag", default=True): cv.boolean,
+    }
+)
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up airtouch2 from a config entry."""
 
     hass.data.setdefault(DOMAIN, {})
-    client = At2Client(entry.data[CONF_HOST])
-    if not await client.connect():
-        raise ConfigEntryNotReady(
-            f"Airtouch2 client failed to connect to {entry.data[CONF_HOST]}")
-    client.run()
-    await client.wait_for_ac()
-    if not client.aircons_by_id:
-        raise ConfigEntryNotReady("No AC units were found")
+    # entries from before the protocol was probed are all AT2
+    protocol = ControllerProtocol(entry.data.get(CONF_PROTOCOL, ControllerProtocol.AT2.value))
+    if protocol not in SUPPORTED_PROTOCOLS:
+        _LOGGER.error(f"Controller at {entry.data[CONF_HOST]} speaks the unsupported {protocol.value} protocol")
+        return False
+    client = create_client(
+        entry.data[CONF_HOST],
+        protocol,
+        offload_slow_subscribers=entry.options.get(CONF_OFFLOAD_SLOW_CALLBACKS, DEFAULT_OFFLOAD_SLOW_CALLBACKS),
+    )
+    # the platforms and diagnostics handle AT2 devices only, which SUPPORTED_PROTOCOLS ensures
+    assert isinstance(client, At2Client)
+    store: Store = Store(hass, TOPOLOGY_STORE_VERSION, f"{DOMAIN}.topology.{entry.data[CONF_HOST]}")
+    cached = await store.async_load()
+    if cached is not None and client.restore_topology(cached):
+        # entities start from the cached snapshot, marked as restored until the controller reports
+        _LOGGER.debug(f"Topology restored: {client.topology_progress}")
+    # connect and discover in the background, the platforms add entities for devices as they are found
+    client.run(connect=True)
+
+    def on_topology_changed(_event) -> None:
+        if client.topology_invalidated:
+            # entities were created from a stale cache, start over from the network
+            _LOGGER.info("Cached topology is out of date, reloading")
+            hass.async_create_task(_async_drop_topology_and_reload(hass, entry, store))
+        else:
+            store.async_delay_save(client.export_topology, TOPOLOGY_SAVE_DELAY)
+
+    # its own timer rather than the store's delayed save, which would postpone a pending topology save
+    snapshot_save: Optional[CALLBACK_TYPE] = None
+
+    @callback
+    def save_snapshot(_now) -> None:
+        nonlocal snapshot_save
+        snapshot_save = None
+        if (snapshot := client.export_topology()) is not None:
+            hass.async_create_task(store.async_save(snapshot))
+
+    def on_state_changed(event: StateChanged) -> None:
+        nonlocal snapshot_save
+        if event.confirmed and event.changed and snapshot_save is None:
+            snapshot_save = async_call_later(hass, SNAPSHOT_SAVE_DELAY, save_snapshot)
+
+    def flush_snapshot() -> None:
+        if snapshot_save is not None:
+            snapshot_save()
+            save_snapshot(None)
+
+    entry.async_on_unload(client.events.subscribe(Topic.TOPOLOGY_CHANGED, on_topology_changed))
+    entry.async_on_unload(client.events.subscribe(Topic.STATE_CHANGED, on_state_changed))
+    entry.async_on_unload(flush_snapshot)
     
     # Create connection monitor
     def on_reconnect():
@@ -40,16 +118,17 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
             hass.config_entries.async_reload(entry.entry_id)
         )
     
+    async def on_unreachable() -> None:
+        """Look for the controller at another address, in case its DHCP lease changed."""
+        await _async_relocate_controller(hass, entry)
+
     monitor = AirTouch2ConnectionMonitor(
-        hass, client, entry.data[CONF_HOST], on_reconnect
+        hass, client, entry.data[CONF_HOST], on_reconnect, on_unreachable
     )
     
     # Store both client and monitor
-    hass.data[DOMAIN][entry.entry_id] = {
-        "client": client,
-        "monitor": monitor,
-        "host": entry.data[CONF_HOST]
-    }
+    hass.data[DOMAIN][entry.entry_id] = Airtouch2RuntimeData(
+        client, monitor, entry.data[CONF_HOST], WriteThrottleSettings.from_options(entry.options))
     
     # Start monitoring
     monitor.start_monitoring()
@@ -68,9 +147,9 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     if unload_ok := await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
-        data = hass.data[DOMAIN][entry.entry_id]
-        client: At2Client = data["client"]
-        monitor: AirTouch2ConnectionMonitor = data["monitor"]
+        data: Airtouch2RuntimeData = hass.data[DOMAIN][entry.entry_id]
+        client = data.client
+        monitor = data.monitor
         
         # Stop monitoring
         monitor.stop_monitoring()
@@ -82,6 +161,35 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     return unload_ok
 
 
+async def _async_drop_topology_and_reload(hass: HomeAssistant, entry: ConfigEntry, store: Store) -> None:
+    """Forget the cached topology and reload the config entry."""
+    await store.async_remove()
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
+async def _async_relocate_controller(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Scan the local network for the entry's controller and move the entry to its new address."""
+    network = await async_local_network(hass)
+    if network is None:
+        return
+    host = entry.data[CONF_HOST]
+    scanner = async_get_scanner(hass)
+    scanner.forget(host)
+    # the old address and other entries' controllers can't be this one
+    exclude = {other.data[CONF_HOST] for other in hass.config_entries.async_entries(DOMAIN)}
+    found = await scanner.find(
+        network,
+        ControllerProtocol(entry.data.get(CONF_PROTOCOL, ControllerProtocol.AT2.value)),
+        entry.data.get(CONF_SYSTEM_NAME),
+        exclude,
+    )
+    if found is None:
+        return
+    _LOGGER.warning("AirTouch2 controller moved from %s to %s", host, found.host)
+    # the update listener reloads the entry
+    hass.config_entries.async_update_entry(entry, data={**entry.data, CONF_HOST: found.host})
+
+
 async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
     """Reload the config entry when it changed."""
     await hass.config_entries.async_reload(entry.entry_id)
@@ -97,8 +205,8 @@ async def _async_register_services(hass: HomeAssistant) -> None:
         # Reconnect all AirTouch2 integrations
         reconnected_count = 0
         for entry_id, data in hass.data[DOMAIN].items():
-            if isinstance(data, dict) and "monitor" in data:
-                monitor = data["monitor"]
+            if isinstance(data, Airtouch2RuntimeData):
+                monitor = data.monitor
                 try:
                     success = await monitor.force_reconnect()
                     if success:
@@ -120,4 +228,21 @@ async def _async_register_services(hass: HomeAssistant) -> None:
             DOMAIN,
             "reconnect",
             async_reconnect_service,
+        )
+
+    async def async_profile_service(call: ServiceCall) -> None:
+        """Service to profile the integration and write a report to the config directory."""
+        seconds = call.data["seconds"]
+        _LOGGER.info("Profiling AirTouch2 for %.0f seconds", seconds)
+        path = await async_profile(hass, seconds, call.data["loop_lag"])
+        persistent_notification.async_create(
+            hass, f"The AirTouch2 profile report was written to {path}", "AirTouch2 profile"
+        )
+
+    if not hass.services.has_service(DOMAIN, SERVICE_PROFILE):
+        hass.services.async_register(
+            DOMAIN,
+            SERVICE_PROFILE,
+            async_profile_service,
+            schema=PROFILE_SCHEMA,
         )
\ No newline at end of file
@@ -1,62 +1,170 @@
 from __future__ import annotations
 import asyncio
 import logging
-from typing import TYPE_CHECKING, Callable
-from ..common.interfaces import Publisher, Callback, add_callback
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+from ..common.Coalescer import Coalescer
+from ..common.PendingLedger import DEFAULT_CONFIRM_TIMEOUT, DEFAULT_PENDING_TIMEOUT, CommandResult, PendingLedger
+from ..common.EventBus import StateChanged, Topic, changed_fields, describe
+from ..common.interfaces import Publisher, Callback, Serializable
 if TYPE_CHECKING:
     from .At2Client import At2Client
 from ..protocol.at2.enums import ACFanSpeed, ACBrand, ACMode
 from ..protocol.at2.messages import ChangeSetTemperature, SetFanSpeed, SetMode, ToggleAc
 from ..protocol.at2.messages.SystemInfo import AcInfo
+from .StepConverger import DEFAULT_CONVERGE_TIMEOUT, StepConverger
 
 _LOGGER = logging.getLogger(__name__)
 
 
 class At2Aircon(Publisher):
+    """
+    A single AT2 AC unit.
+
+    'info' is the state last reported by the controller, 'optimistic_info' is that state with the effect of commands
+    that have been sent but not yet confirmed applied over it. Callbacks are called when either changes.
+    """
     info: AcInfo
 
     def __init__(self, client: At2Client, info: AcInfo):
         self._client: At2Client = client
-        self._callbacks: list[Callable] = []
         self.info = info
+        # True while 'info' comes from a topology cache rather than the controller
+        self.restored = False
+        self._pending: PendingLedger[AcInfo] = PendingLedger(self._on_pending_expired, client.record_command_result)
+        self._optimistic_info: AcInfo = info
+        self._set_temp_converger = StepConverger(
+            f"AC {info.number} set temperature", lambda: self.info.set_temp, self.inc_dec_set_temp,
+            client.scheduler.on_error)
+        self._set_temp_coalescer: Coalescer[int] = Coalescer(
+            lambda: self.info.set_temp,
+            lambda: self._set_temp_converger.converge(lambda: self._set_temp_coalescer.target),
+            client.task_creator)
+
+    @property
+    def optimistic_info(self) -> AcInfo:
+        return self._optimistic_info
+
+    @property
+    def pending(self) -> bool:
+        """True while commands sent to the device are not yet confirmed by the controller"""
+        return bool(self._pending)
 
     def update(self, info: AcInfo) -> None:
+        old = self.info
         self.info = info
-
-        for callback in self._callbacks:
-            callback()
+        self.restored = False
+        self._pending.confirm(info)
+        self._optimistic_info = self._pending.apply(info)
+        self._set_temp_converger.notify()
+        self._client.events.publish(StateChanged(self.device_key, old, info, changed_fields(old, info)))
 
     def add_callback(self, callback: Callback) -> Callback:
-        return add_callback(callback, self._callbacks)
+        return self._client.events.subscribe(Topic.DEVICE_UPDATED, lambda _event: callback(), self.device_key,
+                                             name=describe(callback))
+
+    @property
+    def device_key(self) -> tuple[str, int]:
+        return ("ac", self.info.number)
 
     async def inc_dec_set_temp(self, inc: bool):
-        await self._client.send(ChangeSetTemperature(self.info.number, inc))
+        await self._client.send(ChangeSetTemperature(self.info.number, inc), device=self.device_key)
 
-    async def set_set_temp(self, new_temp: int):
-        temp_diff = new_temp - self.info.set_temp
-        inc = temp_diff > 0
-        for i in range(abs(temp_diff)):
-            await self.inc_dec_set_temp(inc)
-            await asyncio.sleep(0.1)  # server doesn't like being spammed, 0.1s is faster than waiting for response.
+    async def set_set_temp(self, new_temp: int, confirm: bool = False,
+                           timeout: float = DEFAULT_CONVERGE_TIMEOUT) -> bool | CommandResult:
+        """
+        Step the set temperature to 'new_temp', return True once the controller reports it.
+        Calls made while a change is in flight retarget it rather than queueing more steps.
+        With 'confirm', return a CommandResult that also carries how long it took.
+        """
+        if not self._set_temp_coalescer.accepts(new_temp):
+            # already there, nothing is sent so there is nothing to expect
+            return CommandResult(True, 0.0, 0) if confirm else True
+        started = asyncio.get_running_loop().time()
+        self._expect("set_temp", new_temp, DEFAULT_CONVERGE_TIMEOUT)
+        try:
+            reached = await asyncio.wait_for(asyncio.shield(self._set_temp_coalescer.set(new_temp)), timeout)
+        except asyncio.TimeoutError:
+            reached = False
+        if not reached:
+            self._discard("set_temp", new_temp)
+        if not confirm:
+            return reached
+        latency = asyncio.get_running_loop().time() - started if reached else None
+        result = CommandResult(reached, latency, 1)
+        self._client.record_command_result(result)
+        return result
 
-    async def turn_off(self):
-        await self._turn_on_off(False)
+    async def turn_off(self, confirm: bool = False,
+                       timeout: float = DEFAULT_CONFIRM_TIMEOUT) -> Optional[CommandResult]:
+        return await self._turn_on_off(False, confirm, timeout)
 
-    async def turn_on(self):
-        await self._turn_on_off(True)
+    async def turn_on(self, confirm: bool = False,
+                      timeout: float = DEFAULT_CONFIRM_TIMEOUT) -> Optional[CommandResult]:
+        return await self._turn_on_off(True, confirm, timeout)
 
-    async def set_fan_speed(self, fan_speed: ACFanSpeed):
-        if fan_speed in self.info.supported_fan_speeds:
-            await self._client.send(SetFanSpeed(self.info.number, self.info.supported_fan_speeds, fan_speed))
-        else:
+    async def set_fan_speed(self, fan_speed: ACFanSpeed, confirm: bool = False,
+                            timeout: float = DEFAULT_CONFIRM_TIMEOUT) -> Optional[CommandResult]:
+        if fan_speed not in self.info.supported_fan_speeds:
             _LOGGER.warning(f"Cannot set fan speed to unsupported value {fan_speed}")
+            return CommandResult(False, None, 0) if confirm else None
+        return await self._command("fan_speed", fan_speed, lambda: self._send_expecting(
+            "fan_speed", fan_speed, SetFanSpeed(self.info.number, self.info.supported_fan_speeds, fan_speed)),
+            confirm, timeout)
+
+    async def set_mode(self, mode: ACMode, confirm: bool = False,
+                       timeout: float = DEFAULT_CONFIRM_TIMEOUT) -> Optional[CommandResult]:
+        return await self._command(
+            "mode", mode, lambda: self._send_expecting("mode", mode, SetMode(self.info.number, mode)), confirm, timeout)
+
+    async def _turn_on_off(self, on: bool, confirm: bool, timeout: float) -> Optional[CommandResult]:
+        async def send() -> None:
+            # ToggleAc flips whatever the unit is doing, so compare against the state pending toggles will leave it
+            # in. A toggle is only resent once it has gone unconfirmed for the scheduler's response timeout.
+            if self.optimistic_info.active != on:
+                await self._send_expecting("active", on, ToggleAc(self.info.number))
+        return await self._command("active", on, send, confirm, timeout, verify=True)
+
+    async def _command(self, field: str, value: Any, send: Callable[[], Awaitable[None]], confirm: bool,
+                       timeout: float, verify: bool = False) -> Optional[CommandResult]:
+        """
+        Send a command that sets 'field' to 'value'. Without 'confirm' return once it is written, otherwise wait
+        for a frame showing it (resending it if it looks lost) and return the outcome.
+        With 'verify', for commands that aren't idempotent, the full state is requested before any resend.
+        """
+        if not confirm:
+            await send()
+            return None
+        return await self._pending.until_confirmed(
+            field, value, send, lambda: getattr(self.info, field) == value, timeout,
+            self._client.scheduler.response_timeout, self._client.scheduler.on_error,
+            self._request_fresh_state if verify else None)
+
+    async def _request_fresh_state(self) -> None:
+        await self._client.request_state(min_interval=0.0)
+
+    async def _send_expecting(self, field: str, value: Any, message: Serializable) -> None:
+        self._expect(field, value)
+        try:
+            await self._client.send(message, device=self.device_key)
+        except BaseException:
+            self._discard(field, value)
+            raise
+
+    def _expect(self, field: str, value: Any, timeout: float = DEFAULT_PENDING_TIMEOUT) -> None:
+        self._pending.expect(field, value, timeout)
+        self._on_optimistic_change()
+
+    def _discard(self, field: str, value: Any) -> None:
+        self._pending.discard(field, value)
+        self._on_optimistic_change()
 
-    async def set_mode(self, mode: ACMode):
-        await self._client.send(SetMode(self.info.number, mode))
+    def _on_pending_expired(self) -> None:
+        self._on_optimistic_change()
 
-    async def _turn_on_off(self, on: bool):
-        if self.info.active != on:
-            await self._client.send(ToggleAc(self.info.number))
+    def _on_optimistic_change(self) -> None:
+        old = self._optimistic_info
+        new = self._optimistic_info = self._pending.apply(self.info)
+        self._client.events.publish(StateChanged(self.device_key, old, new, changed_fields(old, new), confirmed=False))
 
     def __str__(self):
         return str(self.info)
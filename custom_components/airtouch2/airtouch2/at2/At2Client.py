@@ -1,17 +1,39 @@
 import asyncio
-from datetime import datetime
 import logging
+import warnings
+import weakref
 
+from ..common.CommandScheduler import CommandScheduler, Priority
+from ..common.FlightRecorder import DEFAULT_RECORDER_CAPACITY, Direction, FlightRecorder, FrameStatus
+from ..common.Metrics import CONFIRM_LATENCY_BUCKETS, MetricsRegistry
+from ..common.PendingLedger import CommandResult
+from ..common.EventBus import (DEFAULT_OFFLOAD_AFTER, DeviceAdded, DeviceUpdated, EventBus, LinkState, StateChanged,
+                                Topic, TopologyChanged, describe)
+from ..common.NotificationBatcher import NotificationBatcher
+from ..common.SingleFlight import SingleFlight
+from ..common.TopologyProgress import DEFAULT_TOPOLOGY_TIMEOUT, TopologyProgress
+from ..common.StageTimer import StageTimer
+from ..common.StatePoller import StatePoller
+from ..common.StateStore import Snapshot, StateStore
+from ..common.UpdateStream import DEFAULT_STREAM_BUFFER, UpdateStream
 from ..common.NetClient import NetClient
-from ..protocol.at2.constants import MessageLength
+from ..protocol.at2.constants import PORT, MessageLength
 from ..protocol.at2.messages import RequestState, SystemInfo
-from typing import Optional
+from typing import Any, Hashable, Iterable, Optional
 from .At2Aircon import At2Aircon
 from .At2Group import At2Group
-from ..common.interfaces import add_callback, Callback, Serializable, TaskCreator
+from ..common.interfaces import Callback, Serializable, TaskCreator
 
 _LOGGER = logging.getLogger(__name__)
 
+# Full state received less than this many seconds ago is fresh enough to answer request_state() without asking
+MIN_REFRESH_INTERVAL = 1.0
+STATE_REQUEST_TIMEOUT = 5.0
+# Fields that change by themselves, a change to any other field reported by the controller speeds up polling
+_MEASURED_FIELDS = frozenset({"measured_temp"})
+# Format version of export_topology(), bumped when it changes incompatibly
+TOPOLOGY_CACHE_VERSION = 1
+
 
 class At2Client:
     aircons_by_id: dict[int, At2Aircon]
@@ -19,25 +41,79 @@ class At2Client:
     system_name: str
     touchpad_temp: int
 
-    def __init__(self, host: str, dump_responses: bool = False, task_creator: TaskCreator = asyncio.create_task):
+    def __init__(self, host: str, dump_responses: Optional[bool] = None, *,
+                 recorder_capacity: int = DEFAULT_RECORDER_CAPACITY,
+                 task_creator: TaskCreator = asyncio.create_task,
+                 notify_window: float = 0.0, notify_max_latency: Optional[float] = None,
+                 offload_slow_subscribers: bool = False):
+        if dump_responses is not None:
+            # the flight recorder replaced the per-message dump files, it keeps the last frames and dumps on faults
+            warnings.warn("dump_responses is deprecated and ignored, recent frames are kept in the client's recorder",
+                          DeprecationWarning, stacklevel=2)
         self.aircons_by_id = {}
         self.groups_by_id = {}
         self.system_name: str = "UNKNOWN"
         self.touchpad_temp: int = 0
 
-        self._client = NetClient(host, 8899, self._on_connect, self._handle_one_message, task_creator)
-        self._dump_responses: bool = dump_responses
-        self._new_ac_callbacks: list[Callback] = []
-        self._new_group_callbacks: list[Callback] = []
+        # time spent in each stage of handling frames, measured while profiling
+        self.stages = StageTimer()
+        # subscribers that are repeatedly slow are moved off the decoding path if 'offload_slow_subscribers'
+        self.events = EventBus(self.stages, DEFAULT_OFFLOAD_AFTER if offload_slow_subscribers else None, task_creator)
+        # confirmed state of every device keyed by device key, subscribed first so it is current for other subscribers
+        self.state = StateStore()
+        self.events.subscribe(Topic.DEVICE_ADDED, self._store_added)
+        self.events.subscribe(Topic.STATE_CHANGED, self._store_changed)
+        self.events.subscribe(Topic.STATE_CHANGED, self._boost_on_change)
+        # device callbacks are called from batches, once per device however many changes it had in the batch
+        self.notifications = NotificationBatcher(self._publish_updated, notify_window, notify_max_latency)
+        self.events.subscribe(Topic.STATE_CHANGED, self._mark_updated)
+        self.events.subscribe(Topic.TOPOLOGY_CHANGED, self._mark_updated)
+        self._streams: weakref.WeakSet[UpdateStream] = weakref.WeakSet()
+        # the last raw frames, for diagnostics
+        self.recorder = FlightRecorder(recorder_capacity)
+        # link quality, alongside the connection's own traffic counters
+        self.metrics = MetricsRegistry()
+        self._frames_received = self.metrics.counter("frames_received", "Valid frames read from the controller")
+        self._parse_errors = self.metrics.counter("parse_errors", "Frames that could not be parsed")
+        self._confirm_latency = self.metrics.histogram("confirm_latency", CONFIRM_LATENCY_BUCKETS,
+                                                       "Seconds until a frame showed a command applied")
+        self._unconfirmed = self.metrics.counter("commands_unconfirmed", "Commands never shown applied")
+        self._client = NetClient(host, PORT, self._on_connect, self._handle_one_message, task_creator,
+                                 self._on_link_change, self.recorder, self.metrics)
+        self.scheduler = CommandScheduler(self._client.send, task_creator)
+        self.metrics.gauge("queue_depth", "Messages waiting to be sent", lambda: self.scheduler.queue_depth)
+        self.metrics.gauge("response_latency", "Smoothed seconds from a send to the next frame",
+                           lambda: self.scheduler.latency)
+        self.metrics.gauge("error_rate", "Smoothed fraction of bad or missing frames",
+                           lambda: self.scheduler.error_rate)
+        self.metrics.gauge("events_dropped", "Events dropped because offloaded subscribers fell behind",
+                           lambda: self.events.dropped)
         self._found_ac = asyncio.Event()
+        self._topology_complete = asyncio.Event()
+        self._last_frame: Optional[bytes] = None
+        # topology restored from a cache, checked against the first live frame
+        self._restored_signature: Optional[tuple] = None
+        self.topology_invalidated = False
+        self._state_request: SingleFlight[Snapshot] = SingleFlight(self._fetch_state, task_creator)
+        self._state_waiters: list[asyncio.Future[None]] = []
+        self._last_state_at: float = 0.0
+        # background work of the client and its devices is started with this, so the owner can track it
+        self.task_creator = task_creator
+        self.poller = StatePoller(self.request_state, task_creator)
 
         self.add_new_ac_callback(lambda: self._found_ac.set())
 
     async def connect(self) -> bool:
         return await self._client.connect()
 
-    def run(self) -> None:
-        self._client.run()
+    @property
+    def connected(self) -> bool:
+        return self._client.connected
+
+    def run(self, connect: bool = False) -> None:
+        """Start processing, with 'connect' the connection is made in the background rather than by connect()"""
+        self._client.run(connect)
+        self.poller.start()
 
     async def wait_for_ac(self, timeout: int = 5) -> None:
         try:
@@ -45,70 +121,251 @@ class At2Client:
         except TimeoutError:
             pass
 
+    async def wait_for_topology(self, timeout: float = DEFAULT_TOPOLOGY_TIMEOUT) -> TopologyProgress:
+        """
+        Wait until the topology is complete (every SystemInfo frame lists all ACs and groups with their names,
+        so this is the first one),
+        return as soon as it is or after 'timeout' with whatever has been discovered so far.
+        """
+        try:
+            await asyncio.wait_for(asyncio.shield(self._topology_complete.wait()), timeout)
+        except asyncio.TimeoutError:
+            _LOGGER.warning(f"Topology discovery timed out: {self.topology_progress}")
+        return self.topology_progress
+
+    @property
+    def topology_progress(self) -> TopologyProgress:
+        return TopologyProgress(len(self.aircons_by_id), len(self.aircons_by_id), len(self.groups_by_id),
+                                len(self.groups_by_id), self._topology_complete.is_set())
+
+    def export_topology(self) -> Optional[dict[str, Any]]:
+        """
+        The discovered topology and last known state as a JSON-serialisable dict for restore_topology(), None until
+        there is one. AT2 frames are small and carry the whole topology and state, so this is the last frame received.
+        """
+        if self._last_frame is None:
+            return None
+        return {"version": TOPOLOGY_CACHE_VERSION, "protocol": "at2", "frame": self._last_frame.hex()}
+
+    def restore_topology(self, data: dict[str, Any]) -> bool:
+        """
+        Create the devices from a cached export_topology() before any live frame arrives, call before run().
+        Restored devices are flagged 'restored' until a live frame updates them. If the first live frame shows
+        a different topology, 'topology_invalidated' is set and TopologyChanged is published so the cache can be
+        dropped. Return False if the cache is unusable.
+        """
+        if data.get("version") != TOPOLOGY_CACHE_VERSION or data.get("protocol") != "at2":
+            return False
+        try:
+            frame = bytes.fromhex(data["frame"])
+            system_info = SystemInfo.from_bytes(frame)
+        except (KeyError, ValueError, AssertionError) as e:
+            _LOGGER.warning(f"Ignoring unusable topology cache: {e}")
+            return False
+        self._last_frame = frame
+        self._apply_system_info(system_info)
+        for device in [*self.aircons_by_id.values(), *self.groups_by_id.values()]:
+            device.restored = True
+        self._restored_signature = _topology_signature(system_info)
+        _LOGGER.debug(f"Restored topology: {self.topology_progress}")
+        return True
+
     async def stop(self) -> None:
+        for stream in list(self._streams):
+            stream.close()
+        self.notifications.cancel()
+        await self.poller.stop()
+        await self.scheduler.stop()
         await self._client.stop()
+        self.events.close()
 
     def add_new_ac_callback(self, callback: Callback) -> Callback:
         """
         Subscribe 'callback' to new AC discoveries.
         Return a callback to unsubscribe.
         """
-        return add_callback(callback, self._new_ac_callbacks)
+        return self._subscribe_new_device("ac", callback)
 
     def add_new_group_callback(self, callback: Callback):
         """
         Subscribe 'callback' to new group discoveries.
         Return a callback to unsubscribe.
         """
-        return add_callback(callback, self._new_group_callbacks)
+        return self._subscribe_new_device("group", callback)
 
-    async def send(self, msg: Serializable):
-        await self._client.send(msg)
+    def _subscribe_new_device(self, kind: str, callback: Callback) -> Callback:
+        def on_device_added(event: DeviceAdded) -> None:
+            if event.device[0] == kind:
+                callback()
+        return self.events.subscribe(Topic.DEVICE_ADDED, on_device_added, name=describe(callback))
+
+    def updates(self, topics: Optional[Iterable[Topic]] = None, devices: Optional[Iterable[Hashable]] = None,
+                fields: Optional[Iterable[str]] = None, maxsize: int = DEFAULT_STREAM_BUFFER) -> UpdateStream:
+        """
+        Stream of events for 'async for', optionally only those of 'topics', about 'devices' (device keys such as
+        ("ac", 0)) or, for state changes, touching 'fields'. A consumer that falls behind gets the newest event per
+        device and topic rather than a growing backlog. The stream ends when closed or when the client is stopped.
+        """
+        stream = UpdateStream(self.events, topics, devices, fields, maxsize)
+        self._streams.add(stream)
+        return stream
+
+    def republish_state(self) -> None:
+        """
+        Publish the current state of every device again, e.g. so subscribers refresh after a reconnect. Not confirmed,
+        since nothing was received from the controller.
+        """
+        for device in [*self.aircons_by_id.values(), *self.groups_by_id.values()]:
+            self.events.publish(StateChanged(device.device_key, device.info, device.info, frozenset(), confirmed=False))
+
+    async def request_state(self, min_interval: float = MIN_REFRESH_INTERVAL) -> Snapshot:
+        """
+        Ask the controller for its full state and return the resulting snapshot of the state store.
+        Concurrent callers share one outstanding request, and if the full state arrived less than 'min_interval'
+        seconds ago the current snapshot is returned without asking again.
+        Raise TimeoutError if the controller doesn't reply within STATE_REQUEST_TIMEOUT.
+        """
+        if asyncio.get_running_loop().time() - self._last_state_at < min_interval:
+            return self.state.snapshot()
+        return await self._state_request.run()
+
+    async def send(self, msg: Serializable, priority: Priority = Priority.USER, device: Optional[Hashable] = None):
+        """Queue 'msg' on the scheduler and wait until it has been written"""
+        if priority == Priority.USER:
+            self.poller.boost()
+        await self.scheduler.submit(msg, priority, device)
+
+    def record_command_result(self, result: CommandResult) -> None:
+        """Count the outcome of a command sent with confirm=True, called by the devices"""
+        if result.latency is not None:
+            self._confirm_latency.observe(result.latency)
+        else:
+            self._unconfirmed.inc()
+
+    def _store_added(self, event: DeviceAdded) -> None:
+        self.state.put(event.device, event.obj.info)
+
+    def _boost_on_change(self, event: StateChanged) -> None:
+        if event.confirmed and event.changed - _MEASURED_FIELDS:
+            self.poller.boost()
+
+    def _store_changed(self, event: StateChanged) -> None:
+        if event.confirmed and event.changed:
+            self.state.put(event.device, event.new)
+
+    def _mark_updated(self, event: StateChanged | TopologyChanged) -> None:
+        if event.device is not None:
+            self.notifications.mark(event.device)
+
+    def _publish_updated(self, devices: list[Hashable]) -> None:
+        for device in devices:
+            self.events.publish(DeviceUpdated(device))
+
+    def _on_link_change(self, connected: bool) -> None:
+        self.events.publish(LinkState(None, connected))
+
+    async def _fetch_state(self) -> Snapshot:
+        loop = asyncio.get_running_loop()
+        received: asyncio.Future[None] = loop.create_future()
+        self._state_waiters.append(received)
+        try:
+            await self.send(RequestState(), Priority.BACKGROUND)
+            # a frame the controller pushed while the request was queued isn't the reply
+            sent_at = None if received.done() else loop.time()
+            await asyncio.wait_for(received, STATE_REQUEST_TIMEOUT)
+            if sent_at is not None:
+                self.scheduler.record_latency(loop.time() - sent_at)
+        finally:
+            if received in self._state_waiters:
+                self._state_waiters.remove(received)
+        return self.state.snapshot()
 
     async def _on_connect(self):
+        # bypasses the scheduler, this runs inside reconnects triggered by the scheduler's own sends
         await self._client.send(RequestState())
 
     async def _read_response(self) -> Optional[SystemInfo]:
         _LOGGER.debug("Waiting for response")
-        resp = await self._client.read_bytes(MessageLength.RESPONSE)
+        with self.stages.stage("read"):
+            resp = await self._client.read_bytes(MessageLength.RESPONSE)
         _LOGGER.debug("Got response")
         if not resp:
+            # disconnected, counted by the net client as a connection loss. AT2 frames are a fixed length
+            # read from the start of the connection, so there are no frame boundaries to search for
             return None
 
-        if self._dump_responses:
-            # blocks but is only used for dev and debugging
-            with open('response_' + datetime.now().strftime("%m-%d-%Y_%H-%M-%S") + '.dump', 'wb') as f:
-                f.write(resp)
-
-        return SystemInfo.from_bytes(resp)
+        self.recorder.record(resp, Direction.RX)
+        try:
+            with self.stages.stage("parse"):
+                system_info = SystemInfo.from_bytes(resp)
+        except (AssertionError, ValueError, IndexError) as e:
+            _LOGGER.warning(f"Could not parse response: {e}")
+            self.recorder.mark(FrameStatus.PARSE_ERROR)
+            self._parse_errors.inc()
+            return None
+        self._frames_received.inc()
+        self._last_frame = resp
+        return system_info
 
     async def _handle_one_message(self) -> None:
         system_info = await self._read_response()
         if not system_info:
             # something went wrong
             _LOGGER.info("Reading response message failed")
+            self.scheduler.on_error()
             return
+        self.scheduler.on_response()
 
         _LOGGER.debug(f"SystemInfo: {system_info}")
-        
+
+        if self._restored_signature is not None:
+            if _topology_signature(system_info) != self._restored_signature:
+                _LOGGER.info("Controller topology differs from the cached one")
+                self.topology_invalidated = True
+                self.events.publish(TopologyChanged(None))
+            self._restored_signature = None
+
+        with self.stages.stage("dispatch"):
+            self._apply_system_info(system_info)
+
+        # every SystemInfo is the full state, whether requested or pushed
+        self._last_state_at = asyncio.get_running_loop().time()
+        for waiter in self._state_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._state_waiters.clear()
+
+    def _apply_system_info(self, system_info: SystemInfo) -> None:
         # System-wide
         self.system_name = system_info.system_name
         self.touchpad_temp = system_info.touchpad_temp
         
+        added = False
         # ACs
         for id, ac_info in system_info.aircons_by_id.items():
             if id not in self.aircons_by_id:
-                self.aircons_by_id[id] = At2Aircon(self, ac_info)
-                for callback in self._new_ac_callbacks:
-                    callback()
+                ac = self.aircons_by_id[id] = At2Aircon(self, ac_info)
+                self.events.publish(DeviceAdded(ac.device_key, ac))
+                added = True
             else:
                 self.aircons_by_id[id].update(ac_info)
 
         # Groups
         for id, group_info in system_info.groups_by_id.items():
             if id not in self.groups_by_id:
-                self.groups_by_id[id] = At2Group(self, group_info)
-                for callback in self._new_group_callbacks:
-                    callback()
+                group = self.groups_by_id[id] = At2Group(self, group_info)
+                self.events.publish(DeviceAdded(group.device_key, group))
+                added = True
             else:
                 self.groups_by_id[id].update(group_info)
+
+        if added:
+            self.events.publish(TopologyChanged(None))
+        self._topology_complete.set()
+
+
+def _topology_signature(system_info: SystemInfo) -> tuple:
+    """The parts of a SystemInfo that make up the topology, for checking a cached one"""
+    return (tuple((ac.number, ac.name, ac.brand, ac.supported_fan_speeds.mask)
+                  for ac in system_info.aircons_by_id.values()),
+            tuple((group.number, group.name) for group in system_info.groups_by_id.values()))
@@ -1,55 +1,153 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING
+import asyncio
+from typing import TYPE_CHECKING, Any, Optional
 from ..protocol.at2.messages.SystemInfo import GroupInfo
 from ..protocol.at2.messages import ChangeDamper, ToggleGroup
-from ..common.interfaces import Publisher, Callback, add_callback
+from ..common.Coalescer import Coalescer
+from ..common.PendingLedger import DEFAULT_CONFIRM_TIMEOUT, DEFAULT_PENDING_TIMEOUT, CommandResult, PendingLedger
+from ..common.EventBus import StateChanged, Topic, changed_fields, describe
+from ..common.interfaces import Publisher, Callback, Serializable
+from .StepConverger import DEFAULT_CONVERGE_TIMEOUT, StepConverger
 if TYPE_CHECKING:
     from .At2Client import At2Client
 
 
 class At2Group(Publisher):
+    """
+    A single AT2 group.
+
+    'info' is the state last reported by the controller, 'optimistic_info' is that state with the effect of commands
+    that have been sent but not yet confirmed applied over it. Callbacks are called when either changes.
+    """
     info: GroupInfo
 
     def __init__(self, client: At2Client, info: GroupInfo):
         self.info = info
+        # True while 'info' comes from a topology cache rather than the controller
+        self.restored = False
+        self._pending: PendingLedger[GroupInfo] = PendingLedger(self._on_pending_expired, client.record_command_result)
+        self._optimistic_info: GroupInfo = info
 
         self._client = client
-        self._callbacks: list[Callback] = []
+        self._damp_converger = StepConverger(
+            f"Group {info.number} damper", lambda: self.info.damp, self.inc_dec_damp, client.scheduler.on_error)
+        self._damp_coalescer: Coalescer[int] = Coalescer(
+            lambda: self.info.damp, lambda: self._damp_converger.converge(lambda: self._damp_coalescer.target),
+            client.task_creator)
+
+    @property
+    def optimistic_info(self) -> GroupInfo:
+        return self._optimistic_info
+
+    @property
+    def pending(self) -> bool:
+        """True while commands sent to the device are not yet confirmed by the controller"""
+        return bool(self._pending)
 
     def update(self, status: GroupInfo):
+        old = self.info
         self.info = status
-
-        for func in self._callbacks:
-            func()
+        self.restored = False
+        self._pending.confirm(status)
+        self._optimistic_info = self._pending.apply(status)
+        self._damp_converger.notify()
+        self._client.events.publish(StateChanged(self.device_key, old, status, changed_fields(old, status)))
 
     def add_callback(self, callback: Callback) -> Callback:
-        return add_callback(callback, self._callbacks)
+        return self._client.events.subscribe(Topic.DEVICE_UPDATED, lambda _event: callback(), self.device_key,
+                                             name=describe(callback))
+
+    @property
+    def device_key(self) -> tuple[str, int]:
+        return ("group", self.info.number)
 
     async def inc_dec_damp(self, inc: bool):
-        await self._client.send(ChangeDamper(self.info.number, inc))
+        await self._client.send(ChangeDamper(self.info.number, inc), device=self.device_key)
 
-    async def set_damp(self, new_damp: int):
+    async def set_damp(self, new_damp: int, confirm: bool = False,
+                       timeout: float = DEFAULT_CONVERGE_TIMEOUT) -> bool | CommandResult:
+        """
+        Set the damper to 'new_damp' (0-10), return True once the controller reports it.
+        Calls made while a change is in flight retarget it rather than queueing more steps.
+        With 'confirm', return a CommandResult that also carries how long it took.
+        """
         if new_damp < 0 or new_damp > 10:
             raise ValueError("Dampers can only be set from 0 to 10")
+        loop = asyncio.get_running_loop()
+        started = loop.time()
         # Set to 0 is equivalent to turning off
         if new_damp == 0:
-            await self.turn_off()
-        else:
-            await self.turn_on()
-            damp_diff = new_damp - self.info.damp
-            inc = damp_diff > 0
-            for i in range(abs(damp_diff)):
-                await self.inc_dec_damp(inc)
-
-    async def _turn_on_off(self, on: bool):
-        if self.info.active != on:
-            await self._client.send(ToggleGroup(self.info.number))
-
-    async def turn_off(self):
-        await self._turn_on_off(False)
-
-    async def turn_on(self):
-        await self._turn_on_off(True)
+            off = await self.turn_off(confirm, timeout)
+            return off if off is not None else True
+        on = await self.turn_on(confirm, timeout)
+        if on is not None and not on:
+            return on
+        if not self._damp_coalescer.accepts(new_damp):
+            # already there, nothing is sent so there is nothing to expect
+            return CommandResult(True, loop.time() - started, on.attempts) if on is not None else True
+        self._expect("damp", new_damp, DEFAULT_CONVERGE_TIMEOUT)
+        damp_started = loop.time()
+        try:
+            reached = await asyncio.wait_for(
+                asyncio.shield(self._damp_coalescer.set(new_damp)), max(started + timeout - loop.time(), 0))
+        except asyncio.TimeoutError:
+            reached = False
+        if not reached:
+            self._discard("damp", new_damp)
+        if not confirm:
+            return reached
+        # the turn on recorded its own result, only the damper step is recorded here
+        self._client.record_command_result(CommandResult(reached, loop.time() - damp_started if reached else None, 1))
+        return CommandResult(reached, loop.time() - started if reached else None, 1 + (on.attempts if on else 0))
+
+    async def _turn_on_off(self, on: bool, confirm: bool, timeout: float) -> Optional[CommandResult]:
+        async def send() -> None:
+            # ToggleGroup flips whatever the group is doing, so compare against the state pending toggles will leave
+            # it in. A toggle is only resent once it has gone unconfirmed for the scheduler's response timeout.
+            if self.optimistic_info.active != on:
+                await self._send_expecting("active", on, ToggleGroup(self.info.number))
+        if not confirm:
+            await send()
+            return None
+        return await self._pending.until_confirmed(
+            "active", on, send, lambda: self.info.active == on, timeout,
+            self._client.scheduler.response_timeout, self._client.scheduler.on_error, self._request_fresh_state)
+
+    async def _request_fresh_state(self) -> None:
+        # ToggleGroup isn't idempotent, so before resending it check it really wasn't applied
+        await self._client.request_state(min_interval=0.0)
+
+    async def _send_expecting(self, field: str, value: Any, message: Serializable) -> None:
+        self._expect(field, value)
+        try:
+            await self._client.send(message, device=self.device_key)
+        except BaseException:
+            self._discard(field, value)
+            raise
+
+    def _expect(self, field: str, value: Any, timeout: float = DEFAULT_PENDING_TIMEOUT) -> None:
+        self._pending.expect(field, value, timeout)
+        self._on_optimistic_change()
+
+    def _discard(self, field: str, value: Any) -> None:
+        self._pending.discard(field, value)
+        self._on_optimistic_change()
+
+    def _on_pending_expired(self) -> None:
+        self._on_optimistic_change()
+
+    def _on_optimistic_change(self) -> None:
+        old = self._optimistic_info
+        new = self._optimistic_info = self._pending.apply(self.info)
+        self._client.events.publish(StateChanged(self.device_key, old, new, changed_fields(old, new), confirmed=False))
+
+    async def turn_off(self, confirm: bool = False,
+                       timeout: float = DEFAULT_CONFIRM_TIMEOUT) -> Optional[CommandResult]:
+        return await self._turn_on_off(False, confirm, timeout)
+
+    async def turn_on(self, confirm: bool = False,
+                      timeout: float = DEFAULT_CONFIRM_TIMEOUT) -> Optional[CommandResult]:
+        return await self._turn_on_off(True, confirm, timeout)
 
     def __str__(self):
         return str(self.info)
@@ -0,0 +1,109 @@
+from __future__ import annotations
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+# Steps sent back to back before waiting to see them reflected in incoming frames
+MAX_PIPELINED_STEPS = 4
+# Bounds on how long to wait for the next frame before treating the rest of a burst as lost
+MIN_SETTLE_TIMEOUT = 0.5
+MAX_SETTLE_TIMEOUT = 3.0
+# Bursts in a row that can produce no movement at all before giving up (e.g. target is beyond the unit's limits)
+MAX_STALLED_BURSTS = 2
+DEFAULT_CONVERGE_TIMEOUT = 20.0
+
+
+class StepConverger:
+    """
+    Closed-loop driver for a value that can only be changed one step at a time (AT2 set temperature and damper).
+
+    Steps are sent in bursts without waiting for a response to each one, pacing is left to the client's
+    CommandScheduler. After each burst the value reported by incoming SystemInfo frames decides what to send next,
+    which corrects overshoot and lost steps. Lost steps are reported through 'on_lost' so the pacing can back off.
+    """
+
+    def __init__(self, name: str, read: Callable[[], int], step: Callable[[bool], Awaitable[None]],
+                 on_lost: Optional[Callable[[], None]] = None):
+        self._name = name
+        self._read = read
+        self._step = step
+        self._on_lost = on_lost
+        self._updated = asyncio.Event()
+        self._last_frame_at: float = 0.0
+
+        # smoothed time from sending a burst to the first frame that follows it
+        self.response_latency: float | None = None
+
+    def notify(self) -> None:
+        """Called by the owning device whenever a new frame for it has been received"""
+        self._last_frame_at = asyncio.get_running_loop().time()
+        self._updated.set()
+
+    async def converge(self, target: Callable[[], int], timeout: float = DEFAULT_CONVERGE_TIMEOUT) -> bool:
+        """
+        Step towards target() until a frame confirms it, return False if it could not be reached in 'timeout'.
+        target() is re-read before every step, so the target can be moved while steps are in flight.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        stalled = 0
+        while True:
+            current = self._read()
+            diff = target() - current
+            if diff == 0:
+                return True
+            if loop.time() >= deadline or stalled >= MAX_STALLED_BURSTS:
+                _LOGGER.warning(f"{self._name} did not reach {target()}, controller reports {current}")
+                return False
+
+            inc = diff > 0
+            self._updated.clear()
+            sent_at = loop.time()
+            sent = 0
+            # stop the burst early if the target was moved back towards the current value meanwhile
+            while sent < MAX_PIPELINED_STEPS and (target() - current if inc else current - target()) > sent:
+                await self._step(inc)
+                sent += 1
+
+            expected = current + sent if inc else current - sent
+            if not await self._settle(inc, expected, sent_at, deadline):
+                _LOGGER.debug(f"{self._name}: steps were lost, controller reports {self._read()}")
+                if self._on_lost:
+                    self._on_lost()
+            stalled = 0 if self._read() != current else stalled + 1
+
+    async def _settle(self, inc: bool, expected: int, sent_at: float, deadline: float) -> bool:
+        """Wait for frames until the burst is reflected, return False if the controller went quiet first"""
+        loop = asyncio.get_running_loop()
+        measured = False
+        while not self._reached(inc, expected):
+            wait = min(self._settle_timeout(), deadline - loop.time())
+            if wait <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._updated.wait(), wait)
+            except asyncio.TimeoutError:
+                return False
+            self._updated.clear()
+            if not measured:
+                self._record_latency(self._last_frame_at - sent_at)
+                measured = True
+        return True
+
+    def _reached(self, inc: bool, expected: int) -> bool:
+        # going past 'expected' counts too, the next burst corrects the overshoot
+        value = self._read()
+        return value >= expected if inc else value <= expected
+
+    def _record_latency(self, sample: float) -> None:
+        if self.response_latency is None:
+            self.response_latency = sample
+        else:
+            self.response_latency += 0.25 * (sample - self.response_latency)
+
+    def _settle_timeout(self) -> float:
+        if self.response_latency is None:
+            return MAX_SETTLE_TIMEOUT
+        return min(max(3 * self.response_latency, MIN_SETTLE_TIMEOUT), MAX_SETTLE_TIMEOUT)
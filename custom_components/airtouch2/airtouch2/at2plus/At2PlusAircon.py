@@ -1,15 +1,25 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Callable, Optional
 from ..protocol.at2plus.messages.AcControl import AcControlMessage, AcSettings
+from ..common.Coalescer import Coalescer
+from ..common.EventBus import StateChanged, Topic, TopologyChanged, changed_fields, describe
+from ..common.PendingLedger import DEFAULT_CONFIRM_TIMEOUT, CommandResult, PendingLedger
 from ..common.interfaces import Callback
 if TYPE_CHECKING:
     from .At2PlusClient import At2PlusClient
 from asyncio import Event
-from ..protocol.at2plus.enums import AcFanSpeed, AcPower, AcSetMode, AcSetPower
+from ..protocol.at2plus.enums import AcFanSpeed, AcMode, AcPower, AcSetMode, AcSetPower
 from ..protocol.at2plus.messages.AcAbilityMessage import AcAbility
 from ..protocol.at2plus.messages.AcStatus import AcStatus
 
 
+# reported values that confirm a (field, value) command other than the value itself,
+# e.g. in auto mode the unit reports which way it is going
+_ACCEPTS: dict[tuple[str, Any], Callable[[Any], bool]] = {
+    ("mode", AcMode.AUTO): lambda mode: mode in (AcMode.AUTO, AcMode.AUTO_HEAT, AcMode.AUTO_COOL),
+}
+
+
 class At2PlusAircon:
     """
     A class that represents a single airtouch2+ AC unit.
@@ -17,6 +27,8 @@ class At2PlusAircon:
     An At2PlusAircon is not 'ready' until it's AcAbility has been retrieved.
 
     While unready, mode and fan speed setter calls cannot be made as the unit's supported modes are unknown.
+
+    Setters called with 'confirm' wait for a status frame showing the change and return a CommandResult.
     """
 
     def __init__(self, status: AcStatus, client: At2PlusClient):
@@ -24,53 +36,105 @@ class At2PlusAircon:
         self.ability: AcAbility | None = None
         self._ready: Event = Event()
         self._client: At2PlusClient = client
-        self._callbacks: list[Callback] = []
+        # True while 'status' comes from a topology cache rather than the controller
+        self.restored = False
+        self._pending: PendingLedger[AcStatus] = PendingLedger(on_result=client.record_command_result)
+        self._setpoint_coalescer: Coalescer[float] = Coalescer(
+            lambda: self.status.set_point, self._send_setpoint, client.task_creator)
+
+    @property
+    def device_key(self) -> tuple[str, int]:
+        return ("ac", self.status.id)
+
+    @property
+    def pending(self) -> bool:
+        """True while commands sent to the device are not yet confirmed by the controller"""
+        return bool(self._pending)
+
+    def _settings(self, power: AcSetPower = AcSetPower.UNCHANGED, mode: AcSetMode = AcSetMode.UNCHANGED,
+                  speed: AcFanSpeed = AcFanSpeed.UNCHANGED, setpoint: float | None = None) -> AcControlMessage:
+        return AcControlMessage([AcSettings(self.status.id, power, mode, speed, setpoint)])
 
     async def _set_power(self, power: AcSetPower):
-        settings = AcSettings(self.status.id, power, AcSetMode.UNCHANGED, AcFanSpeed.UNCHANGED, None)
-        await self._client.send(AcControlMessage([settings]))
+        await self._client.send(self._settings(power=power), device=self.device_key)
 
     async def toggle(self):
         await self._set_power(AcSetPower.TOGGLE)
 
-    async def turn_on(self):
-        await self._set_power(AcSetPower.ON)
+    async def turn_on(self, confirm: bool = False,
+                      timeout: float = DEFAULT_CONFIRM_TIMEOUT) -> Optional[CommandResult]:
+        return await self._command("power", AcPower.ON, self._settings(power=AcSetPower.ON), confirm, timeout)
 
-    async def turn_off(self):
-        await self._set_power(AcSetPower.OFF)
+    async def turn_off(self, confirm: bool = False,
+                       timeout: float = DEFAULT_CONFIRM_TIMEOUT) -> Optional[CommandResult]:
+        return await self._command("power", AcPower.OFF, self._settings(power=AcSetPower.OFF), confirm, timeout)
 
     def is_on(self) -> bool:
         return self.status.power == AcPower.ON
 
-    async def set_mode(self, mode: AcSetMode):
-        settings = AcSettings(self.status.id, AcSetPower.UNCHANGED, mode, AcFanSpeed.UNCHANGED, None)
-        await self._client.send(AcControlMessage([settings]))
-
-    async def set_fan_speed(self, speed: AcFanSpeed):
-        settings = AcSettings(self.status.id, AcSetPower.UNCHANGED, AcSetMode.UNCHANGED, speed, None)
-        await self._client.send(AcControlMessage([settings]))
-
-    async def set_setpoint(self, setpoint: float):
-        settings = AcSettings(self.status.id, AcSetPower.UNCHANGED, AcSetMode.UNCHANGED, AcFanSpeed.UNCHANGED, setpoint)
-        await self._client.send(AcControlMessage([settings]))
+    async def set_mode(self, mode: AcSetMode, confirm: bool = False,
+                       timeout: float = DEFAULT_CONFIRM_TIMEOUT) -> Optional[CommandResult]:
+        return await self._command("mode", AcMode(mode), self._settings(mode=mode), confirm, timeout)
+
+    async def set_fan_speed(self, speed: AcFanSpeed, confirm: bool = False,
+                            timeout: float = DEFAULT_CONFIRM_TIMEOUT) -> Optional[CommandResult]:
+        return await self._command("fan_speed", speed, self._settings(speed=speed), confirm, timeout)
+
+    async def set_setpoint(self, setpoint: float, confirm: bool = False,
+                           timeout: float = DEFAULT_CONFIRM_TIMEOUT) -> Optional[CommandResult]:
+        """Calls made while a setpoint change is being sent are coalesced, only the newest one is sent after it"""
+        if not confirm:
+            await self._setpoint_coalescer.set(setpoint)
+            return None
+        return await self._pending.until_confirmed(
+            "set_point", setpoint, lambda: self._setpoint_coalescer.set(setpoint),
+            lambda: self.status.set_point == setpoint, timeout,
+            self._client.scheduler.response_timeout, self._client.scheduler.on_error)
+
+    async def _send_setpoint(self) -> bool:
+        target = self._setpoint_coalescer.target
+        await self._send_expecting("set_point", target, self._settings(setpoint=target))
+        return True
+
+    async def _command(self, field: str, value: Any, message: AcControlMessage, confirm: bool,
+                       timeout: float) -> Optional[CommandResult]:
+        """
+        Send a command that sets 'field' of the status to 'value'. Without 'confirm' return once it is written,
+        otherwise wait for a status frame showing it (resending it if it looks lost) and return the outcome.
+        """
+        if not confirm:
+            await self._send_expecting(field, value, message)
+            return None
+        accept = _ACCEPTS.get((field, value))
+        return await self._pending.until_confirmed(
+            field, value, lambda: self._send_expecting(field, value, message),
+            lambda: accept(getattr(self.status, field)) if accept else getattr(self.status, field) == value, timeout,
+            self._client.scheduler.response_timeout, self._client.scheduler.on_error)
+
+    async def _send_expecting(self, field: str, value: Any, message: AcControlMessage) -> None:
+        self._pending.expect(field, value, accept=_ACCEPTS.get((field, value)))
+        try:
+            await self._client.send(message, device=self.device_key)
+        except BaseException:
+            self._pending.discard(field, value)
+            raise
 
     async def wait_until_ready(self) -> None:
         await self._ready.wait()
 
     def add_callback(self, callback: Callback) -> Callback:
-        self._callbacks.append(callback)
-
-        def remove_callback() -> None:
-            if callback in self._callbacks:
-                self._callbacks.remove(callback)
-
-        return remove_callback
+        """Call 'callback' when the status, ability or name of this device changes"""
+        return self._client.events.subscribe(Topic.DEVICE_UPDATED, lambda _event: callback(), self.device_key,
+                                             name=describe(callback))
 
     def _update_status(self, status: AcStatus):
+        old = self.status
         self.status = status
-        for callback in self._callbacks:
-            callback()
+        self.restored = False
+        self._pending.confirm(status)
+        self._client.events.publish(StateChanged(self.device_key, old, status, changed_fields(old, status)))
 
     def _set_ability(self, ability: AcAbility):
         self.ability = ability
         self._ready.set()
+        self._client.events.publish(TopologyChanged(self.device_key))
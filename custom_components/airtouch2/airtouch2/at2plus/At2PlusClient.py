@@ -1,91 +1,329 @@
 import asyncio
-from datetime import datetime
 import logging
+import warnings
+from typing import Any, Hashable, Iterable, Optional
+import weakref
 
 from .At2PlusAircon import At2PlusAircon
 from .At2PlusGroup import At2PlusGroup
+from ..common.CommandScheduler import CommandScheduler, Priority
+from ..common.FlightRecorder import DEFAULT_RECORDER_CAPACITY, Direction, FlightRecorder, FrameStatus
+from ..common.Metrics import CONFIRM_LATENCY_BUCKETS, MetricsRegistry
+from ..common.PendingLedger import CommandResult
+from ..common.EventBus import (DEFAULT_OFFLOAD_AFTER, DeviceAdded, DeviceUpdated, EventBus, LinkState, StateChanged,
+                                Topic, TopologyChanged, describe)
+from ..common.NotificationBatcher import NotificationBatcher
+from ..common.SingleFlight import SingleFlight
+from ..common.TopologyProgress import DEFAULT_TOPOLOGY_TIMEOUT, TopologyProgress
+from ..common.StageTimer import StageTimer
+from ..common.StatePoller import StatePoller
+from ..common.StateStore import Snapshot, StateStore
+from ..common.UpdateStream import DEFAULT_STREAM_BUFFER, UpdateStream
 from ..common.NetClient import NetClient
 from ..protocol.at2plus.control_status_common import ControlStatusSubHeader, ControlStatusSubType
 from ..protocol.at2plus.extended_common import ExtendedMessageSubType, ExtendedSubHeader
 from ..protocol.at2plus.message_common import HEADER_LENGTH, HEADER_MAGIC, Header, Message, MessageType
 from ..protocol.at2plus.messages.AcAbilityMessage import AcAbility, AcAbilityMessage, RequestAcAbilityMessage
-from ..protocol.at2plus.messages.AcStatus import AcStatusMessage
+from ..protocol.at2plus.messages.AcStatus import AcStatus, AcStatusMessage
 from ..common.Buffer import Buffer
+from ..protocol.at2plus.constants import PORT
 from ..protocol.at2plus.crc16_modbus import crc16
 from ..common.interfaces import Callback, Serializable, TaskCreator
 from ..protocol.at2plus.messages.GroupNames import RequestGroupNamesMessage, group_names_from_subdata
-from ..protocol.at2plus.messages.GroupStatus import GroupStatusMessage
+from ..protocol.at2plus.messages.GroupStatus import GroupStatus, GroupStatusMessage
 
 _LOGGER = logging.getLogger(__name__)
 
+# Full state received less than this many seconds ago is fresh enough to answer request_state() without asking
+MIN_REFRESH_INTERVAL = 1.0
+STATE_REQUEST_TIMEOUT = 5.0
+# Fields that change by themselves, a change to any other field reported by the controller speeds up polling
+_MEASURED_FIELDS = frozenset({"temperature"})
+# Format version of export_topology(), bumped when it changes incompatibly
+TOPOLOGY_CACHE_VERSION = 1
+
 
 class At2PlusClient:
-    def __init__(self, host: str, dump_responses: bool = False, task_creator: TaskCreator = asyncio.create_task):
+    def __init__(self, host: str, dump_responses: Optional[bool] = None, *,
+                 recorder_capacity: int = DEFAULT_RECORDER_CAPACITY,
+                 task_creator: TaskCreator = asyncio.create_task,
+                 notify_window: float = 0.0, notify_max_latency: Optional[float] = None,
+                 offload_slow_subscribers: bool = False):
+        if dump_responses is not None:
+            # the flight recorder replaced the per-message dump files, it keeps the last frames and dumps on faults
+            warnings.warn("dump_responses is deprecated and ignored, recent frames are kept in the client's recorder",
+                          DeprecationWarning, stacklevel=2)
         # public
         self.aircons_by_id: dict[int, At2PlusAircon] = {}
         self.groups_by_id: dict[int, At2PlusGroup] = {}
 
+        # time spent in each stage of handling frames, measured while profiling
+        self.stages = StageTimer()
+        # subscribers that are repeatedly slow are moved off the decoding path if 'offload_slow_subscribers'
+        self.events = EventBus(self.stages, DEFAULT_OFFLOAD_AFTER if offload_slow_subscribers else None, task_creator)
+        # confirmed state of every device keyed by device key, subscribed first so it is current for other subscribers
+        self.state = StateStore()
+        self.events.subscribe(Topic.DEVICE_ADDED, self._store_added)
+        self.events.subscribe(Topic.STATE_CHANGED, self._store_changed)
+        self.events.subscribe(Topic.STATE_CHANGED, self._boost_on_change)
+        # device callbacks are called from batches, once per device however many changes it had in the batch
+        self.notifications = NotificationBatcher(self._publish_updated, notify_window, notify_max_latency)
+        self.events.subscribe(Topic.STATE_CHANGED, self._mark_updated)
+        self.events.subscribe(Topic.TOPOLOGY_CHANGED, self._mark_updated)
+        self._streams: weakref.WeakSet[UpdateStream] = weakref.WeakSet()
+
         # private
-        self._client = NetClient(host, 9200, self._on_connect, self.handle_one_message, task_creator)
-        self._dump_responses = dump_responses
-        self._task_creator = task_creator
-        self._new_ac_callbacks: list[Callback] = []
+        # the last raw frames, for diagnostics
+        self.recorder = FlightRecorder(recorder_capacity)
+        # link quality, alongside the connection's own traffic counters
+        self.metrics = MetricsRegistry()
+        self._frames_received = self.metrics.counter("frames_received", "Valid frames read from the controller")
+        self._parse_errors = self.metrics.counter("parse_errors", "Frames that could not be parsed")
+        self._resyncs = self.metrics.counter("resyncs", "Times the frame boundaries were lost and searched for")
+        self._confirm_latency = self.metrics.histogram("confirm_latency", CONFIRM_LATENCY_BUCKETS,
+                                                       "Seconds until a frame showed a command applied")
+        self._unconfirmed = self.metrics.counter("commands_unconfirmed", "Commands never shown applied")
+        self._checksum_failures = self.metrics.counter("checksum_failures", "Frames that failed their checksum")
+        self._client = NetClient(host, PORT, self._on_connect, self.handle_one_message, task_creator,
+                                 self._on_link_change, self.recorder, self.metrics)
+        self.scheduler = CommandScheduler(self._client.send, task_creator)
+        self.metrics.gauge("queue_depth", "Messages waiting to be sent", lambda: self.scheduler.queue_depth)
+        self.metrics.gauge("response_latency", "Smoothed seconds from a send to the next frame",
+                           lambda: self.scheduler.latency)
+        self.metrics.gauge("error_rate", "Smoothed fraction of bad or missing frames",
+                           lambda: self.scheduler.error_rate)
+        self.metrics.gauge("events_dropped", "Events dropped because offloaded subscribers fell behind",
+                           lambda: self.events.dropped)
+        # background work of the client and its devices is started with this, so the owner can track it
+        self.task_creator = task_creator
         self._ability_message_queue: asyncio.Queue[AcAbilityMessage] = asyncio.Queue()
         self._found_ac = asyncio.Event()
-        self._new_group_callbacks: list[Callback] = []
+        self._topology_complete = asyncio.Event()
+        self._names_received = False
+        self._names_updated = asyncio.Event()
+        # one ability request/response pair at a time, responses don't say which request they answer
+        self._ability_lock = asyncio.Lock()
+        self._restored = False
+        self.topology_invalidated = False
+        self._state_request: SingleFlight[Snapshot] = SingleFlight(self._fetch_state, task_creator)
+        # waiters for the next AC status and group status messages, which together make up the full state
+        self._status_waiters: dict[str, list[asyncio.Future[None]]] = {"ac": [], "group": []}
+        self._last_status_at: dict[str, float] = {"ac": 0.0, "group": 0.0}
+        self.poller = StatePoller(self.request_state, task_creator)
 
         self.add_new_ac_callback(lambda: self._found_ac.set())
 
     async def connect(self) -> bool:
         return await self._client.connect()
 
-    def run(self) -> None:
-        self._client.run()
+    @property
+    def connected(self) -> bool:
+        return self._client.connected
+
+    def run(self, connect: bool = False) -> None:
+        """Start processing, with 'connect' the connection is made in the background rather than by connect()"""
+        self._client.run(connect)
+        self.poller.start()
+        if self._restored:
+            self.task_creator(self._revalidate_topology())
 
     async def wait_for_ac(self, timeout: int = 5) -> None:
         await asyncio.wait_for(self._found_ac.wait(), timeout)
 
+    async def wait_for_topology(self, timeout: float = DEFAULT_TOPOLOGY_TIMEOUT) -> TopologyProgress:
+        """
+        Wait until the topology is complete (all ACs and groups listed, every AC's ability fetched and the group names
+        received),
+        return as soon as it is or after 'timeout' with whatever has been discovered so far.
+        """
+        try:
+            await asyncio.wait_for(asyncio.shield(self._topology_complete.wait()), timeout)
+        except asyncio.TimeoutError:
+            _LOGGER.warning(f"Topology discovery timed out: {self.topology_progress}")
+        return self.topology_progress
+
+    @property
+    def topology_progress(self) -> TopologyProgress:
+        return TopologyProgress(
+            len(self.aircons_by_id), sum(1 for ac in self.aircons_by_id.values() if ac.ability is not None),
+            len(self.groups_by_id), sum(1 for group in self.groups_by_id.values() if group.name is not None),
+            self._topology_complete.is_set())
+
+    def _check_topology(self) -> None:
+        if self._topology_complete.is_set():
+            return
+        listed = all(self._last_status_at.values())
+        abilities = all(ac.ability is not None for ac in self.aircons_by_id.values())
+        if listed and abilities and (self._names_received or not self.groups_by_id):
+            _LOGGER.debug(f"Topology complete: {self.topology_progress}")
+            self._topology_complete.set()
+
+    def export_topology(self) -> Optional[dict[str, Any]]:
+        """
+        The discovered topology and last known statuses as a JSON-serialisable dict for restore_topology(), None until
+        the topology is complete. Records are stored in their wire format.
+        """
+        if not self._topology_complete.is_set():
+            return None
+        return {
+            "version": TOPOLOGY_CACHE_VERSION,
+            "protocol": "at2plus",
+            "aircons": {str(id): {"status": ac.status.to_bytes().hex(), "ability": ac.ability.to_bytes().hex()}
+                        for id, ac in self.aircons_by_id.items() if ac.ability is not None},
+            "groups": {str(id): {"status": group.status.to_bytes().hex(), "name": group.name}
+                       for id, group in self.groups_by_id.items()},
+        }
+
+    def restore_topology(self, data: dict[str, Any]) -> bool:
+        """
+        Create the devices, their abilities and names from a cached export_topology() before anything is received,
+        call before run(). Restored devices are flagged 'restored' until a live status updates them, and once running
+        the abilities and names are fetched again in the background. If anything differs, 'topology_invalidated' is
+        set and TopologyChanged is published so the cache can be dropped. Return False if the cache is unusable.
+        """
+        if data.get("version") != TOPOLOGY_CACHE_VERSION or data.get("protocol") != "at2plus":
+            return False
+        try:
+            aircons = [(AcStatus.from_bytes(bytes.fromhex(ac["status"])), AcAbility.from_bytes(bytes.fromhex(ac["ability"])))
+                       for ac in data["aircons"].values()]
+            groups = [(GroupStatus.from_bytes(bytes.fromhex(group["status"])), group["name"])
+                      for group in data["groups"].values()]
+        except (KeyError, ValueError, TypeError) as e:
+            _LOGGER.warning(f"Ignoring unusable topology cache: {e}")
+            return False
+        for status, ability in aircons:
+            ac = self.aircons_by_id[status.id] = At2PlusAircon(status, self)
+            ac._set_ability(ability)
+            ac.restored = True
+            self.events.publish(DeviceAdded(ac.device_key, ac))
+        for status, name in groups:
+            group = self.groups_by_id[status.id] = At2PlusGroup(status, self)
+            group.name = name
+            group.restored = True
+            self.events.publish(DeviceAdded(group.device_key, group))
+        self._restored = True
+        self._topology_complete.set()
+        self.events.publish(TopologyChanged(None))
+        _LOGGER.debug(f"Restored topology: {self.topology_progress}")
+        return True
+
+    async def _revalidate_topology(self) -> None:
+        """Check a restored topology against the controller"""
+        abilities = {id: ac.ability for id, ac in self.aircons_by_id.items()}
+        names = {id: group.name for id, group in self.groups_by_id.items()}
+        await self._client.wait_connected()
+        try:
+            await self.request_state()
+        except asyncio.TimeoutError:
+            _LOGGER.debug("Controller did not send its state, topology not revalidated")
+            return
+        devices = [*self.aircons_by_id.values(), *self.groups_by_id.values()]
+        valid = set(abilities) == set(self.aircons_by_id) and set(names) == set(self.groups_by_id) and not any(
+            device.restored for device in devices)
+        for id, ability in abilities.items():
+            if valid and await self._request_ac_ability(id, Priority.BACKGROUND) not in (None, ability):
+                valid = False
+        if valid and names:
+            self._names_updated.clear()
+            await self.send(RequestGroupNamesMessage(), Priority.BACKGROUND)
+            try:
+                await asyncio.wait_for(self._names_updated.wait(), STATE_REQUEST_TIMEOUT)
+                valid = names == {id: group.name for id, group in self.groups_by_id.items()}
+            except asyncio.TimeoutError:
+                _LOGGER.debug("Controller did not send group names, not revalidated")
+        if valid:
+            _LOGGER.debug("Restored topology matches the controller")
+        else:
+            _LOGGER.info("Controller topology differs from the cached one")
+            self.topology_invalidated = True
+            self.events.publish(TopologyChanged(None))
+
     async def stop(self) -> None:
+        for stream in list(self._streams):
+            stream.close()
+        self.notifications.cancel()
+        await self.poller.stop()
+        await self.scheduler.stop()
         await self._client.stop()
-
-    def add_new_ac_callback(self, callback: Callback):
-        self._new_ac_callbacks.append(callback)
-
-        def remove_callback() -> None:
-            if callback in self._new_ac_callbacks:
-                self._new_ac_callbacks.remove(callback)
-
-        return remove_callback
-
-    def add_new_group_callback(self, callback: Callback):
-        self._new_group_callbacks.append(callback)
-
-        def remove_callback() -> None:
-            if callback in self._new_group_callbacks:
-                self._new_group_callbacks.remove(callback)
-
-        return remove_callback
-
-    async def send(self, msg: Serializable):
-        await self._client.send(msg)
+        self.events.close()
+
+    def add_new_ac_callback(self, callback: Callback) -> Callback:
+        return self._subscribe_new_device("ac", callback)
+
+    def add_new_group_callback(self, callback: Callback) -> Callback:
+        return self._subscribe_new_device("group", callback)
+
+    def _subscribe_new_device(self, kind: str, callback: Callback) -> Callback:
+        def on_device_added(event: DeviceAdded) -> None:
+            if event.device[0] == kind:
+                callback()
+        return self.events.subscribe(Topic.DEVICE_ADDED, on_device_added, name=describe(callback))
+
+    def updates(self, topics: Optional[Iterable[Topic]] = None, devices: Optional[Iterable[Hashable]] = None,
+                fields: Optional[Iterable[str]] = None, maxsize: int = DEFAULT_STREAM_BUFFER) -> UpdateStream:
+        """
+        Stream of events for 'async for', optionally only those of 'topics', about 'devices' (device keys such as
+        ("ac", 0)) or, for state changes, touching 'fields'. A consumer that falls behind gets the newest event per
+        device and topic rather than a growing backlog. The stream ends when closed or when the client is stopped.
+        """
+        stream = UpdateStream(self.events, topics, devices, fields, maxsize)
+        self._streams.add(stream)
+        return stream
+
+    def republish_state(self) -> None:
+        """
+        Publish the current state of every device again, e.g. so subscribers refresh after a reconnect. Not confirmed,
+        since nothing was received from the controller.
+        """
+        for device in [*self.aircons_by_id.values(), *self.groups_by_id.values()]:
+            self.events.publish(
+                StateChanged(device.device_key, device.status, device.status, frozenset(), confirmed=False))
+
+    async def request_state(self, min_interval: float = MIN_REFRESH_INTERVAL) -> Snapshot:
+        """
+        Ask the controller for its full state and return the resulting snapshot of the state store.
+        Concurrent callers share one outstanding request, and if the full state arrived less than 'min_interval'
+        seconds ago the current snapshot is returned without asking again.
+        Raise TimeoutError if the controller doesn't reply within STATE_REQUEST_TIMEOUT.
+        """
+        if asyncio.get_running_loop().time() - min(self._last_status_at.values()) < min_interval:
+            return self.state.snapshot()
+        return await self._state_request.run()
+
+    async def send(self, msg: Serializable, priority: Priority = Priority.USER, device: Optional[Hashable] = None):
+        """Queue 'msg' on the scheduler and wait until it has been written"""
+        if priority == Priority.USER:
+            self.poller.boost()
+        await self.scheduler.submit(msg, priority, device)
 
     async def handle_one_message(self) -> None:
         message = await self._read_message()
         if not message:
             # something went wrong
             _LOGGER.warning("Reading message failed")
+            self.scheduler.on_error()
             return
+        self.scheduler.on_response()
+
+        try:
+            with self.stages.stage("dispatch"):
+                await self._dispatch_message(message)
+        except ValueError as e:
+            _LOGGER.warning(f"Could not parse message: {e}")
+            self.recorder.mark(FrameStatus.PARSE_ERROR)
+            self._parse_errors.inc()
 
+    async def _dispatch_message(self, message: Message) -> None:
         if message.header.type == MessageType.CONTROL_STATUS:
             subheader = ControlStatusSubHeader.from_buffer(message.data_buffer)
             if subheader.sub_type == ControlStatusSubType.AC_STATUS:
                 status_message = AcStatusMessage.from_bytes(
                     message.data_buffer.read_bytes(subheader.subdata_length.total()))
-                self._task_creator(self._handle_status_message(status_message))
+                self.task_creator(self._handle_status_message(status_message))
             elif subheader.sub_type == ControlStatusSubType.GROUP_STATUS:
                 group_status_message = GroupStatusMessage.from_bytes(
                     message.data_buffer.read_bytes(subheader.subdata_length.total()))
-                self._task_creator(self._handle_group_status_message(group_status_message))
+                self.task_creator(self._handle_group_status_message(group_status_message))
             else:
                 _LOGGER.warning(
                     f"Unknown status message type: subtype={subheader.sub_type}, data={message.data_buffer.to_bytes().hex(':')}")
@@ -100,6 +338,10 @@ class At2PlusClient:
                 group_names_subdata = message.data_buffer.read_remaining()
                 for id, name in group_names_from_subdata(group_names_subdata).items():
                     self.groups_by_id[id]._update_name(name)
+                self._names_received = True
+                self._names_updated.set()
+                self._check_topology()
+                self.events.publish(TopologyChanged(None))
             elif subheader.sub_type == ExtendedMessageSubType.ERROR:
                 # NYI
                 pass
@@ -114,6 +356,10 @@ class At2PlusClient:
         """Search for the two header magic bytes"""
         while True:  # exit via return on successful read of header magic
             byte = await self._client.read_bytes(1)
+            if byte is not None and byte[0] != HEADER_MAGIC:
+                # lost the framing, a None read is a disconnect and the next connection starts on a frame
+                self._resyncs.inc()
+                self.recorder.note_resync()
             while (byte is None or byte[0] != HEADER_MAGIC):
                 byte = await self._client.read_bytes(1)
 
@@ -138,13 +384,18 @@ class At2PlusClient:
                 return (header, header_bytes)
             except ValueError as e:
                 _LOGGER.debug(f"ValueError: {e}\nFailed reading header, trying again")
+                self.scheduler.on_error()
+                self._resyncs.inc()
+                self.recorder.note_resync()
 
     async def _read_message(self) -> Message | None:
         "Try to read an entire message. Return None if reading was interrupted by network failure."
-        header, header_bytes = await self._read_header()
+        with self.stages.stage("read"):
+            header, header_bytes = await self._read_header()
         buffer = Buffer(header.data_length)
 
-        data_bytes = await self._client.read_bytes(header.data_length)
+        with self.stages.stage("read"):
+            data_bytes = await self._client.read_bytes(header.data_length)
         if not data_bytes:
             # interrupted during data reading
             return None
@@ -152,24 +403,82 @@ class At2PlusClient:
             _LOGGER.warning(
                 f"Received incorrect number of bytes, expected {header.data_length} but received {buffer._head}")
 
-        checksum = await self._client.read_bytes(2)
+        with self.stages.stage("read"):
+            checksum = await self._client.read_bytes(2)
         if not checksum:
             # interrupted during checksum reading
             return None
-        calculated_checksum = crc16(header_bytes[2:] + buffer._data)
+        with self.stages.stage("crc"):
+            calculated_checksum = crc16(header_bytes[2:] + buffer._data)
         if (checksum != calculated_checksum):
+            self.recorder.record(bytes(header_bytes) + data_bytes + checksum, Direction.RX, FrameStatus.BAD_CHECKSUM)
+            self._checksum_failures.inc()
             _LOGGER.warning(
                 f"Checksum mismatch, ignoring message: Got {checksum.hex(':')}, expected {calculated_checksum.hex(':')}")
             return None
-
-        if self._dump_responses:
-            # blocks but is only used for dev and debugging
-            with open('message_' + datetime.now().strftime("%m-%d-%Y_%H-%M-%S") + '.dump', 'wb') as f:
-                f.write(header.to_bytes() + buffer.to_bytes() + checksum)
+        self.recorder.record(bytes(header_bytes) + data_bytes + checksum, Direction.RX)
+        self._frames_received.inc()
 
         return Message(header, buffer)
 
+    def record_command_result(self, result: CommandResult) -> None:
+        """Count the outcome of a command sent with confirm=True, called by the devices"""
+        if result.latency is not None:
+            self._confirm_latency.observe(result.latency)
+        else:
+            self._unconfirmed.inc()
+
+    def _store_added(self, event: DeviceAdded) -> None:
+        self.state.put(event.device, event.obj.status)
+
+    def _boost_on_change(self, event: StateChanged) -> None:
+        if event.confirmed and event.changed - _MEASURED_FIELDS:
+            self.poller.boost()
+
+    def _store_changed(self, event: StateChanged) -> None:
+        if event.confirmed and event.changed:
+            self.state.put(event.device, event.new)
+
+    def _mark_updated(self, event: StateChanged | TopologyChanged) -> None:
+        if event.device is not None:
+            self.notifications.mark(event.device)
+
+    def _publish_updated(self, devices: list[Hashable]) -> None:
+        for device in devices:
+            self.events.publish(DeviceUpdated(device))
+
+    def _on_link_change(self, connected: bool) -> None:
+        self.events.publish(LinkState(None, connected))
+
+    async def _fetch_state(self) -> Snapshot:
+        loop = asyncio.get_running_loop()
+        received = {kind: loop.create_future() for kind in self._status_waiters}
+        for kind, waiter in received.items():
+            self._status_waiters[kind].append(waiter)
+        try:
+            await self.send(GroupStatusMessage([]), Priority.BACKGROUND)
+            await self.send(AcStatusMessage([]), Priority.BACKGROUND)
+            # status the controller pushed while the requests were queued isn't the reply
+            sent_at = None if received["ac"].done() else loop.time()
+            await asyncio.wait_for(asyncio.gather(*received.values()), STATE_REQUEST_TIMEOUT)
+            if sent_at is not None:
+                self.scheduler.record_latency(loop.time() - sent_at)
+        finally:
+            for kind, waiter in received.items():
+                if waiter in self._status_waiters[kind]:
+                    self._status_waiters[kind].remove(waiter)
+        return self.state.snapshot()
+
+    def _status_received(self, kind: str) -> None:
+        self._last_status_at[kind] = asyncio.get_running_loop().time()
+        for waiter in self._status_waiters[kind]:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._status_waiters[kind].clear()
+        self._check_topology()
+
     async def _on_connect(self) -> None:
+        # bypasses the scheduler, this runs inside reconnects triggered by the scheduler's own sends
         # request groups
         await self._client.send(GroupStatusMessage([]))
         # request ACs
@@ -180,23 +489,35 @@ class At2PlusClient:
         for status in message.statuses:
             if status.id not in self.aircons_by_id.keys():
                 _LOGGER.debug(f"New AC ({status.id}) found")
-                self.aircons_by_id[status.id] = At2PlusAircon(status, self)
-                for callback in self._new_ac_callbacks:
-                    callback()
+                ac = self.aircons_by_id[status.id] = At2PlusAircon(status, self)
+                self.events.publish(DeviceAdded(ac.device_key, ac))
                 ability = await self._request_ac_ability(status.id)
                 while not ability:
                     ability = await self._request_ac_ability(status.id)
-                self.aircons_by_id[status.id]._set_ability(ability)
+                ac._set_ability(ability)
                 _LOGGER.debug(f"Set ability of AC{status.id}")
+                self.events.publish(TopologyChanged(None))
             self.aircons_by_id[status.id]._update_status(status)
             _LOGGER.debug(f"Updated AC {status.id} with value {status}")
         _LOGGER.debug("Finished handling AC status message")
-
-    async def _request_ac_ability(self, id: int) -> AcAbility | None:
-        _LOGGER.debug(f"Requesting ability of AC{id}")
-        await self._client.send(RequestAcAbilityMessage(id))
-        _LOGGER.debug("Waiting for ability message response...")
-        ac_ability = await self._ability_message_queue.get()
+        self._status_received("ac")
+
+    async def _request_ac_ability(self, id: int, priority: Priority = Priority.USER) -> AcAbility | None:
+        async with self._ability_lock:
+            _LOGGER.debug(f"Requesting ability of AC{id}")
+            # drop late responses to earlier requests that timed out
+            while not self._ability_message_queue.empty():
+                self._ability_message_queue.get_nowait()
+            await self.send(RequestAcAbilityMessage(id), priority, device=("ac", id))
+            sent_at = asyncio.get_running_loop().time()
+            _LOGGER.debug("Waiting for ability message response...")
+            try:
+                ac_ability = await asyncio.wait_for(self._ability_message_queue.get(), STATE_REQUEST_TIMEOUT)
+            except asyncio.TimeoutError:
+                _LOGGER.warning(f"No response to ability request for AC{id}")
+                return None
+            # abilities are only ever sent in reply to a request
+            self.scheduler.record_latency(asyncio.get_running_loop().time() - sent_at)
         _LOGGER.debug("Got ability message response")
         if len(ac_ability.abilities) != 1:
             _LOGGER.warning(f"Expected ability of single requested AC but got {len(ac_ability.abilities)}")
@@ -210,17 +531,21 @@ class At2PlusClient:
     async def _handle_group_status_message(self, message: GroupStatusMessage):
         _LOGGER.debug("Handling group status message")
         request_names: bool = False
+        added = False
         if not len(self.groups_by_id):
             request_names = True
         for status in message.statuses:
             if status.id not in self.groups_by_id.keys():
                 _LOGGER.debug(f"New group ({status.id}) found")
-                self.groups_by_id[status.id] = At2PlusGroup(status, self)
-                for callback in self._new_group_callbacks:
-                    callback()
+                group = self.groups_by_id[status.id] = At2PlusGroup(status, self)
+                self.events.publish(DeviceAdded(group.device_key, group))
+                added = True
             self.groups_by_id[status.id]._update_status(status)
             _LOGGER.debug(f"Updated group {status.id} with value {status}")
         _LOGGER.debug("Finished handling group status message")
+        self._status_received("group")
+        if added:
+            self.events.publish(TopologyChanged(None))
         if request_names:
             _LOGGER.debug("Requesting all group names")
-            await self._client.send(RequestGroupNamesMessage())
+            await self.send(RequestGroupNamesMessage())
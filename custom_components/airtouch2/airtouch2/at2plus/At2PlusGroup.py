@@ -1,6 +1,9 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Optional
 
+from ..common.Coalescer import Coalescer
+from ..common.EventBus import StateChanged, Topic, TopologyChanged, changed_fields, describe
+from ..common.PendingLedger import DEFAULT_CONFIRM_TIMEOUT, CommandResult, PendingLedger
 from ..common.interfaces import Callback
 from ..protocol.at2plus.enums import GroupPower, GroupSetDamper, GroupSetPower
 from ..protocol.at2plus.messages.GroupControl import GroupControlMessage, GroupSettings
@@ -14,53 +17,104 @@ class At2PlusGroup:
     """
     A class that represents a single airtouch2+ group.
 
+    Setters called with 'confirm' wait for a status frame showing the change and return a CommandResult.
     """
 
     def __init__(self, status: GroupStatus, client: At2PlusClient):
         self.status = status
         self.name: str | None = None
         self._client = client
-        self._callbacks: list[Callback] = []
+        # True while 'status' comes from a topology cache rather than the controller
+        self.restored = False
+        self._pending: PendingLedger[GroupStatus] = PendingLedger(on_result=client.record_command_result)
+        self._damp_coalescer: Coalescer[int] = Coalescer(
+            lambda: self.status.damp, self._send_damp, client.task_creator)
+
+    @property
+    def device_key(self) -> tuple[str, int]:
+        return ("group", self.status.id)
+
+    @property
+    def pending(self) -> bool:
+        """True while commands sent to the device are not yet confirmed by the controller"""
+        return bool(self._pending)
 
     async def _set_power(self, power: GroupSetPower, damp: int | None = None):
-        settings = GroupSettings(self.status.id, GroupSetDamper.UNCHANGED, power, damp)
-        await self._client.send(GroupControlMessage([settings]))
+        await self._client.send(self._settings(power=power, damp=damp), device=self.device_key)
+
+    def _settings(self, damp_mode: GroupSetDamper = GroupSetDamper.UNCHANGED,
+                  power: GroupSetPower = GroupSetPower.UNCHANGED, damp: int | None = None) -> GroupControlMessage:
+        return GroupControlMessage([GroupSettings(self.status.id, damp_mode, power, damp)])
 
-    async def turn_on(self, damp: int | None = None):
-        await self._set_power(GroupSetPower.ON, damp)
+    async def turn_on(self, damp: int | None = None, confirm: bool = False,
+                      timeout: float = DEFAULT_CONFIRM_TIMEOUT) -> Optional[CommandResult]:
+        return await self._command("power", GroupPower.ON, self._settings(power=GroupSetPower.ON, damp=damp),
+                                   confirm, timeout)
 
-    async def turn_off(self):
-        await self._set_power(GroupSetPower.OFF)
+    async def turn_off(self, confirm: bool = False,
+                       timeout: float = DEFAULT_CONFIRM_TIMEOUT) -> Optional[CommandResult]:
+        return await self._command("power", GroupPower.OFF, self._settings(power=GroupSetPower.OFF), confirm, timeout)
 
     def is_on(self) -> bool:
         return self.status.power != GroupPower.OFF
 
-    async def set_damp(self, new_damp: int):
-        settings = GroupSettings(self.status.id, GroupSetDamper.SET, GroupSetPower.UNCHANGED, new_damp)
-        await self._client.send(GroupControlMessage([settings]))
-
-    async def set_turbo(self):
-        settings = GroupSettings(self.status.id, GroupSetDamper.UNCHANGED, GroupSetPower.TURBO)
-        await self._client.send(GroupControlMessage([settings]))
+    async def set_damp(self, new_damp: int, confirm: bool = False,
+                       timeout: float = DEFAULT_CONFIRM_TIMEOUT) -> Optional[CommandResult]:
+        """Calls made while a damper change is being sent are coalesced, only the newest one is sent after it"""
+        if not confirm:
+            await self._damp_coalescer.set(new_damp)
+            return None
+        return await self._pending.until_confirmed(
+            "damp", new_damp, lambda: self._damp_coalescer.set(new_damp), lambda: self.status.damp == new_damp,
+            timeout, self._client.scheduler.response_timeout, self._client.scheduler.on_error)
+
+    async def _send_damp(self) -> bool:
+        target = self._damp_coalescer.target
+        await self._send_expecting("damp", target, self._settings(GroupSetDamper.SET, damp=target))
+        return True
+
+    async def set_turbo(self, confirm: bool = False,
+                        timeout: float = DEFAULT_CONFIRM_TIMEOUT) -> Optional[CommandResult]:
+        return await self._command("power", GroupPower.TURBO, self._settings(power=GroupSetPower.TURBO), confirm,
+                                   timeout)
+
+    async def _command(self, field: str, value: Any, message: GroupControlMessage, confirm: bool,
+                       timeout: float) -> Optional[CommandResult]:
+        """
+        Send a command that sets 'field' of the status to 'value'. Without 'confirm' return once it is written,
+        otherwise wait for a status frame showing it (resending it if it looks lost) and return the outcome.
+        """
+        if not confirm:
+            await self._send_expecting(field, value, message)
+            return None
+        return await self._pending.until_confirmed(
+            field, value, lambda: self._send_expecting(field, value, message),
+            lambda: getattr(self.status, field) == value, timeout,
+            self._client.scheduler.response_timeout, self._client.scheduler.on_error)
+
+    async def _send_expecting(self, field: str, value: Any, message: GroupControlMessage) -> None:
+        self._pending.expect(field, value)
+        try:
+            await self._client.send(message, device=self.device_key)
+        except BaseException:
+            self._pending.discard(field, value)
+            raise
 
     def add_callback(self, callback: Callback) -> Callback:
-        self._callbacks.append(callback)
-
-        def remove_callback() -> None:
-            if callback in self._callbacks:
-                self._callbacks.remove(callback)
-
-        return remove_callback
+        """Call 'callback' when the status, ability or name of this device changes"""
+        return self._client.events.subscribe(Topic.DEVICE_UPDATED, lambda _event: callback(), self.device_key,
+                                             name=describe(callback))
 
     def _update_status(self, status: GroupStatus):
+        old = self.status
         self.status = status
-        for callback in self._callbacks:
-            callback()
+        self.restored = False
+        self._pending.confirm(status)
+        self._client.events.publish(StateChanged(self.device_key, old, status, changed_fields(old, status)))
 
     def _update_name(self, name: str):
         self.name = name
-        for callback in self._callbacks:
-            callback()
+        self._client.events.publish(TopologyChanged(self.device_key))
 
     def __repr__(self):
         return str(self.status) + f"""
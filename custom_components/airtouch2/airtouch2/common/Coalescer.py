@@ -0,0 +1,78 @@
+from __future__ import annotations
+import asyncio
+from typing import Awaitable, Callable, Generic, Optional, TypeVar
+
+from .interfaces import TaskCreator
+
+T = TypeVar("T")
+
+
+class Coalescer(Generic[T]):
+    """
+    Latest-wins coalescing of changes to one field of one device.
+
+    Only one 'apply' runs at a time. Targets set while it is in flight replace each other, and once it finishes
+    'apply' runs again only if the target moved, so a burst of changes sends just the net change.
+    'apply' reads the wanted value from 'target' and may pick up a newer one while it runs.
+    Targets that match both the current state and the last target applied while nothing is in flight are dropped,
+    as 'current' may be the confirmed state, which lags behind a change that was sent but not yet reported. When
+    'current' moves (the change was reported, or the device was changed elsewhere) it becomes the last applied.
+    Every caller of set() gets the result of the run that applied the newest target. Runs are started with
+    'task_creator'.
+    """
+
+    def __init__(self, current: Callable[[], T], apply: Callable[[], Awaitable[bool]],
+                 task_creator: TaskCreator = asyncio.create_task):
+        self._current = current
+        self._apply = apply
+        self._task_creator = task_creator
+        self._target: Optional[T] = None
+        self._applied: Optional[T] = None
+        # 'current' when last looked at, to notice it moving
+        self._reported: Optional[T] = None
+        self._generation = 0
+        self._running: Optional[asyncio.Future[bool]] = None
+
+    @property
+    def target(self) -> T:
+        if self._target is None:
+            raise RuntimeError("No target has been set")
+        return self._target
+
+    @property
+    def in_flight(self) -> bool:
+        return self._running is not None
+
+    def accepts(self, target: T) -> bool:
+        """False if set('target') would be dropped because the device is already there"""
+        current = self._current()
+        if current != self._reported:
+            self._reported = current
+            if self._running is None:
+                self._applied = current
+        return self._running is not None or target != current or (
+            self._applied is not None and target != self._applied)
+
+    async def set(self, target: T) -> bool:
+        if self._running is None:
+            if not self.accepts(target):
+                return True
+            self._target = target
+            self._generation += 1
+            self._running = self._task_creator(self._run())
+        elif target != self._target:
+            self._target = target
+            self._generation += 1
+        # shielded so a cancelled caller doesn't abort the change for everyone else
+        return await asyncio.shield(self._running)
+
+    async def _run(self) -> bool:
+        try:
+            while True:
+                generation = self._generation
+                self._applied = self._target
+                result = await self._apply()
+                if generation == self._generation:
+                    return result
+        finally:
+            self._running = None
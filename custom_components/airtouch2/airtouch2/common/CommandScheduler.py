@@ -0,0 +1,181 @@
+from __future__ import annotations
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from enum import IntEnum
+from itertools import count
+from typing import Awaitable, Callable, Hashable, Optional
+
+from .interfaces import Serializable, TaskCreator
+
+_LOGGER = logging.getLogger(__name__)
+
+# Gap between sends before any response latency has been measured, the value the AT2 is known to tolerate
+INITIAL_INTERVAL = 0.1
+MIN_INTERVAL = 0.05
+MAX_INTERVAL = 2.0
+# Fraction of the measured response latency to leave between sends
+LATENCY_FRACTION = 0.5
+# How much a fully erroring link (every frame bad) stretches the interval
+ERROR_PENALTY = 4.0
+# Background traffic is paced this much slower than user commands
+BACKGROUND_FACTOR = 4.0
+# Weight of each new sample in the smoothed latency and error rate
+SMOOTHING = 0.2
+# Bounds on how long to wait for a frame reflecting a command before treating the command as lost
+MIN_RESPONSE_TIMEOUT = 1.0
+MAX_RESPONSE_TIMEOUT = 5.0
+RESPONSE_TIMEOUT_FACTOR = 4.0
+
+
+class Priority(IntEnum):
+    """Send priority, lower values are sent first"""
+    USER = 0
+    CONFIRM = 1
+    BACKGROUND = 2
+
+
+@dataclass(slots=True)
+class _Command:
+    priority: Priority
+    seq: int
+    device: Optional[Hashable]
+    message: Serializable
+    future: asyncio.Future[None] = field(repr=False)
+
+
+class CommandScheduler:
+    """
+    Single outgoing queue for one controller.
+
+    Messages are sent one at a time in priority order, messages for the same device are never reordered
+    (a device's queued messages are promoted to the priority of its most urgent one), and the gap between sends
+    adapts to the controller's measured response latency and to the rate of bad or missing frames.
+    """
+
+    def __init__(self, send: Callable[[Serializable], Awaitable[None]], task_creator: TaskCreator = asyncio.create_task):
+        self._send = send
+        self._task_creator = task_creator
+        self._pending: list[_Command] = []
+        self._seq = count()
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task[None]] = None
+        self._last_sent_at: float = 0.0
+
+        # smoothed seconds between a request and its reply, see record_latency()
+        self.latency: Optional[float] = None
+        # smoothed fraction of received frames that were bad (checksum failure, resync, read failure, lost command)
+        self.error_rate: float = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    async def submit(self, message: Serializable, priority: Priority = Priority.USER,
+                     device: Optional[Hashable] = None) -> None:
+        """Queue 'message' and wait until it has been written"""
+        command = _Command(priority, next(self._seq), device, message, asyncio.get_running_loop().create_future())
+        self._pending.append(command)
+        if self._worker is None or self._worker.done():
+            self._worker = self._task_creator(self._run())
+        self._wakeup.set()
+        await command.future
+
+    def on_response(self) -> None:
+        """Called for every good frame received from the controller"""
+        self.error_rate -= SMOOTHING * self.error_rate
+
+    def record_latency(self, sample: float) -> None:
+        """
+        Called with the seconds from writing a request to receiving its reply. Only for real request/reply pairs:
+        the controller also sends frames by itself, so the next frame after a send says nothing about latency.
+        """
+        self.latency = sample if self.latency is None else self.latency + SMOOTHING * (sample - self.latency)
+
+    def on_error(self) -> None:
+        """Called for every bad frame, resync or command the controller did not act on"""
+        self.error_rate += SMOOTHING * (1.0 - self.error_rate)
+
+    def interval(self, priority: Priority) -> float:
+        """Seconds to leave between the previous send and a send of 'priority'"""
+        interval = INITIAL_INTERVAL if self.latency is None else max(LATENCY_FRACTION * self.latency, MIN_INTERVAL)
+        interval *= 1.0 + ERROR_PENALTY * self.error_rate
+        if priority == Priority.BACKGROUND:
+            interval *= BACKGROUND_FACTOR
+        return min(interval, MAX_INTERVAL)
+
+    def response_timeout(self) -> float:
+        """Seconds to wait for a frame showing the effect of a command before treating the command as lost"""
+        if self.latency is None:
+            return MAX_RESPONSE_TIMEOUT
+        return min(max(RESPONSE_TIMEOUT_FACTOR * self.latency, MIN_RESPONSE_TIMEOUT), MAX_RESPONSE_TIMEOUT)
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for command in self._pending:
+            if not command.future.done():
+                command.future.set_exception(RuntimeError("Client was stopped before the message was sent"))
+        self._pending.clear()
+
+    def _next(self) -> Optional[_Command]:
+        # a device's queued messages inherit the priority of its most urgent one so they stay in order
+        device_priority: dict[Hashable, Priority] = {}
+        for command in self._pending:
+            if command.device is not None:
+                device_priority[command.device] = min(
+                    device_priority.get(command.device, command.priority), command.priority)
+        best: Optional[_Command] = None
+        best_priority = Priority.BACKGROUND
+        seen: set[Hashable] = set()
+        for command in self._pending:  # oldest first
+            priority = command.priority
+            if command.device is not None:
+                if command.device in seen:
+                    continue
+                seen.add(command.device)
+                priority = device_priority[command.device]
+            if best is None or priority < best_priority:
+                best, best_priority = command, priority
+        return best
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._pending = [command for command in self._pending if not command.future.done()]
+            command = self._next()
+            if command is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            wait = self._last_sent_at + self.interval(command.priority) - loop.time()
+            if wait > 0:
+                # something more urgent may be queued meanwhile, so choose again after pacing
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                if self._next() is not command or self._last_sent_at + self.interval(command.priority) > loop.time():
+                    continue
+
+            self._pending.remove(command)
+            self._last_sent_at = loop.time()
+            try:
+                await self._send(command.message)
+            except asyncio.CancelledError:
+                if not command.future.done():
+                    command.future.cancel()
+                raise
+            except Exception as e:
+                if not command.future.done():
+                    command.future.set_exception(e)
+            else:
+                if not command.future.done():
+                    command.future.set_result(None)
@@ -0,0 +1,288 @@
+from __future__ import annotations
+import asyncio
+from dataclasses import dataclass, fields
+from enum import Enum
+from itertools import count
+import logging
+from time import monotonic, perf_counter
+from types import MethodType
+from typing import Any, Callable, ClassVar, Hashable, Optional, Union
+import weakref
+
+from .StageTimer import StageTimer
+from .interfaces import Callback, TaskCreator
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds a subscriber may take to handle one event before it counts as slow
+DEFAULT_SLOW_THRESHOLD = 0.05
+# Seconds between warnings about the same slow subscriber
+SLOW_LOG_INTERVAL = 300.0
+# Slow calls after which a subscriber is moved to the offload queue, when offloading is enabled
+DEFAULT_OFFLOAD_AFTER = 5
+# Events waiting for offloaded subscribers beyond which further events for them are dropped
+OFFLOAD_QUEUE_SIZE = 1000
+
+
+class Topic(Enum):
+    DEVICE_ADDED = "device_added"
+    STATE_CHANGED = "state_changed"
+    LINK_STATE = "link_state"
+    TOPOLOGY_CHANGED = "topology_changed"
+    DEVICE_UPDATED = "device_updated"
+
+
+@dataclass(frozen=True, slots=True)
+class Event:
+    topic: ClassVar[Topic]
+    # key of the device the event is about (e.g. ("ac", 0)), None for client-wide events
+    device: Optional[Hashable]
+
+
+@dataclass(frozen=True, slots=True)
+class DeviceAdded(Event):
+    topic: ClassVar[Topic] = Topic.DEVICE_ADDED
+    obj: Any
+
+
+@dataclass(frozen=True, slots=True)
+class StateChanged(Event):
+    """
+    'old' and 'new' are the device's state records. 'confirmed' is False when the change is only to the optimistic
+    state (a command was sent or a pending one expired) or the state was republished, rather than reported by the
+    controller.
+    """
+    topic: ClassVar[Topic] = Topic.STATE_CHANGED
+    old: Any
+    new: Any
+    changed: frozenset[str]
+    confirmed: bool = True
+
+
+@dataclass(frozen=True, slots=True)
+class LinkState(Event):
+    topic: ClassVar[Topic] = Topic.LINK_STATE
+    connected: bool
+
+
+@dataclass(frozen=True, slots=True)
+class TopologyChanged(Event):
+    """The set of devices, their names or their capabilities changed"""
+    topic: ClassVar[Topic] = Topic.TOPOLOGY_CHANGED
+
+
+@dataclass(frozen=True, slots=True)
+class DeviceUpdated(Event):
+    """
+    The device's state, optimistic state, name or capabilities changed.
+    Batched: published at most once per device for all the changes made in one event loop iteration.
+    """
+    topic: ClassVar[Topic] = Topic.DEVICE_UPDATED
+
+
+Handler = Callable[[Any], None]
+
+
+@dataclass(frozen=True, slots=True)
+class SubscriberStats:
+    """How long a subscriber has taken to handle its events"""
+    name: str
+    topic: Topic
+    device: Optional[Hashable]
+    calls: int
+    # seconds
+    total: float
+    max: float
+    slow_calls: int
+    offloaded: bool
+
+
+class _Subscription:
+    __slots__ = ("entry", "name", "topic", "device", "active", "calls", "total", "max", "slow_calls", "offloaded",
+                 "logged_at")
+
+    def __init__(self, entry: Union[Handler, weakref.ref], name: str, topic: Topic, device: Optional[Hashable]):
+        self.entry = entry
+        self.name = name
+        self.topic = topic
+        self.device = device
+        # cleared when unsubscribed, so queued events for it are skipped
+        self.active = True
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow_calls = 0
+        self.offloaded = False
+        self.logged_at = -SLOW_LOG_INTERVAL
+
+    def stats(self) -> SubscriberStats:
+        return SubscriberStats(self.name, self.topic, self.device, self.calls, self.total, self.max, self.slow_calls,
+                               self.offloaded)
+
+
+def describe(handler: Callable) -> str:
+    """Name of a handler for logs and statistics"""
+    return getattr(handler, "__qualname__", None) or repr(handler)
+
+_field_names: dict[type, tuple[str, ...]] = {}
+
+
+def changed_fields(old: Any, new: Any) -> frozenset[str]:
+    """Names of the dataclass fields that differ between two records of the same type"""
+    if old is new:
+        return frozenset()
+    names = _field_names.get(type(new))
+    if names is None:
+        names = _field_names[type(new)] = tuple(f.name for f in fields(new))
+    if type(old) is not type(new):
+        return frozenset(names)
+    return frozenset(name for name in names if getattr(old, name) != getattr(new, name))
+
+
+class EventBus:
+    """
+    Per-client publish/subscribe of typed events.
+
+    Subscribers pick a topic and optionally a single device, and are delivered the Event. Unsubscribing is
+    constant time, subscribers may be held weakly so they don't keep their owner alive, and an exception in one
+    subscriber is logged without stopping delivery to the others.
+
+    Subscribers are called inline, on the path that decodes frames, so every call is timed and a subscriber taking
+    longer than 'slow_threshold' is logged (at most every SLOW_LOG_INTERVAL). With 'offload_after', a subscriber
+    that has been slow that many times gets its events from a queue drained by a separate task instead, so it can't
+    hold up decoding.
+    """
+
+    def __init__(self, timer: Optional[StageTimer] = None, offload_after: Optional[int] = None,
+                 task_creator: TaskCreator = asyncio.create_task,
+                 slow_threshold: float = DEFAULT_SLOW_THRESHOLD) -> None:
+        # time spent in subscribers is measured as the "callbacks" stage while profiling
+        self.timer = timer if timer is not None else StageTimer()
+        # (topic, device or None for all devices) -> token -> subscription
+        self._subscriptions: dict[tuple[Topic, Optional[Hashable]], dict[int, _Subscription]] = {}
+        self._tokens = count()
+        self._offload_after = offload_after
+        self._task_creator = task_creator
+        self._slow_threshold = slow_threshold
+        self._queue: Optional[asyncio.Queue[tuple[_Subscription, Handler, Event]]] = None
+        self._worker: Optional[asyncio.Task[None]] = None
+        self._dropped_logged_at = -SLOW_LOG_INTERVAL
+
+        # events not delivered to offloaded subscribers because their queue was full
+        self.dropped = 0
+
+    def subscribe(self, topic: Topic, handler: Handler, device: Optional[Hashable] = None,
+                  weak: bool = False, name: Optional[str] = None) -> Callback:
+        """
+        Call 'handler' with each event of 'topic' (only those about 'device', if given).
+        With 'weak', the subscription ends by itself once 'handler' (or the object it is a bound method of) is
+        garbage collected. 'name' identifies the subscriber in statistics and logs, by default the handler's name.
+        Return a callback that unsubscribes.
+        """
+        key = (topic, device)
+        token = next(self._tokens)
+        entry: Union[Handler, weakref.ref] = handler
+        if weak:
+            # builtin bound methods such as list.append have __self__ but can't be weakly referenced as methods
+            entry = weakref.WeakMethod(handler) if isinstance(handler, MethodType) else weakref.ref(handler)
+        subscription = _Subscription(entry, name or describe(handler), topic, device)
+        self._subscriptions.setdefault(key, {})[token] = subscription
+
+        def unsubscribe() -> None:
+            subscription.active = False
+            subscribers = self._subscriptions.get(key)
+            if subscribers is not None:
+                subscribers.pop(token, None)
+                if not subscribers:
+                    del self._subscriptions[key]
+
+        return unsubscribe
+
+    def publish(self, event: Event) -> None:
+        with self.timer.stage("callbacks"):
+            self._deliver((event.topic, None), event)
+            if event.device is not None:
+                self._deliver((event.topic, event.device), event)
+
+    def subscriber_stats(self) -> list[SubscriberStats]:
+        """Statistics of the current subscribers, slowest in total first"""
+        stats = [subscription.stats() for subscribers in list(self._subscriptions.values())
+                 for subscription in subscribers.values()]
+        return sorted(stats, key=lambda s: s.total, reverse=True)
+
+    def close(self) -> None:
+        """Stop delivering queued events to offloaded subscribers"""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        self._queue = None
+
+    def _deliver(self, key: tuple[Topic, Optional[Hashable]], event: Event) -> None:
+        subscribers = self._subscriptions.get(key)
+        if not subscribers:
+            return
+        # copied so subscribers can unsubscribe (or subscribe) while being called
+        for token, subscription in list(subscribers.items()):
+            if not subscription.active:
+                # unsubscribed by an earlier subscriber to this event
+                continue
+            entry = subscription.entry
+            if isinstance(entry, weakref.ref):
+                handler = entry()
+                if handler is None:
+                    subscribers.pop(token, None)
+                    continue
+            else:
+                handler = entry
+            if subscription.offloaded:
+                self._offload(subscription, handler, event)
+            else:
+                self._call(subscription, handler, event)
+        if not subscribers and self._subscriptions.get(key) is subscribers:
+            del self._subscriptions[key]
+
+    def _call(self, subscription: _Subscription, handler: Handler, event: Event) -> None:
+        started = perf_counter()
+        try:
+            handler(event)
+        except Exception:
+            _LOGGER.exception(f"Error in subscriber {subscription.name} handling {event.topic.value} event")
+        elapsed = perf_counter() - started
+        subscription.calls += 1
+        subscription.total += elapsed
+        if elapsed > subscription.max:
+            subscription.max = elapsed
+        if elapsed >= self._slow_threshold:
+            self._on_slow(subscription, event, elapsed)
+
+    def _on_slow(self, subscription: _Subscription, event: Event, elapsed: float) -> None:
+        subscription.slow_calls += 1
+        now = monotonic()
+        if now - subscription.logged_at >= SLOW_LOG_INTERVAL:
+            subscription.logged_at = now
+            _LOGGER.warning(f"Subscriber {subscription.name} took {elapsed * 1000:.0f}ms to handle a "
+                            f"{event.topic.value} event ({subscription.slow_calls} slow of {subscription.calls} calls)")
+        if (self._offload_after is not None and not subscription.offloaded
+                and subscription.slow_calls >= self._offload_after):
+            subscription.offloaded = True
+            _LOGGER.warning(f"Subscriber {subscription.name} is repeatedly slow, delivering its events from a queue")
+
+    def _offload(self, subscription: _Subscription, handler: Handler, event: Event) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(OFFLOAD_QUEUE_SIZE)
+        if self._worker is None or self._worker.done():
+            self._worker = self._task_creator(self._run_offloaded(self._queue))
+        try:
+            self._queue.put_nowait((subscription, handler, event))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            now = monotonic()
+            if now - self._dropped_logged_at >= SLOW_LOG_INTERVAL:
+                self._dropped_logged_at = now
+                _LOGGER.warning(f"Offloaded subscribers are too far behind, dropped {self.dropped} events so far")
+
+    async def _run_offloaded(self, queue: asyncio.Queue[tuple[_Subscription, Handler, Event]]) -> None:
+        while True:
+            subscription, handler, event = await queue.get()
+            if subscription.active:
+                self._call(subscription, handler, event)
@@ -0,0 +1,87 @@
+from __future__ import annotations
+from collections.abc import Iterable, Iterator, Sequence
+from enum import IntEnum
+from typing import Any, TypeVar
+
+E = TypeVar("E", bound=IntEnum)
+
+
+class FlagSet(Sequence[E]):
+    """
+    Immutable set of IntEnum members stored as an int bitmask (bit n is set if the member with value n is present).
+
+    Behaves like a read-only list ordered by member value so it can be indexed, iterated and index()'d like the
+    lists it replaces, while membership checks are a single bit test.
+    Instances are interned per (enum, mask), so every device reporting the same capabilities shares one object.
+    """
+    __slots__ = ("_enum", "_mask", "_members")
+
+    _interned: dict[tuple[type, int], FlagSet] = {}
+
+    _enum: type[E]
+    _mask: int
+    _members: tuple[E, ...]
+
+    def __new__(cls, enum: type[E], mask: int = 0) -> FlagSet[E]:
+        key = (enum, mask)
+        interned = cls._interned.get(key)
+        if interned is not None:
+            return interned
+        if mask < 0:
+            raise ValueError("FlagSet mask must not be negative")
+        members = tuple(member for member in enum if member >= 0 and (mask >> member) & 1)
+        if sum(1 << member for member in members) != mask:
+            raise ValueError(f"Mask {bin(mask)} has bits that are not members of {enum.__name__}")
+        flag_set = super().__new__(cls)
+        flag_set._enum = enum
+        flag_set._mask = mask
+        flag_set._members = members
+        cls._interned[key] = flag_set
+        return flag_set
+
+    @staticmethod
+    def from_members(enum: type[E], members: Iterable[E]) -> FlagSet[E]:
+        mask = 0
+        for member in members:
+            mask |= 1 << member
+        return FlagSet(enum, mask)
+
+    @property
+    def mask(self) -> int:
+        return self._mask
+
+    def __contains__(self, item: object) -> bool:
+        return isinstance(item, int) and item >= 0 and (self._mask >> item) & 1 == 1
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def __iter__(self) -> Iterator[E]:
+        return iter(self._members)
+
+    def __getitem__(self, index: Any) -> Any:
+        return self._members[index]
+
+    def index(self, value: Any, start: int = 0, stop: int | None = None) -> int:
+        if value not in self:
+            raise ValueError(f"{value!r} is not in {self!r}")
+        position = (self._mask & ((1 << value) - 1)).bit_count()
+        if position < start or (stop is not None and position >= stop):
+            raise ValueError(f"{value!r} is not in {self!r}")
+        return position
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, FlagSet):
+            return self is other or (self._enum is other._enum and self._mask == other._mask)
+        if isinstance(other, (list, tuple)):
+            return list(self._members) == list(other)
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash((self._enum, self._mask))
+
+    def __reduce__(self):
+        return (FlagSet, (self._enum, self._mask))
+
+    def __repr__(self) -> str:
+        return f"{self._enum.__name__}{{{', '.join(member.name for member in self._members)}}}"
@@ -0,0 +1,164 @@
+from __future__ import annotations
+from array import array
+from collections import deque
+from dataclasses import dataclass
+from enum import IntEnum
+import logging
+import time
+from typing import Any, Callable, Optional
+
+_LOGGER = logging.getLogger(__name__)
+
+# Frames kept, and bytes kept of each (longer frames are truncated), 64 KiB in all by default
+DEFAULT_RECORDER_CAPACITY = 128
+DEFAULT_SLOT_SIZE = 512
+# Resyncs (lost framing, unreadable headers) within the window that count as a storm and trigger a dump
+RESYNC_STORM_COUNT = 5
+RESYNC_STORM_WINDOW = 10.0
+# Automatic dumps kept, and the least seconds between them so a persistent fault doesn't dump continuously
+MAX_DUMPS = 4
+DUMP_COOLDOWN = 60.0
+
+
+class Direction(IntEnum):
+    RX = 0
+    TX = 1
+
+
+class FrameStatus(IntEnum):
+    OK = 0
+    BAD_CHECKSUM = 1
+    PARSE_ERROR = 2
+
+
+@dataclass(frozen=True, slots=True)
+class RecordedFrame:
+    time: float
+    direction: Direction
+    status: FrameStatus
+    data: bytes
+    # length of the frame on the wire, more than len(data) if it was truncated
+    length: int
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"time": self.time, "direction": self.direction.name, "status": self.status.name,
+                "length": self.length, "data": self.data.hex(":")}
+
+
+@dataclass(frozen=True, slots=True)
+class Dump:
+    time: float
+    reason: str
+    frames: tuple[RecordedFrame, ...]
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"time": self.time, "reason": self.reason, "frames": [frame.as_dict() for frame in self.frames]}
+
+
+class FlightRecorder:
+    """
+    The last 'capacity' raw frames sent and received, for working out what went wrong after the fact.
+
+    Frames are copied into a bytearray preallocated as 'capacity' slots of 'slot_size' bytes, with their time,
+    length, direction and status in parallel fixed-size arrays, so recording a frame is a slice copy and a few stores
+    without allocating. Nothing is decoded until frames() is called. dump() snapshots the frames when something goes
+    wrong, which happens by itself on bad frames and on resync storms (see note_resync()).
+    """
+
+    def __init__(self, capacity: int = DEFAULT_RECORDER_CAPACITY, slot_size: int = DEFAULT_SLOT_SIZE,
+                 on_dump: Optional[Callable[[Dump], None]] = None):
+        self._capacity = capacity
+        self._slot_size = slot_size
+        self._on_dump = on_dump
+        self._data = bytearray(capacity * slot_size)
+        self._times = array("d", [0.0]) * capacity
+        self._lengths = array("L", [0]) * capacity
+        self._directions = bytearray(capacity)
+        self._statuses = bytearray(capacity)
+        # index of the next slot to write, and number of frames ever recorded
+        self._next = 0
+        self._recorded = 0
+        self._resyncs: deque[float] = deque(maxlen=RESYNC_STORM_COUNT)
+        self._last_dump_at = -DUMP_COOLDOWN
+
+        self.dumps: deque[Dump] = deque(maxlen=MAX_DUMPS)
+        self.resyncs = 0
+
+    @property
+    def recorded(self) -> int:
+        """Frames recorded since creation, including those since overwritten"""
+        return self._recorded
+
+    def record(self, frame: bytes, direction: Direction, status: FrameStatus = FrameStatus.OK) -> None:
+        slot = self._next
+        length = len(frame)
+        kept = min(length, self._slot_size)
+        start = slot * self._slot_size
+        self._data[start:start + kept] = frame[:kept] if kept < length else frame
+        self._times[slot] = time.time()
+        self._lengths[slot] = length
+        self._directions[slot] = direction
+        self._statuses[slot] = status
+        self._next = (slot + 1) % self._capacity
+        self._recorded += 1
+        if status != FrameStatus.OK:
+            self.dump(f"{direction.name} frame {status.name.lower().replace('_', ' ')}")
+
+    def mark(self, status: FrameStatus) -> None:
+        """Set the status of the latest frame, for problems found after it was recorded (e.g. it didn't parse)"""
+        if not self._recorded:
+            return
+        slot = (self._next - 1) % self._capacity
+        self._statuses[slot] = status
+        if status != FrameStatus.OK:
+            self.dump(f"{Direction(self._directions[slot]).name} frame {status.name.lower().replace('_', ' ')}")
+
+    def note_resync(self) -> None:
+        """Count a loss of framing, dumping if they come in a storm"""
+        self.resyncs += 1
+        now = time.monotonic()
+        self._resyncs.append(now)
+        if len(self._resyncs) == RESYNC_STORM_COUNT and now - self._resyncs[0] <= RESYNC_STORM_WINDOW:
+            self._resyncs.clear()
+            self.dump(f"{RESYNC_STORM_COUNT} resyncs within {RESYNC_STORM_WINDOW:.0f}s")
+
+    def frames(self) -> list[RecordedFrame]:
+        """The recorded frames, oldest first"""
+        count = min(self._recorded, self._capacity)
+        frames = []
+        for i in range(count):
+            slot = (self._next - count + i) % self._capacity
+            start = slot * self._slot_size
+            length = self._lengths[slot]
+            frames.append(RecordedFrame(self._times[slot], Direction(self._directions[slot]),
+                                        FrameStatus(self._statuses[slot]),
+                                        bytes(self._data[start:start + min(length, self._slot_size)]), length))
+        return frames
+
+    def dump(self, reason: str, force: bool = False) -> Optional[Dump]:
+        """
+        Snapshot the recorded frames into 'dumps' and log it. Automatic dumps closer together than DUMP_COOLDOWN
+        are skipped unless 'force'. Return the dump, None if skipped.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_dump_at < DUMP_COOLDOWN:
+            return None
+        self._last_dump_at = now
+        dump = Dump(time.time(), reason, tuple(self.frames()))
+        self.dumps.append(dump)
+        _LOGGER.warning(f"Recorded the last {len(dump.frames)} frames: {reason}")
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            for frame in dump.frames:
+                _LOGGER.debug(f"{frame.time:.3f} {frame.direction.name} {frame.status.name} {frame.data.hex(':')}")
+        if self._on_dump:
+            self._on_dump(dump)
+        return dump
+
+    def as_dict(self) -> dict[str, Any]:
+        """Everything recorded, JSON-serialisable for diagnostics"""
+        return {
+            "recorded": self._recorded,
+            "resyncs": self.resyncs,
+            "frames": [frame.as_dict() for frame in self.frames()],
+            "dumps": [dump.as_dict() for dump in self.dumps],
+        }
@@ -0,0 +1,126 @@
+from __future__ import annotations
+from bisect import bisect_left
+from typing import Any, Callable, Iterator, Optional, Union
+
+# Upper bounds (seconds) of the buckets latency histograms use by default, the last bucket is everything above
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+# Buckets for how long commands take to be confirmed, which includes resends after lost frames
+CONFIRM_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+
+class Counter:
+    """A count that only goes up"""
+    __slots__ = ("name", "description", "value")
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+
+class Gauge:
+    """A value that goes up and down, either set or read from 'read' when asked for"""
+    __slots__ = ("name", "description", "_value", "_read")
+
+    def __init__(self, name: str, description: str = "", read: Optional[Callable[[], Optional[float]]] = None):
+        self.name = name
+        self.description = description
+        self._value: Optional[float] = None
+        self._read = read
+
+    @property
+    def value(self) -> Optional[float]:
+        return self._read() if self._read is not None else self._value
+
+    def set(self, value: Optional[float]) -> None:
+        self._value = value
+
+
+class Histogram:
+    """Counts of observations in fixed buckets, for percentiles without keeping the observations"""
+    __slots__ = ("name", "description", "bounds", "counts", "count", "sum")
+
+    def __init__(self, name: str, bounds: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS, description: str = ""):
+        self.name = name
+        self.description = description
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the 'q' quantile (0-1), the largest bound if it is above them all"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.bounds[-1]
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"count": self.count, "sum": self.sum,
+                "buckets": {str(bound): count for bound, count in zip((*self.bounds, "inf"), self.counts)}}
+
+
+Metric = Union[Counter, Gauge, Histogram]
+
+
+class MetricsRegistry:
+    """
+    Named counters, gauges and histograms. Instrumented code keeps the metric objects it updates, so the hot path
+    is an attribute increment, and readers look them up by name or take a snapshot.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def counter(self, name: str, description: str = "") -> Counter:
+        return self._get_or_add(name, lambda: Counter(name, description), Counter)
+
+    def gauge(self, name: str, description: str = "", read: Optional[Callable[[], Optional[float]]] = None) -> Gauge:
+        return self._get_or_add(name, lambda: Gauge(name, description, read), Gauge)
+
+    def histogram(self, name: str, bounds: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+                  description: str = "") -> Histogram:
+        return self._get_or_add(name, lambda: Histogram(name, bounds, description), Histogram)
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._metrics
+
+    def __iter__(self) -> Iterator[Metric]:
+        return iter(list(self._metrics.values()))
+
+    def snapshot(self) -> dict[str, Any]:
+        """Current values by name, histograms as their bucket counts, JSON-serialisable"""
+        return {name: metric.as_dict() if isinstance(metric, Histogram) else metric.value
+                for name, metric in self._metrics.items()}
+
+    def _get_or_add(self, name: str, create: Callable[[], Any], kind: type) -> Any:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = create()
+        elif not isinstance(metric, kind):
+            raise TypeError(f"Metric '{name}' is a {type(metric).__name__}, not a {kind.__name__}")
+        return metric
+
+
+# Metrics of the stateless protocol parsers, shared by all clients
+PROTOCOL_METRICS = MetricsRegistry()
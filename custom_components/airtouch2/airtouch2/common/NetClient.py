@@ -4,6 +4,8 @@ import logging
 import socket
 import time
 from typing import Callable, Optional
+from .FlightRecorder import Direction, FlightRecorder
+from .Metrics import MetricsRegistry
 from .interfaces import CoroCallback, Serializable, TaskCreator
 
 _LOGGER = logging.getLogger(__name__)
@@ -37,7 +39,9 @@ class NetClient:
     """A generic network client"""
 
     def __init__(self, host: str, port: int, on_connect: CoroCallback, handle_message: CoroCallback,
-                 task_creator: TaskCreator = asyncio.create_task):
+                 task_creator: TaskCreator = asyncio.create_task,
+                 on_link_change: Optional[Callable[[bool], None]] = None,
+                 recorder: Optional[FlightRecorder] = None, metrics: Optional[MetricsRegistry] = None):
         # network
         self._host_ip: str = host
         self._host_port: int = port
@@ -48,9 +52,23 @@ class NetClient:
         self._task_creator: Callable = task_creator
         self._main_loop_task: Optional[asyncio.Task[None]] = None
         self._stop: bool = False
+        self._connect_in_background: bool = False
+        self._connected_event = asyncio.Event()
 
         self._on_connect = on_connect
         self._handle_message = handle_message
+        self._on_link_change = on_link_change
+        self._recorder = recorder
+        self.connected: bool = False
+
+        # traffic and link counters
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self._bytes_received = self.metrics.counter("bytes_received", "Bytes read from the controller")
+        self._bytes_sent = self.metrics.counter("bytes_sent", "Bytes written to the controller")
+        self._frames_sent = self.metrics.counter("frames_sent", "Messages written to the controller")
+        self._connects = self.metrics.counter("connects", "Connections made to the controller")
+        self._connection_losses = self.metrics.counter("connection_losses", "Connections lost and reconnected")
+        self.metrics.gauge("connected", "1 while connected to the controller", lambda: int(self.connected))
 
     async def connect(self) -> bool:
         """Opens connection to the server, returns True/False if successful/unsuccessful"""
@@ -72,14 +90,26 @@ class NetClient:
                 interval_seconds=1,
                 count=5,
             )
+            self._connects.inc()
+            self._set_connected(True)
             await self._on_connect()
             return True
 
-    def run(self) -> None:
-        """Starts the processing of incoming information from the server"""
+    def run(self, connect: bool = False) -> None:
+        """
+        Starts the processing of incoming information from the server.
+        With 'connect', the connection is made in the background (retrying until it succeeds) instead of requiring
+        connect() to have succeeded first.
+        """
         _LOGGER.debug("Starting listener task")
+        self._stop = False
+        self._connect_in_background = connect
         self._main_loop_task = self._task_creator(self._main())
 
+    async def wait_connected(self) -> None:
+        """Wait until the connection is up"""
+        await self._connected_event.wait()
+
     async def stop(self) -> None:
         """Stops the processing of incoming information from the server"""
         if not self._main_loop_task:
@@ -91,6 +121,7 @@ class NetClient:
         except asyncio.CancelledError as e:
             # Eat the expected exception
             pass
+        self._set_connected(False)
 
     async def send(self, message: Serializable) -> None:
         """Send the serializable 'message'"""
@@ -100,13 +131,18 @@ class NetClient:
             bytes_to_write = message.to_bytes()
             _LOGGER.debug(f"Sending {message.__class__.__name__} with data: {bytes_to_write.hex(':')}")
             _LOGGER.debug(f"{repr(message)}")
+            if self._recorder is not None:
+                self._recorder.record(bytes_to_write, Direction.TX)
             self._writer.write(bytes_to_write)
+            self._frames_sent.inc()
+            self._bytes_sent.inc(len(bytes_to_write))
             drained: bool = False
             while not drained:
                 try:
                     await self._writer.drain()
                     drained = True
                 except (ConnectionResetError, asyncio.IncompleteReadError, TimeoutError) as e:
+                    self._set_connected(False)
                     await self._try_reconnect()
 
     async def read_bytes(self, size: int) -> Optional[bytes]:
@@ -134,17 +170,33 @@ class NetClient:
                 _last_connection_warning = now
             else:
                 _LOGGER.debug("Connection lost, reconnecting (message suppressed)")
+            self._set_connected(False)
             await self._try_reconnect()
             return None
+        self._bytes_received.inc(size)
         _LOGGER.debug(f"Read payload of size {size}: {data.hex(':')}")
         return data
 
     async def _main(self) -> None:
+        if self._connect_in_background and not self.connected:
+            await self._try_reconnect()
         while not self._stop:
             if not (self._reader and self._writer):
                 raise RuntimeError("Client is not connected - call connect() first")
             await self._handle_message()
 
+    def _set_connected(self, connected: bool) -> None:
+        if connected != self.connected:
+            self.connected = connected
+            if connected:
+                self._connected_event.set()
+            else:
+                self._connected_event.clear()
+                if not self._stop:
+                    self._connection_losses.inc()
+            if self._on_link_change:
+                self._on_link_change(connected)
+
     async def _try_reconnect(self) -> None:
         retries = 0
         while not await self.connect():
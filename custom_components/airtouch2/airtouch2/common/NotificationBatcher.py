@@ -0,0 +1,67 @@
+from __future__ import annotations
+import asyncio
+from typing import Callable, Hashable, Optional, Union
+
+
+class NotificationBatcher:
+    """
+    Collects the keys of devices that changed and flushes them together, each key once per batch.
+
+    By default a batch is everything marked during one event loop iteration, flushed with call_soon. With a
+    'window' the flush waits that long after the latest mark so bursts spread over several reads land in one batch,
+    and 'max_latency' bounds how long the first mark of a batch can be held back.
+    """
+
+    def __init__(self, flush: Callable[[list[Hashable]], None], window: float = 0.0,
+                 max_latency: Optional[float] = None):
+        self._flush_callback = flush
+        self._window = window
+        self._max_latency = max_latency
+        self._dirty: dict[Hashable, None] = {}
+        self._handle: Optional[Union[asyncio.Handle, asyncio.TimerHandle]] = None
+        self._first_marked_at: float = 0.0
+
+        # batch size metrics
+        self.batches = 0
+        self.notifications = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.notifications / self.batches if self.batches else 0.0
+
+    def mark(self, key: Hashable) -> None:
+        loop = asyncio.get_running_loop()
+        if not self._dirty:
+            self._first_marked_at = loop.time()
+        self._dirty[key] = None
+        if self._window <= 0:
+            if self._handle is None:
+                self._handle = loop.call_soon(self._flush)
+            return
+        flush_at = loop.time() + self._window
+        if self._max_latency is not None:
+            flush_at = min(flush_at, self._first_marked_at + self._max_latency)
+        if self._handle is not None:
+            self._handle.cancel()
+        self._handle = loop.call_at(flush_at, self._flush)
+
+    def cancel(self) -> None:
+        """Drop the pending batch without flushing it"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._dirty.clear()
+
+    def _flush(self) -> None:
+        self._handle = None
+        keys = list(self._dirty)
+        self._dirty.clear()
+        if not keys:
+            return
+        self.batches += 1
+        self.notifications += len(keys)
+        self.last_batch_size = len(keys)
+        self.max_batch_size = max(self.max_batch_size, len(keys))
+        self._flush_callback(keys)
@@ -0,0 +1,212 @@
+from __future__ import annotations
+import asyncio
+from dataclasses import dataclass, field as dataclass_field, replace
+import logging
+from typing import Any, Awaitable, Callable, Generic, Optional, TypeVar
+
+from .interfaces import Callback
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds a command may go unconfirmed before its intent is dropped
+DEFAULT_PENDING_TIMEOUT = 10.0
+# How long a caller waits by default for a confirmed command, and how many times the command is sent within that
+DEFAULT_CONFIRM_TIMEOUT = 10.0
+MAX_CONFIRM_ATTEMPTS = 3
+
+_MISSING = object()
+
+R = TypeVar("R")
+
+
+@dataclass(slots=True)
+class _Intent:
+    value: Any
+    expires_at: float
+    accept: Optional[Callable[[Any], bool]] = None
+    # resolved with True when a frame confirms the intent, False when it expires, is discarded or replaced
+    waiters: list[asyncio.Future[bool]] = dataclass_field(default_factory=list)
+
+    def matches(self, reported: Any) -> bool:
+        return self.accept(reported) if self.accept is not None else reported == self.value
+
+    def resolve(self, confirmed: bool) -> None:
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(confirmed)
+        self.waiters.clear()
+
+
+@dataclass(frozen=True, slots=True)
+class CommandResult:
+    """Outcome of a command sent with confirm=True"""
+    confirmed: bool
+    # seconds from the call until a frame showed the requested state, None if it never did
+    latency: Optional[float]
+    attempts: int
+
+    def __bool__(self) -> bool:
+        return self.confirmed
+
+
+class PendingLedger(Generic[R]):
+    """
+    Commands sent to one device that no frame has confirmed yet, as the value each field is expected to take.
+
+    The optimistic view of the device is its last confirmed (frozen dataclass) record with the pending values
+    applied over it. An intent is cleared when a frame shows its value, or when it expires or is given up on, in
+    which case 'on_expired' is called so readers of the optimistic view can refresh. 'on_result' is given the
+    outcome of every until_confirmed() call.
+    """
+
+    def __init__(self, on_expired: Optional[Callback] = None,
+                 on_result: Optional[Callable[[CommandResult], None]] = None):
+        self._intents: dict[str, _Intent] = {}
+        self._on_expired = on_expired
+        self._on_result = on_result
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def __bool__(self) -> bool:
+        return bool(self._intents)
+
+    def get(self, field: str, default: Any = None) -> Any:
+        intent = self._intents.get(field)
+        return default if intent is None else intent.value
+
+    def expect(self, field: str, value: Any, timeout: float = DEFAULT_PENDING_TIMEOUT,
+               accept: Optional[Callable[[Any], bool]] = None) -> None:
+        """
+        Record that a command was sent which should make 'field' become 'value'.
+        'accept' decides whether a reported value confirms it, when that is not simply equality with 'value'.
+        """
+        loop = asyncio.get_running_loop()
+        intent = _Intent(value, loop.time() + timeout, accept)
+        previous = self._intents.get(field)
+        if previous is not None:
+            if previous.value == value:
+                intent.waiters = previous.waiters
+            else:
+                previous.resolve(False)
+        self._intents[field] = intent
+        self._schedule_expiry(loop)
+
+    def wait(self, field: str, value: Any) -> Optional[asyncio.Future[bool]]:
+        """Future for the pending intent setting 'field' to 'value', None if there is no such intent"""
+        intent = self._intents.get(field)
+        if intent is None or intent.value != value:
+            return None
+        waiter: asyncio.Future[bool] = asyncio.get_running_loop().create_future()
+        intent.waiters.append(waiter)
+        return waiter
+
+    def discard(self, field: str, value: Any = _MISSING) -> None:
+        """Forget the intent for 'field' (only if it is still 'value', when given), e.g. because sending failed"""
+        intent = self._intents.get(field)
+        if intent is not None and (value is _MISSING or intent.value == value):
+            del self._intents[field]
+            intent.resolve(False)
+
+    def apply(self, confirmed: R) -> R:
+        """The optimistic view: 'confirmed' with all pending values applied"""
+        if not self._intents:
+            return confirmed
+        return replace(confirmed, **{field: intent.value for field, intent in self._intents.items()})  # type: ignore
+
+    def confirm(self, confirmed: R) -> None:
+        """Clear the intents that the newly received 'confirmed' record shows were applied"""
+        for field in [field for field, intent in self._intents.items() if intent.matches(getattr(confirmed, field))]:
+            self._intents.pop(field).resolve(True)
+        if not self._intents and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _schedule_expiry(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._intents:
+            self._timer = loop.call_at(min(intent.expires_at for intent in self._intents.values()), self._expire)
+
+    def _expire(self) -> None:
+        self._timer = None
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        expired = [field for field, intent in self._intents.items() if intent.expires_at <= now + 0.01]
+        for field in expired:
+            _LOGGER.debug(f"Command setting '{field}' to {self._intents[field].value} was not confirmed in time")
+            self._intents.pop(field).resolve(False)
+        self._schedule_expiry(loop)
+        if expired and self._on_expired:
+            self._on_expired()
+
+    async def until_confirmed(self, field: str, value: Any, send: Callable[[], Awaitable[None]],
+                              reached: Callable[[], bool], timeout: float, response_timeout: Callable[[], float],
+                              on_lost: Optional[Callable[[], None]] = None,
+                              verify: Optional[Callable[[], Awaitable[object]]] = None) -> CommandResult:
+        """
+        Drive 'field' to 'value' and wait until a frame shows it or 'timeout' passes.
+
+        'send' sends the command and records the intent with expect(), 'reached' tells whether the last reported
+        state already shows the command applied. The command is sent again if no frame confirms it within
+        'response_timeout()' (reported through 'on_lost'), up to MAX_CONFIRM_ATTEMPTS times.
+        An intent for 'value' that is already pending is waited on rather than sent again, and the wait fails early
+        if a newer command for the same field replaces it.
+        For commands that aren't idempotent (toggles), 'verify' fetches fresh state before any resend, and the
+        command is only sent again if that state still doesn't show it applied. If fetching fails, the command
+        isn't resent and the call fails, since the command may have been applied.
+        """
+        result = await self._drive(field, value, send, reached, timeout, response_timeout, on_lost, verify)
+        if self._on_result is not None:
+            self._on_result(result)
+        return result
+
+    async def _drive(self, field: str, value: Any, send: Callable[[], Awaitable[None]], reached: Callable[[], bool],
+                     timeout: float, response_timeout: Callable[[], float], on_lost: Optional[Callable[[], None]],
+                     verify: Optional[Callable[[], Awaitable[object]]]) -> CommandResult:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + timeout
+        attempts = 0
+        while True:
+            waiter = self.wait(field, value)
+            if waiter is None:
+                intent = self._intents.get(field)
+                if intent is not None:
+                    # superseded by a command for a different value
+                    return CommandResult(False, None, attempts)
+                if reached():
+                    return CommandResult(True, loop.time() - started, attempts)
+                if attempts >= MAX_CONFIRM_ATTEMPTS or loop.time() >= deadline:
+                    return CommandResult(False, None, attempts)
+                attempts += 1
+                await send()
+                continue
+
+            try:
+                if await asyncio.wait_for(asyncio.shield(waiter), min(response_timeout(), deadline - loop.time())):
+                    return CommandResult(True, loop.time() - started, attempts)
+            except asyncio.TimeoutError:
+                if loop.time() >= deadline or attempts >= MAX_CONFIRM_ATTEMPTS:
+                    self._drop(field, value)
+                    return CommandResult(False, None, attempts)
+                if verify is not None:
+                    # the confirming frame may just be late, so a blind resend could undo the command
+                    try:
+                        await asyncio.wait_for(verify(), max(deadline - loop.time(), 0.0))
+                    except Exception as e:
+                        _LOGGER.debug(f"Could not check whether setting '{field}' to {value} was applied: {e!r}")
+                        self._drop(field, value)
+                        return CommandResult(False, None, attempts)
+                    if (waiter.done() and waiter.result()) or reached():
+                        return CommandResult(True, loop.time() - started, attempts)
+                _LOGGER.debug(f"Command setting '{field}' to {value} was not confirmed, sending it again")
+                if on_lost:
+                    on_lost()
+                # forgetting the intent makes the optimistic state fall back to the reported one before resending
+                self._drop(field, value)
+
+    def _drop(self, field: str, value: Any) -> None:
+        if field in self._intents and self._intents[field].value == value:
+            self.discard(field, value)
+            if self._on_expired:
+                self._on_expired()
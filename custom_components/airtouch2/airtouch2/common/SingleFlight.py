@@ -0,0 +1,35 @@
+from __future__ import annotations
+import asyncio
+from typing import Awaitable, Callable, Generic, Optional, TypeVar
+
+from .interfaces import TaskCreator
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """
+    At most one 'fetch' in flight at a time: callers arriving while one runs share its result (or exception)
+    instead of starting another. Fetches are started with 'task_creator'.
+    """
+
+    def __init__(self, fetch: Callable[[], Awaitable[T]], task_creator: TaskCreator = asyncio.create_task):
+        self._fetch = fetch
+        self._task_creator = task_creator
+        self._running: Optional[asyncio.Future[T]] = None
+
+    @property
+    def in_flight(self) -> bool:
+        return self._running is not None
+
+    async def run(self) -> T:
+        if self._running is None:
+            self._running = self._task_creator(self._run())
+        # shielded so a cancelled caller doesn't abort the fetch for everyone else
+        return await asyncio.shield(self._running)
+
+    async def _run(self) -> T:
+        try:
+            return await self._fetch()
+        finally:
+            self._running = None
@@ -0,0 +1,87 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from time import perf_counter
+from types import TracebackType
+from typing import Optional
+
+
+@dataclass(frozen=True, slots=True)
+class StageStats:
+    """Wall time spent in one stage while the timer was enabled"""
+    count: int
+    total: float
+    max: float
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc: object) -> None:
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("_timer", "_name", "_started")
+
+    def __init__(self, timer: StageTimer, name: str):
+        self._timer = timer
+        self._name = name
+        self._started = 0.0
+
+    def __enter__(self) -> None:
+        self._started = perf_counter()
+
+    def __exit__(self, exc_type: Optional[type[BaseException]], exc: Optional[BaseException],
+                 tb: Optional[TracebackType]) -> None:
+        self._timer._add(self._name, perf_counter() - self._started)
+
+
+class StageTimer:
+    """
+    Wall time spent in the named stages of handling frames (reading, checksum, parsing, dispatch, callbacks).
+
+    Stages are measured with 'with timer.stage(name):' and only while enabled between start() and stop(), otherwise
+    stage() returns a shared no-op so the instrumentation costs one attribute check. Stages may nest, in which case
+    the outer one includes the inner one.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        # name -> [count, total, max]
+        self._stats: dict[str, list[float]] = {}
+
+    def stage(self, name: str) -> _Stage | _NullStage:
+        return _Stage(self, name) if self.enabled else _NULL_STAGE
+
+    def start(self) -> None:
+        """Start measuring from zero"""
+        self._stats = {}
+        self.enabled = True
+
+    def stop(self) -> dict[str, StageStats]:
+        """Stop measuring and return what was measured since start()"""
+        self.enabled = False
+        return self.stats()
+
+    def stats(self) -> dict[str, StageStats]:
+        return {name: StageStats(int(count), total, longest) for name, (count, total, longest) in self._stats.items()}
+
+    def _add(self, name: str, elapsed: float) -> None:
+        stats = self._stats.get(name)
+        if stats is None:
+            self._stats[name] = [1, elapsed, elapsed]
+        else:
+            stats[0] += 1
+            stats[1] += elapsed
+            if elapsed > stats[2]:
+                stats[2] = elapsed
@@ -0,0 +1,82 @@
+from __future__ import annotations
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+from .interfaces import TaskCreator
+
+_LOGGER = logging.getLogger(__name__)
+
+# Polling rate for a while after a local command or an external change, to pick up its effects quickly
+FAST_POLL_INTERVAL = 2.0
+FAST_POLL_WINDOW = 20.0
+# Idle polling starts at the minimum and doubles after every idle poll up to the maximum
+MIN_IDLE_POLL_INTERVAL = 15.0
+MAX_IDLE_POLL_INTERVAL = 300.0
+IDLE_BACKOFF = 2.0
+
+
+class StatePoller:
+    """
+    Requests the controller's full state on an adaptive schedule, on top of whatever it pushes by itself.
+
+    boost() switches to fast polling for FAST_POLL_WINDOW seconds, otherwise the interval backs off exponentially
+    while nothing happens. Requests go through the client's single-flight request_state(), which sends at
+    background priority so polling never delays user commands.
+    """
+
+    def __init__(self, request_state: Callable[[], Awaitable[object]], task_creator: TaskCreator = asyncio.create_task):
+        self._request_state = request_state
+        self._task_creator = task_creator
+        self._task: Optional[asyncio.Task[None]] = None
+        self._wakeup = asyncio.Event()
+        self._fast_until: float = 0.0
+        self._idle_interval = MIN_IDLE_POLL_INTERVAL
+
+        self.polls = 0
+
+    @property
+    def interval(self) -> float:
+        """Seconds until the next poll at the current rate"""
+        if asyncio.get_running_loop().time() < self._fast_until:
+            return FAST_POLL_INTERVAL
+        return self._idle_interval
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = self._task_creator(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def boost(self) -> None:
+        """Poll fast for a while, called after local commands and external changes"""
+        was_fast = asyncio.get_running_loop().time() < self._fast_until
+        self._fast_until = asyncio.get_running_loop().time() + FAST_POLL_WINDOW
+        self._idle_interval = MIN_IDLE_POLL_INTERVAL
+        if not was_fast:
+            # reschedule a long idle wait
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+                continue
+            except asyncio.TimeoutError:
+                pass
+            fast = self.interval == FAST_POLL_INTERVAL
+            try:
+                self.polls += 1
+                await self._request_state()
+            except Exception as e:
+                _LOGGER.debug(f"State poll failed: {e}")
+            if not fast:
+                self._idle_interval = min(self._idle_interval * IDLE_BACKOFF, MAX_IDLE_POLL_INTERVAL)
@@ -0,0 +1,63 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Hashable, Mapping, Optional
+
+
+@dataclass(frozen=True, slots=True)
+class Snapshot:
+    """Device state records as of 'version' (or, from changes_since(), only those changed up to it)"""
+    version: int
+    records: Mapping[Hashable, Any]
+
+
+class StateStore:
+    """
+    Latest state record of every device, versioned so readers can fetch only what changed since they last looked.
+
+    Every put() bumps the store's version and stamps the record with it. Records are kept ordered by the version
+    that last changed them, so changes_since() walks back from the newest and stops at the first one the reader
+    has already seen, costing the number of changes rather than the number of devices.
+    snapshot() is copy-on-write: it shares the current mapping read-only, and the next put() copies it first.
+    """
+
+    def __init__(self) -> None:
+        self.version: int = 0
+        self._values: dict[Hashable, Any] = {}
+        # key -> version that last changed it, oldest first
+        self._versions: dict[Hashable, int] = {}
+        self._shared: Optional[Snapshot] = None
+
+    def put(self, key: Hashable, value: Any) -> int:
+        """Store 'value' as the record for 'key', return the new version"""
+        if self._shared is not None:
+            self._values = dict(self._values)
+            self._shared = None
+        self.version += 1
+        self._values[key] = value
+        # move to the end so the dict stays ordered by version
+        self._versions.pop(key, None)
+        self._versions[key] = self.version
+        return self.version
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        return self._values.get(key, default)
+
+    def record_version(self, key: Hashable) -> int:
+        """Version that last changed 'key', 0 if it has no record"""
+        return self._versions.get(key, 0)
+
+    def snapshot(self) -> Snapshot:
+        """Immutable view of every record at the current version"""
+        if self._shared is None:
+            self._shared = Snapshot(self.version, MappingProxyType(self._values))
+        return self._shared
+
+    def changes_since(self, version: int) -> Snapshot:
+        """The records changed after 'version', and the version to pass next time"""
+        changed: dict[Hashable, Any] = {}
+        for key, record_version in reversed(self._versions.items()):
+            if record_version <= version:
+                break
+            changed[key] = self._values[key]
+        return Snapshot(self.version, MappingProxyType(changed))
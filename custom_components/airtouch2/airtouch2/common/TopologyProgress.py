@@ -0,0 +1,20 @@
+from __future__ import annotations
+from dataclasses import dataclass
+
+# Seconds to wait for the topology to be complete before going ahead with what has been discovered
+DEFAULT_TOPOLOGY_TIMEOUT = 15.0
+
+
+@dataclass(frozen=True, slots=True)
+class TopologyProgress:
+    """How much of a controller's topology (its devices, their names and capabilities) has been discovered"""
+    aircons: int
+    # ACs whose capabilities are known (always all of them on AT2, where capabilities come with the state)
+    aircons_ready: int
+    groups: int
+    groups_named: int
+    complete: bool
+
+    def __str__(self) -> str:
+        return (f"{self.aircons_ready}/{self.aircons} ACs ready, {self.groups_named}/{self.groups} groups named"
+                f"{'' if self.complete else ', incomplete'}")
@@ -0,0 +1,90 @@
+from __future__ import annotations
+import asyncio
+from collections import OrderedDict
+from collections.abc import Iterable
+from dataclasses import replace
+from typing import Hashable, Optional
+
+from .EventBus import Event, EventBus, StateChanged, Topic
+
+# Distinct (topic, device) keys a stream buffers before it starts dropping the oldest
+DEFAULT_STREAM_BUFFER = 64
+
+
+class UpdateStream:
+    """
+    Async iterator over a client's events, for consumers that would rather 'async for' than register callbacks.
+
+    Events are buffered per (topic, device) and conflated: if the consumer falls behind, a newer event replaces the
+    buffered one for the same key, so it sees the newest state of everything rather than every intermediate one.
+    Conflated StateChanged events keep the oldest 'old' and merge the changed fields. The buffer holds at most
+    'maxsize' keys, beyond that the oldest entry is dropped and counted in 'dropped'. Publishing never waits on the
+    consumer.
+    """
+
+    def __init__(self, bus: EventBus, topics: Optional[Iterable[Topic]] = None,
+                 devices: Optional[Iterable[Hashable]] = None, fields: Optional[Iterable[str]] = None,
+                 maxsize: int = DEFAULT_STREAM_BUFFER):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self._devices = frozenset(devices) if devices is not None else None
+        self._fields = frozenset(fields) if fields is not None else None
+        self._maxsize = maxsize
+        self._buffer: OrderedDict[tuple[Topic, Optional[Hashable]], Event] = OrderedDict()
+        self._ready = asyncio.Event()
+        self._closed = False
+
+        # events replaced by a newer one for the same key, and events dropped because the buffer was full
+        self.conflated = 0
+        self.dropped = 0
+
+        # held weakly so a stream that is dropped without being closed unsubscribes itself
+        topics = Topic if topics is None else topics
+        if self._devices is None:
+            self._unsubscribers = [bus.subscribe(topic, self._on_event, weak=True) for topic in topics]
+        else:
+            self._unsubscribers = [bus.subscribe(topic, self._on_event, device, weak=True)
+                                   for topic in topics for device in self._devices]
+
+    def close(self) -> None:
+        """Stop receiving events, iteration ends once the buffered ones are consumed"""
+        if self._closed:
+            return
+        self._closed = True
+        for unsubscribe in self._unsubscribers:
+            unsubscribe()
+        self._unsubscribers.clear()
+        self._ready.set()
+
+    def __aiter__(self) -> UpdateStream:
+        return self
+
+    async def __anext__(self) -> Event:
+        while not self._buffer:
+            if self._closed:
+                raise StopAsyncIteration
+            self._ready.clear()
+            await self._ready.wait()
+        return self._buffer.popitem(last=False)[1]
+
+    async def __aenter__(self) -> UpdateStream:
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def _on_event(self, event: Event) -> None:
+        if self._fields is not None and isinstance(event, StateChanged) and not (event.changed & self._fields):
+            return
+        key = (event.topic, event.device)
+        buffered = self._buffer.get(key)
+        if buffered is not None:
+            if isinstance(buffered, StateChanged) and isinstance(event, StateChanged):
+                event = replace(event, old=buffered.old, changed=buffered.changed | event.changed)
+            self.conflated += 1
+        elif len(self._buffer) >= self._maxsize:
+            self._buffer.popitem(last=False)
+            self.dropped += 1
+        # a conflated event keeps its key's place in the queue
+        self._buffer[key] = event
+        self._ready.set()
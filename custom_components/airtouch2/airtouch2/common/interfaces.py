@@ -4,6 +4,8 @@ from typing import Awaitable, Callable, Coroutine, Optional, Protocol, TypeVar
 
 
 class Serializable(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def to_bytes(self) -> bytes:
         pass
@@ -27,12 +29,3 @@ class Publisher(ABC):
 # to functions that expect containers of interfaces.
 PublisherType = TypeVar("PublisherType", bound=Publisher)
 
-
-def add_callback(callback: Callback, callbacks: list[Callback]) -> Callback:
-    callbacks.append(callback)
-
-    def remove_callback() -> None:
-        if callback in callbacks:
-            callbacks.remove(callback)
-
-    return remove_callback
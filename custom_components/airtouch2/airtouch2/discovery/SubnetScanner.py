@@ -0,0 +1,103 @@
+from __future__ import annotations
+import asyncio
+from ipaddress import IPv4Network, ip_address, ip_network
+import logging
+from typing import Iterable, Optional, Union
+
+from .probe import DEFAULT_PROBE_TIMEOUT, ControllerProtocol, ProbeResult, probe
+
+_LOGGER = logging.getLogger(__name__)
+
+# Hosts probed at once, each probe opens a connection to both protocols' ports
+DEFAULT_SCAN_CONCURRENCY = 32
+# Seconds an address gets to accept a connection, unused addresses never answer so this bounds the scan time
+DEFAULT_CONNECT_TIMEOUT = 0.5
+# Seconds an address that didn't answer is skipped by later scans
+DEFAULT_MISS_TTL = 300.0
+# Largest network scan() accepts (a /22)
+MAX_SCAN_HOSTS = 1022
+
+
+class SubnetScanner:
+    """
+    Finds controllers on a network by probing every host address on both protocols' ports.
+
+    At most 'concurrency' hosts are probed at once and addresses that don't accept a connection within
+    'connect_timeout' are given up on, so a /24 takes a few seconds without flooding the network. Open ports are
+    confirmed with the protocol's own state request. Results are cached to make scans incremental: controllers
+    found before are probed first, and addresses that didn't answer are skipped for 'miss_ttl' seconds.
+    """
+
+    def __init__(self, concurrency: int = DEFAULT_SCAN_CONCURRENCY, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 probe_timeout: float = DEFAULT_PROBE_TIMEOUT, miss_ttl: float = DEFAULT_MISS_TTL):
+        self._concurrency = concurrency
+        self._connect_timeout = connect_timeout
+        self._probe_timeout = probe_timeout
+        self._miss_ttl = miss_ttl
+        self._hits: dict[str, ProbeResult] = {}
+        # host -> loop time it last failed to answer
+        self._misses: dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+        self.scans = 0
+        self.probes = 0
+
+    @property
+    def hits(self) -> list[ProbeResult]:
+        """The controllers found by earlier scans"""
+        return list(self._hits.values())
+
+    async def scan(self, network: Union[str, IPv4Network], full: bool = False) -> list[ProbeResult]:
+        """
+        Probe the host addresses of 'network' (e.g. "192.168.1.0/24") and return the controllers on it.
+        Addresses that recently didn't answer are skipped unless 'full'. Concurrent scans run one after another so
+        the second can use the first's results.
+        """
+        network = ip_network(network, strict=False)
+        if network.num_addresses - 2 > MAX_SCAN_HOSTS:
+            raise ValueError(f"Network {network} is too large to scan, at most {MAX_SCAN_HOSTS} hosts")
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            hosts = [str(address) for address in network.hosts()
+                     if full or now - self._misses.get(str(address), now - self._miss_ttl) >= self._miss_ttl]
+            # controllers found before first, they are the likeliest hits
+            hosts.sort(key=lambda host: host not in self._hits)
+            semaphore = asyncio.Semaphore(self._concurrency)
+
+            async def probe_host(host: str) -> None:
+                async with semaphore:
+                    self.probes += 1
+                    result = await probe(host, self._probe_timeout, self._connect_timeout)
+                if result is None:
+                    self._hits.pop(host, None)
+                    self._misses[host] = loop.time()
+                else:
+                    self._hits[host] = result
+                    self._misses.pop(host, None)
+
+            self.scans += 1
+            await asyncio.gather(*(probe_host(host) for host in hosts))
+            found = [hit for hit in self._hits.values() if ip_address(hit.host) in network]
+            _LOGGER.debug(f"Scanned {len(hosts)} addresses of {network} in {loop.time() - now:.1f}s, "
+                          f"found {len(found)} controllers")
+            return found
+
+    async def find(self, network: Union[str, IPv4Network], protocol: ControllerProtocol, name: Optional[str] = None,
+                   exclude: Iterable[str] = ()) -> Optional[ProbeResult]:
+        """
+        The one controller on 'network' speaking 'protocol' (and reporting 'name', if given), ignoring the hosts in
+        'exclude'. None if there is no such controller or more than one, when it can't be told which is meant.
+        """
+        excluded = set(exclude)
+        candidates = [hit for hit in await self.scan(network) if hit.protocol == protocol and hit.host not in excluded
+                      and (name is None or hit.name == name)]
+        if len(candidates) != 1:
+            _LOGGER.debug(f"Found {len(candidates)} {protocol.value} controllers on {network}")
+            return None
+        return candidates[0]
+
+    def forget(self, host: str) -> None:
+        """Drop what is known about 'host', e.g. after it stopped answering"""
+        self._hits.pop(host, None)
+        self._misses.pop(host, None)
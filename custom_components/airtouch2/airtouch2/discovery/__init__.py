@@ -0,0 +1,2 @@
+from .probe import DEFAULT_PROBE_TIMEOUT, ControllerProtocol, ProbeResult, create_client, probe
+from .SubnetScanner import SubnetScanner
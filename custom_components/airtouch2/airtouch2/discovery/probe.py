@@ -0,0 +1,157 @@
+from __future__ import annotations
+import asyncio
+from dataclasses import dataclass
+from enum import Enum
+import logging
+from typing import Any, Optional, Union
+
+from ..at2 import At2Client
+from ..at2plus import At2PlusClient
+from ..common.Buffer import Buffer
+from ..common.interfaces import TaskCreator
+from ..protocol.at2 import constants as at2_constants
+from ..protocol.at2.constants import MessageLength
+from ..protocol.at2.messages.RequestState import RequestState
+from ..protocol.at2.messages.SystemInfo import SystemInfo
+from ..protocol.at2plus import constants as at2plus_constants
+from ..protocol.at2plus.control_status_common import ControlStatusSubHeader, ControlStatusSubType
+from ..protocol.at2plus.crc16_modbus import crc16
+from ..protocol.at2plus.message_common import HEADER_LENGTH, HEADER_MAGIC, Header, MessageType
+from ..protocol.at2plus.messages.AcStatus import AcStatusMessage
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds for the whole probe of a host: connecting, requesting the state and reading the reply
+DEFAULT_PROBE_TIMEOUT = 3.0
+# Bytes an AT2+ probe may skip looking for a header before giving up on the port
+_MAX_SKIPPED_BYTES = 512
+
+
+class ControllerProtocol(Enum):
+    AT2 = "at2"
+    AT2PLUS = "at2plus"
+
+
+@dataclass(frozen=True, slots=True)
+class ProbeResult:
+    """A controller that answered a probe with a valid state reply"""
+    host: str
+    protocol: ControllerProtocol
+    port: int
+    # number of ACs in the reply
+    aircons: int
+    # seconds from starting the probe to the validated reply
+    latency: float
+    # the system name the controller reports, None if the protocol's state reply doesn't carry one
+    name: Optional[str] = None
+
+
+async def probe(host: str, timeout: float = DEFAULT_PROBE_TIMEOUT,
+                connect_timeout: Optional[float] = None) -> Optional[ProbeResult]:
+    """
+    Find out which protocol the controller at 'host' speaks. Both ports are tried at once, each side connects,
+    requests the state and validates the reply, and the first valid one wins while the other is cancelled.
+    Return None if neither answers validly within 'timeout' seconds. With 'connect_timeout', a port that doesn't
+    accept the connection within that many seconds is given up on early (for scanning addresses that may be unused).
+    """
+    started = asyncio.get_running_loop().time()
+    attempts = {
+        asyncio.create_task(_probe_at2(host, connect_timeout)): ControllerProtocol.AT2,
+        asyncio.create_task(_probe_at2plus(host, connect_timeout)): ControllerProtocol.AT2PLUS,
+    }
+    pending = set(attempts)
+    try:
+        deadline = started + timeout
+        while pending:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.cancelled():
+                    continue
+                error = attempt.exception()
+                if error is not None:
+                    _LOGGER.debug(f"{attempts[attempt].value} probe of {host} failed: {error!r}")
+                    continue
+                port, aircons, name = attempt.result()
+                result = ProbeResult(host, attempts[attempt], port, aircons,
+                                     asyncio.get_running_loop().time() - started, name)
+                _LOGGER.debug(f"Probed {host}: {result}")
+                return result
+        return None
+    finally:
+        for attempt in pending:
+            attempt.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+def create_client(host: str, protocol: ControllerProtocol, task_creator: TaskCreator = asyncio.create_task,
+                  **options: Any) -> Union[At2Client, At2PlusClient]:
+    """
+    A client for the controller at 'host' speaking 'protocol' (e.g. found by probe()), not yet connected.
+    'options' are passed on to the client's constructor.
+    """
+    if protocol == ControllerProtocol.AT2:
+        return At2Client(host, task_creator=task_creator, **options)
+    return At2PlusClient(host, task_creator=task_creator, **options)
+
+
+async def _probe_at2(host: str, connect_timeout: Optional[float]) -> tuple[int, int, Optional[str]]:
+    port = at2_constants.PORT
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), connect_timeout)
+    try:
+        writer.write(RequestState().to_bytes())
+        await writer.drain()
+        system_info = SystemInfo.from_bytes(await reader.readexactly(MessageLength.RESPONSE))
+        if not system_info.aircons_by_id and not system_info.groups_by_id:
+            raise ValueError("Reply describes no ACs or groups")
+        return port, len(system_info.aircons_by_id), system_info.system_name
+    finally:
+        await _close(writer)
+
+
+async def _probe_at2plus(host: str, connect_timeout: Optional[float]) -> tuple[int, int, Optional[str]]:
+    port = at2plus_constants.PORT
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), connect_timeout)
+    try:
+        writer.write(AcStatusMessage([]).to_bytes())
+        await writer.drain()
+        # the reply starts with the two header magic bytes, skip anything before it
+        skipped = 0
+        previous = 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            if previous == HEADER_MAGIC and byte == HEADER_MAGIC:
+                break
+            previous = byte
+            skipped += 1
+            if skipped > _MAX_SKIPPED_BYTES:
+                raise ValueError("No message header found")
+        header_bytes = bytes([HEADER_MAGIC, HEADER_MAGIC]) + await reader.readexactly(HEADER_LENGTH - 2)
+        header = Header.from_bytes(header_bytes)
+        data = await reader.readexactly(header.data_length)
+        checksum = await reader.readexactly(2)
+        if checksum != crc16(header_bytes[2:] + data):
+            raise ValueError("Checksum mismatch")
+        if header.type != MessageType.CONTROL_STATUS:
+            raise ValueError(f"Unexpected reply type {header.type}")
+        buffer = Buffer.from_bytes(data)
+        subheader = ControlStatusSubHeader.from_buffer(buffer)
+        if subheader.sub_type != ControlStatusSubType.AC_STATUS:
+            raise ValueError(f"Unexpected reply subtype {subheader.sub_type}")
+        message = AcStatusMessage.from_bytes(buffer.read_bytes(subheader.subdata_length.total()))
+        return port, len(message.statuses), None
+    finally:
+        await _close(writer)
+
+
+async def _close(writer: asyncio.StreamWriter) -> None:
+    """Close a probe's connection and wait for the transport to close, so it isn't leaked"""
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        # reset by the controller, closed either way
+        pass
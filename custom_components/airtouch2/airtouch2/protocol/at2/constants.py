@@ -1,5 +1,8 @@
 from enum import IntEnum
 
+# TCP port the controller listens on
+PORT = 8899
+
 
 class MessageLength(IntEnum):
     UNDETERMINED = 0
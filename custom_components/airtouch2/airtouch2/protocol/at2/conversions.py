@@ -1,14 +1,14 @@
 
 import logging
 from .constants import OPEN_ISSUE_TEXT
-from typing import Optional
+from typing import Optional, Sequence
 from .enums import ACBrand, ACFanSpeed
 from .lookups import GATEWAYID_BRAND_LOOKUP
 
 _LOGGER = logging.getLogger(__name__)
 
 
-def fan_speed_from_val(supported_speeds: list[ACFanSpeed], speed_val: int) -> ACFanSpeed:
+def fan_speed_from_val(supported_speeds: Sequence[ACFanSpeed], speed_val: int) -> ACFanSpeed:
     if speed_val < 5:
         # Units with no Auto speed still start with low == 1
         if ACFanSpeed.AUTO not in supported_speeds:
@@ -18,7 +18,7 @@ def fan_speed_from_val(supported_speeds: list[ACFanSpeed], speed_val: int) -> AC
         return ACFanSpeed.AUTO
 
 
-def val_from_fan_speed(supported_speeds: list[ACFanSpeed], speed: ACFanSpeed):
+def val_from_fan_speed(supported_speeds: Sequence[ACFanSpeed], speed: ACFanSpeed):
     speed_val = supported_speeds.index(speed)
     # Units with no Auto speed still start with low == 1
     if ACFanSpeed.AUTO not in supported_speeds:
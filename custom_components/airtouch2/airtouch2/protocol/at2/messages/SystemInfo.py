@@ -10,6 +10,8 @@ import time
 from ..constants import OPEN_ISSUE_TEXT, MessageLength, ResponseMessageConstants, ResponseMessageOffsets
 from ..conversions import brand_from_gateway_id, fan_speed_from_val
 from ..enums import ACBrand, ACFanSpeed, ACMode
+from ....common.FlagSet import FlagSet
+from ....common.Metrics import PROTOCOL_METRICS
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -26,6 +28,7 @@ class _LogRateLimiter:
     
     def should_log(self, key: str) -> bool:
         """Check if we should log this error type."""
+        _parse_issues.inc()
         now = time.time()
         last_time = self.last_logged.get(key, 0)
         
@@ -57,6 +60,7 @@ class _LogRateLimiter:
 
 # Global rate limiter instance
 _rate_limiter = _LogRateLimiter()
+_parse_issues = PROTOCOL_METRICS.counter("at2_parse_issues", "Unexpected values found while parsing AT2 frames")
 
 
 def _resolve_brand(gateway_id: int, reported_brand: int) -> ACBrand:
@@ -88,25 +92,25 @@ def _parse_name(name: bytes) -> str:
 #   Gateway IDs 0xFF with 3 speed have no Auto
 # This is based on the app decompiled code
 
+_ALL_FAN_SPEEDS_MASK = FlagSet.from_members(ACFanSpeed, ACFanSpeed).mask
 
-def _supported_fan_speeds(brand: ACBrand, num_supported_speeds: int, gateway_id: int) -> list[ACFanSpeed]:
-    all_speeds: list[ACFanSpeed] = list(ACFanSpeed.__members__.values())
-    supported_speeds: list[ACFanSpeed] = []
 
+def _supported_fan_speeds(brand: ACBrand, num_supported_speeds: int, gateway_id: int) -> FlagSet[ACFanSpeed]:
     if brand == ACBrand.FUJITSU and num_supported_speeds == 4:
-        supported_speeds = all_speeds[:5]
-        return supported_speeds
+        # AUTO, QUIET, LOW, MEDIUM, HIGH
+        return FlagSet(ACFanSpeed, 0b11111)
 
     # Check cases that don't support Auto mode
     if (brand == ACBrand.DAIKIN or (gateway_id == 0xFF and num_supported_speeds == 3) or gateway_id == 0x14):
-        supported_speeds = []
+        mask = 0
     else:
-        supported_speeds = [ACFanSpeed.AUTO]
+        mask = 1 << ACFanSpeed.AUTO
 
     if num_supported_speeds > 2:
-        supported_speeds += all_speeds[2:2+num_supported_speeds]
+        # consecutive speeds from LOW upwards
+        mask |= (((1 << num_supported_speeds) - 1) << ACFanSpeed.LOW) & _ALL_FAN_SPEEDS_MASK
     elif num_supported_speeds == 2:
-        supported_speeds += [ACFanSpeed.LOW, ACFanSpeed.HIGH]
+        mask |= (1 << ACFanSpeed.LOW) | (1 << ACFanSpeed.HIGH)
     elif num_supported_speeds < 2:
         # Rate limit this warning as it can be repetitive
         error_key = f"low_fan_speeds_{brand}_{num_supported_speeds}"
@@ -116,16 +120,16 @@ def _supported_fan_speeds(brand: ACBrand, num_supported_speeds: int, gateway_id:
         else:
             _LOGGER.debug(f"AC reports less than 2 supported fan speeds (suppressed, count: {_rate_limiter.get_count(error_key)})")
 
-    return supported_speeds
+    return FlagSet(ACFanSpeed, mask)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class AcInfo:
     number: int  # 0 or 1
     name: str
     active: bool
     mode: ACMode
-    supported_fan_speeds: list[ACFanSpeed]
+    supported_fan_speeds: FlagSet[ACFanSpeed]
     fan_speed: ACFanSpeed
     set_temp: int
     measured_temp: int
@@ -221,7 +225,7 @@ class AcInfo:
             program, error, ac_error_code, thermistor, turbo, safety, spill)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ZoneInfo:
     active: bool
     spill: bool
@@ -232,7 +236,7 @@ class ZoneInfo:
         return ZoneInfo(zone_status & 0x80 > 0, zone_status & 0x40 > 0, damp)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class GroupInfo:
     name: str
     number: int
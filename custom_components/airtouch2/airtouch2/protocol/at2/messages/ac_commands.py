@@ -1,3 +1,4 @@
+from typing import Sequence
 from ..conversions import val_from_fan_speed
 from ..message_common import add_checksum_message_buffer
 from ..constants import ACCommands, CommandMessageConstants, CommandMessageType, MessageLength
@@ -42,7 +43,7 @@ class ToggleAc(Serializable):
 
 
 class SetFanSpeed(Serializable):
-    def __init__(self, target_ac_number: int, supported_fan_speeds: list[ACFanSpeed], fan_speed: ACFanSpeed):
+    def __init__(self, target_ac_number: int, supported_fan_speeds: Sequence[ACFanSpeed], fan_speed: ACFanSpeed):
         self.target_ac = target_ac_number
         self.fan_speed_val: int = val_from_fan_speed(supported_fan_speeds, fan_speed)
 
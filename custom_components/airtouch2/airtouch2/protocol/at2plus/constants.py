@@ -1,5 +1,8 @@
 from enum import IntEnum
 
+# TCP port the controller listens on
+PORT = 9200
+
 
 class Limits(IntEnum):
     MAX_ACS = 8
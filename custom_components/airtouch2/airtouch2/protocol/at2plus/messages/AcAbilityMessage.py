@@ -5,6 +5,7 @@ from enum import IntEnum
 from ..enums import AcFanSpeed, AcSetMode
 from ..extended_common import EXTENDED_SUBHEADER_LENGTH, ExtendedMessageSubType, ExtendedSubHeader
 from ..message_common import AddressMsgType, Header, MessageType, add_checksum_message_buffer, prime_message_buffer
+from ....common.FlagSet import FlagSet
 from ....common.interfaces import Serializable
 
 
@@ -13,7 +14,7 @@ class AcAbilitySubDataLength(IntEnum):
     V1_1 = 26
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class SetpointLimits:
     min: int
     max: int
@@ -25,7 +26,7 @@ class SetpointLimits:
         """
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class DualSetpointLimits:
     cool: SetpointLimits
     heat: SetpointLimits
@@ -37,14 +38,14 @@ class DualSetpointLimits:
         """
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class AcAbility(Serializable):
     ac_id: int
     name: str
     start_group: int
     group_count: int
-    supported_modes: list[AcSetMode]
-    supported_fan_speeds: list[AcFanSpeed]
+    supported_modes: FlagSet[AcSetMode]
+    supported_fan_speeds: FlagSet[AcFanSpeed]
     setpoint_limits: SetpointLimits | DualSetpointLimits
 
     @staticmethod
@@ -61,16 +62,9 @@ class AcAbility(Serializable):
         name = data[2:18].decode('ascii').split("\x00")[0]
         start_group = data[18]
         group_count = data[19]
-        supported_modes = []
-        for i in range(5):
-            # this loop exploits the fact that the support bits are in the same order as the enum values
-            if (data[20] & (1 << i)) > 0:
-                supported_modes.append(AcSetMode.from_int(i))
-        supported_fan_speeds = []
-        for i in range(7):
-            # ditto
-            if (data[21] & (1 << i)) > 0:
-                supported_fan_speeds.append(AcFanSpeed.from_int(i))
+        # the support bits are in the same order as the enum values, so they are used as the mask directly
+        supported_modes = FlagSet(AcSetMode, data[20] & 0x1F)
+        supported_fan_speeds = FlagSet(AcFanSpeed, data[21] & 0x7F)
 
         set_point_limits = SetpointLimits(data[22], data[23])
         if len(data) == AcAbilitySubDataLength.V1_1:
@@ -82,13 +76,7 @@ class AcAbility(Serializable):
     def to_bytes(self) -> bytes:
         data = bytes([self.ac_id, (AcAbilitySubDataLength.V1_1 - 2) if isinstance(self.setpoint_limits, DualSetpointLimits) else (
             AcAbilitySubDataLength.V1 - 2)]) + self.name.encode("ascii") + bytes(16-len(self.name)) + bytes([self.start_group, self.group_count])
-        supported_modes_val: int = 0
-        for mode in self.supported_modes:
-            supported_modes_val |= 1 << mode
-        supported_speeds_val: int = 0
-        for speed in self.supported_fan_speeds:
-            supported_speeds_val |= 1 << speed
-        data += bytes([supported_modes_val, supported_speeds_val])
+        data += bytes([self.supported_modes.mask, self.supported_fan_speeds.mask])
         if isinstance(self.setpoint_limits, DualSetpointLimits):
             data += bytes([self.setpoint_limits.cool.min, self.setpoint_limits.cool.max,
                           self.setpoint_limits.heat.min, self.setpoint_limits.heat.max])
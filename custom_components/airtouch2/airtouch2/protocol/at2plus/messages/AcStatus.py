@@ -11,7 +11,7 @@ from ....common.interfaces import Serializable
 AC_STATUS_LENGTH = 10
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class AcStatus(Serializable):
     id: int
     power: AcPower
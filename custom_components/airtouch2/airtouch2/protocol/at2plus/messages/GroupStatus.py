@@ -10,7 +10,7 @@ from ..message_common import AddressMsgType, Header, MessageType, add_checksum_m
 GROUP_STATUS_LENGTH = 8
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class GroupStatus(Serializable):
     id: int
     power: GroupPower
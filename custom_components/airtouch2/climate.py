@@ -4,13 +4,14 @@ from __future__ import annotations
 from .airtouch2.at2 import At2Client
 from .Airtouch2ClimateEntity import Airtouch2ClimateEntity
 from .const import DOMAIN
+from .runtime_data import Airtouch2RuntimeData
 
 import logging
 from pprint import pprint
 
 from homeassistant.components.climate import ClimateEntity
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
 _LOGGER = logging.getLogger(__name__)
@@ -22,11 +23,20 @@ async def async_setup_entry(
     async_add_entities: AddEntitiesCallback,
 ) -> None:
     """Set up the Airtouch 2."""
-    data = hass.data[DOMAIN][config_entry.entry_id]
-    airtouch2_client: At2Client = data["client"]
-    entities: list[ClimateEntity] = [
-        Airtouch2ClimateEntity(ac) for ac in airtouch2_client.aircons_by_id.values()
-    ]
-
-    if entities:
-        async_add_entities(entities)
\ No newline at end of file
+    data: Airtouch2RuntimeData = hass.data[DOMAIN][config_entry.entry_id]
+    airtouch2_client: At2Client = data.client
+    added: set[int] = set()
+
+    @callback
+    def add_new_entities() -> None:
+        """Add entities for the ACs that don't have one yet."""
+        entities: list[ClimateEntity] = [
+            Airtouch2ClimateEntity(ac, data) for id, ac in airtouch2_client.aircons_by_id.items() if id not in added
+        ]
+        added.update(airtouch2_client.aircons_by_id)
+        if entities:
+            async_add_entities(entities)
+
+    # ACs are discovered in the background, possibly after setup
+    add_new_entities()
+    config_entry.async_on_unload(airtouch2_client.add_new_ac_callback(add_new_entities))
@@ -4,37 +4,53 @@ from __future__ import annotations
 import logging
 from typing import Any
 
-from .airtouch2.at2 import At2Client
+from .airtouch2.discovery import probe
 import voluptuous as vol
 
 from homeassistant import config_entries
 from homeassistant.const import CONF_HOST
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.data_entry_flow import FlowResult
 from homeassistant.exceptions import HomeAssistantError
 
-from .const import DOMAIN
+from .const import (
+    CONF_DAMPER_DEADBAND,
+    CONF_MIN_WRITE_INTERVAL,
+    CONF_OFFLOAD_SLOW_CALLBACKS,
+    CONF_PROTOCOL,
+    CONF_SYSTEM_NAME,
+    CONF_TEMPERATURE_DEADBAND,
+    DEFAULT_DAMPER_DEADBAND,
+    DEFAULT_MIN_WRITE_INTERVAL,
+    DEFAULT_OFFLOAD_SLOW_CALLBACKS,
+    DEFAULT_TEMPERATURE_DEADBAND,
+    DOMAIN,
+    SUPPORTED_PROTOCOLS,
+)
+from .scanner import async_get_scanner, async_local_network
 
 _LOGGER = logging.getLogger(__name__)
 
-STEP_USER_DATA_SCHEMA = vol.Schema({vol.Required(CONF_HOST): str})
+# the host is left empty to search the local network
+STEP_USER_DATA_SCHEMA = vol.Schema({vol.Optional(CONF_HOST): str})
 
 async def validate_input(hass: HomeAssistant, data: dict[str, Any]) -> dict[str, Any]:
     """Validate the user input allows us to connect."""
-    client = At2Client(data[CONF_HOST])
-
-    if not await client.connect():
+    # one state request on both protocols' ports at once, rather than a full discovery
+    result = await probe(data[CONF_HOST])
+    if result is None:
         raise CannotConnect
-
-    client.run()
-
-    await client.wait_for_ac()
-    if not client.aircons_by_id:
+    if result.protocol not in SUPPORTED_PROTOCOLS:
+        raise UnsupportedProtocol
+    if not result.aircons:
         raise NoUnits
 
-    await client.stop()
     # Return info that you want to store in the config entry.
-    return {"title": "Airtouch 2 Control System"}
+    return {
+        "title": "Airtouch 2 Control System",
+        CONF_PROTOCOL: result.protocol.value,
+        CONF_SYSTEM_NAME: result.name,
+    }
 
 
 class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
@@ -42,6 +58,11 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
     VERSION = 1
 
+    def __init__(self) -> None:
+        """Initialize the config flow."""
+        # host -> label of the controllers found by a scan
+        self._found: dict[str, str] = {}
+
     async def async_step_user(
         self, user_input: dict[str, Any] | None = None
     ) -> FlowResult:
@@ -50,7 +71,41 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             return self.async_show_form(
                 step_id="user", data_schema=STEP_USER_DATA_SCHEMA
             )
+        if not user_input.get(CONF_HOST):
+            return await self.async_step_scan()
+        return await self._async_create_from_host(user_input, "user", STEP_USER_DATA_SCHEMA)
+
+    async def async_step_scan(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Search the local network for controllers."""
+        network = await async_local_network(self.hass)
+        configured = {entry.data[CONF_HOST] for entry in self._async_current_entries()}
+        found = [] if network is None else await async_get_scanner(self.hass).scan(network)
+        self._found = {
+            result.host: f"{result.name or 'AirTouch 2'} ({result.host})"
+            for result in found
+            if result.protocol in SUPPORTED_PROTOCOLS and result.host not in configured
+        }
+        if not self._found:
+            return self.async_show_form(
+                step_id="user", data_schema=STEP_USER_DATA_SCHEMA, errors={"base": "nothing_found"}
+            )
+        return await self.async_step_pick()
+
+    async def async_step_pick(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Choose one of the controllers found by a scan."""
+        schema = vol.Schema({vol.Required(CONF_HOST): vol.In(self._found)})
+        if user_input is None:
+            return self.async_show_form(step_id="pick", data_schema=schema)
+        return await self._async_create_from_host(user_input, "pick", schema)
 
+    async def _async_create_from_host(
+        self, user_input: dict[str, Any], step_id: str, schema: vol.Schema
+    ) -> FlowResult:
+        """Validate the chosen host and create the entry, or show the step again with the error."""
         errors = {}
 
         try:
@@ -59,14 +114,66 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             errors["base"] = "cannot_connect"
         except NoUnits:
             errors["base"] = "no_units"
+        except UnsupportedProtocol:
+            errors["base"] = "unsupported_protocol"
         except Exception:  # pylint: disable=broad-except
             _LOGGER.exception("Unexpected exception")
             errors["base"] = "unknown"
         else:
-            return self.async_create_entry(title=info["title"], data=user_input)
+            return self.async_create_entry(
+                title=info["title"],
+                data={
+                    **user_input,
+                    CONF_PROTOCOL: info[CONF_PROTOCOL],
+                    CONF_SYSTEM_NAME: info[CONF_SYSTEM_NAME],
+                },
+            )
+
+        return self.async_show_form(step_id=step_id, data_schema=schema, errors=errors)
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(
+        config_entry: config_entries.ConfigEntry,
+    ) -> OptionsFlowHandler:
+        """Get the options flow for this handler."""
+        return OptionsFlowHandler()
+
 
+class OptionsFlowHandler(config_entries.OptionsFlow):
+    """Handle the write throttling and callback offloading options."""
+
+    async def async_step_init(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Manage the options."""
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+
+        # config_entry is a property HA provides for the entry being configured
+        options = self.config_entry.options
         return self.async_show_form(
-            step_id="user", data_schema=STEP_USER_DATA_SCHEMA, errors=errors
+            step_id="init",
+            data_schema=vol.Schema(
+                {
+                    vol.Required(
+                        CONF_TEMPERATURE_DEADBAND,
+                        default=options.get(CONF_TEMPERATURE_DEADBAND, DEFAULT_TEMPERATURE_DEADBAND),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0, max=5)),
+                    vol.Required(
+                        CONF_DAMPER_DEADBAND,
+                        default=options.get(CONF_DAMPER_DEADBAND, DEFAULT_DAMPER_DEADBAND),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=0, max=50)),
+                    vol.Required(
+                        CONF_MIN_WRITE_INTERVAL,
+                        default=options.get(CONF_MIN_WRITE_INTERVAL, DEFAULT_MIN_WRITE_INTERVAL),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=0, max=600)),
+                    vol.Required(
+                        CONF_OFFLOAD_SLOW_CALLBACKS,
+                        default=options.get(CONF_OFFLOAD_SLOW_CALLBACKS, DEFAULT_OFFLOAD_SLOW_CALLBACKS),
+                    ): bool,
+                }
+            ),
         )
 
 
@@ -75,4 +182,8 @@ class CannotConnect(HomeAssistantError):
 
 
 class NoUnits(HomeAssistantError):
-    """Error to indicate there are no AC units found."""
\ No newline at end of file
+    """Error to indicate there are no AC units found."""
+
+
+class UnsupportedProtocol(HomeAssistantError):
+    """Error to indicate the controller speaks a protocol the platforms have no entities for."""
\ No newline at end of file
@@ -4,7 +4,7 @@ from __future__ import annotations
 import asyncio
 import logging
 from datetime import datetime, timedelta
-from typing import Callable, Optional
+from typing import Awaitable, Callable, Optional
 
 from .airtouch2.at2 import At2Client
 from homeassistant.core import HomeAssistant
@@ -21,13 +21,16 @@ class AirTouch2ConnectionMonitor:
         hass: HomeAssistant, 
         client: At2Client, 
         host: str,
-        reconnect_callback: Optional[Callable[[], None]] = None
+        reconnect_callback: Optional[Callable[[], None]] = None,
+        unreachable_callback: Optional[Callable[[], Awaitable[None]]] = None
     ) -> None:
         """Initialize the connection monitor."""
         self.hass = hass
         self.client = client
         self.host = host
         self.reconnect_callback = reconnect_callback
+        # called when reconnecting failed, e.g. to look for the controller at another address
+        self.unreachable_callback = unreachable_callback
         self._last_update = dt_util.utcnow()
         self._monitoring = False
         self._reconnecting = False
@@ -96,8 +99,8 @@ class AirTouch2ConnectionMonitor:
                     _LOGGER.debug("No updates for %s, requesting status (attempt %d)", 
                                 time_since_update, self._status_request_count + 1)
                     try:
-                        from .airtouch2.protocol.at2.messages.RequestState import RequestState
-                        await self.client.send(RequestState())
+                        # shares any state request already in flight rather than sending another
+                        await self.client.request_state()
                         self._status_request_count += 1
                     except Exception as err:
                         _LOGGER.debug("Failed to send status request: %s", err)
@@ -146,7 +149,7 @@ class AirTouch2ConnectionMonitor:
                         self._hook_client_updates()
                         
                         self.client.run()
-                        await self.client.wait_for_ac(timeout=15)  # Longer timeout
+                        await self.client.wait_for_topology()
                         self.update_last_seen()
                         self._status_request_count = 0  # Reset counter after successful reconnection
                         
@@ -169,6 +172,8 @@ class AirTouch2ConnectionMonitor:
                         await asyncio.sleep(2 * (attempt + 1))  # Exponential backoff
             
             _LOGGER.error("All reconnection attempts failed, will retry later")
+            if self.unreachable_callback:
+                await self.unreachable_callback()
                 
         except Exception as err:
             _LOGGER.error("Error during AirTouch2 reconnection: %s", err)
@@ -186,32 +191,8 @@ class AirTouch2ConnectionMonitor:
     
     async def _force_entity_updates(self) -> None:
         """Force all entities to update their state."""
-        try:
-            # Trigger callbacks for all ACs and groups to update their entities
-            for ac in self.client.aircons_by_id.values():
-                try:
-                    for callback in ac._callbacks:
-                        try:
-                            callback()
-                        except Exception as err:
-                            _LOGGER.debug("Error calling AC callback: %s", err)
-                except AttributeError:
-                    # AC might not have _callbacks attribute
-                    pass
-            
-            for group in self.client.groups_by_id.values():
-                try:
-                    for callback in group._callbacks:
-                        try:
-                            callback()
-                        except Exception as err:
-                            _LOGGER.debug("Error calling group callback: %s", err)
-                except AttributeError:
-                    # Group might not have _callbacks attribute
-                    pass
-                        
-        except Exception as err:
-            _LOGGER.debug("Error forcing entity updates: %s", err)
+        # subscriber errors are isolated and logged by the client's event bus
+        self.client.republish_state()
     
     def _hook_client_updates(self) -> None:
         """Hook into client's message handling to track updates."""
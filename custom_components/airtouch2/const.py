@@ -1,3 +1,26 @@
 """Constants for the AirTouch2 integration."""
+from .airtouch2.discovery import ControllerProtocol
 
-DOMAIN = "airtouch2"
\ No newline at end of file
+DOMAIN = "airtouch2"
+
+# Config entry data: the controller protocol found by the config flow's probe ("at2" or "at2plus")
+CONF_PROTOCOL = "protocol"
+# Protocols the platforms have entities for, the config flow rejects controllers speaking any other
+SUPPORTED_PROTOCOLS = frozenset({ControllerProtocol.AT2})
+# Config entry data: the system name the controller reported, to recognise it if its address changes
+CONF_SYSTEM_NAME = "system_name"
+
+# Options limiting how often volatile readings (measured temperature, damper position) are written to HA.
+# A reading is written straight away only if it moved by more than its deadband, and no more often than the
+# minimum write interval. Smaller moves are held back and written at most every DEADBAND_FLUSH_INTERVAL seconds.
+CONF_TEMPERATURE_DEADBAND = "temperature_deadband"
+CONF_DAMPER_DEADBAND = "damper_deadband"
+CONF_MIN_WRITE_INTERVAL = "min_write_interval"
+DEFAULT_TEMPERATURE_DEADBAND = 0.5
+DEFAULT_DAMPER_DEADBAND = 0
+DEFAULT_MIN_WRITE_INTERVAL = 30
+DEADBAND_FLUSH_INTERVAL = 300.0
+
+# Option moving entity callbacks that repeatedly take too long off the path that decodes frames, onto a queue
+CONF_OFFLOAD_SLOW_CALLBACKS = "offload_slow_callbacks"
+DEFAULT_OFFLOAD_SLOW_CALLBACKS = False
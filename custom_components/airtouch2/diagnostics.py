@@ -0,0 +1,60 @@
+"""Diagnostics support for the AirTouch2 integration."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_HOST
+from homeassistant.core import HomeAssistant
+
+from .airtouch2.common.Metrics import PROTOCOL_METRICS
+from .const import DOMAIN
+from .runtime_data import Airtouch2RuntimeData
+
+TO_REDACT = {CONF_HOST}
+# Slowest subscribers included, the rest are usually idle
+SUBSCRIBERS_SHOWN = 20
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry, including the last raw frames exchanged with the controller."""
+    data: Airtouch2RuntimeData = hass.data[DOMAIN][entry.entry_id]
+    client = data.client
+    return {
+        "entry": async_redact_data(entry.as_dict(), TO_REDACT),
+        "connected": client.connected,
+        "topology": str(client.topology_progress),
+        # AT2 devices, whose state is 'info'. AT2+ devices keep theirs in 'status', but SUPPORTED_PROTOCOLS keeps
+        # AT2+ controllers from being set up
+        "aircons": {id: repr(ac.info) for id, ac in client.aircons_by_id.items()},
+        "groups": {id: repr(group.info) for id, group in client.groups_by_id.items()},
+        "scheduler": {
+            "latency": client.scheduler.latency,
+            "error_rate": client.scheduler.error_rate,
+            "queue_depth": client.scheduler.queue_depth,
+        },
+        "notifications": {
+            "batches": client.notifications.batches,
+            "mean_batch_size": client.notifications.mean_batch_size,
+        },
+        "polls": client.poller.polls,
+        "subscribers": [
+            {
+                "name": stats.name,
+                "topic": stats.topic.value,
+                "device": str(stats.device),
+                "calls": stats.calls,
+                "total": stats.total,
+                "max": stats.max,
+                "slow_calls": stats.slow_calls,
+                "offloaded": stats.offloaded,
+            }
+            for stats in client.events.subscriber_stats()[:SUBSCRIBERS_SHOWN]
+        ],
+        "metrics": client.metrics.snapshot(),
+        "protocol_metrics": PROTOCOL_METRICS.snapshot(),
+        "flight_recorder": client.recorder.as_dict(),
+    }
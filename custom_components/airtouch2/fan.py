@@ -6,11 +6,12 @@ from pprint import pprint
 from .airtouch2.at2 import At2Client
 from .Airtouch2GroupEntity import AirTouch2GroupEntity
 from .const import DOMAIN
+from .runtime_data import Airtouch2RuntimeData
 
 
 from homeassistant.components.fan import FanEntity
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
 _LOGGER = logging.getLogger(__name__)
@@ -23,11 +24,20 @@ async def async_setup_entry(
 ) -> None:
     """Set up the AirTouch 2 group entities."""
     _LOGGER.debug("Setting up AirTouch 2 group entities")
-    data = hass.data[DOMAIN][config_entry.entry_id]
-    airtouch2_client: At2Client = data["client"]
-    entities: list[FanEntity] = [
-        AirTouch2GroupEntity(group) for group in airtouch2_client.groups_by_id.values()
-    ]
-
-    if entities:
-        async_add_entities(entities)
\ No newline at end of file
+    data: Airtouch2RuntimeData = hass.data[DOMAIN][config_entry.entry_id]
+    airtouch2_client: At2Client = data.client
+    added: set[int] = set()
+
+    @callback
+    def add_new_entities() -> None:
+        """Add entities for the groups that don't have one yet."""
+        entities: list[FanEntity] = [
+            AirTouch2GroupEntity(group, data) for id, group in airtouch2_client.groups_by_id.items() if id not in added
+        ]
+        added.update(airtouch2_client.groups_by_id)
+        if entities:
+            async_add_entities(entities)
+
+    # groups are discovered in the background, possibly after setup
+    add_new_entities()
+    config_entry.async_on_unload(airtouch2_client.add_new_group_callback(add_new_entities))
@@ -0,0 +1,140 @@
+"""On-demand profiling of the AirTouch2 integration, for the airtouch2.profile service."""
+from __future__ import annotations
+
+import asyncio
+import cProfile
+from io import StringIO
+import logging
+import os
+import pstats
+import re
+import time
+from typing import Optional
+
+from .airtouch2.common.Metrics import Histogram
+from .airtouch2.common.StageTimer import StageStats
+from .const import DOMAIN
+from .runtime_data import Airtouch2RuntimeData
+
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_SECONDS = 30
+MAX_PROFILE_SECONDS = 600
+# How often the loop lag probe wakes up, and the buckets (seconds late) its samples are counted in
+LOOP_LAG_INTERVAL = 0.05
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+# Functions listed in each section of the report
+REPORT_TOP_FUNCTIONS = 40
+
+DATA_PROFILING = f"{DOMAIN}_profiling"
+
+# functions whose file is under this directory are the integration's own
+_INTEGRATION_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+async def async_profile(hass: HomeAssistant, seconds: float, loop_lag: bool) -> str:
+    """
+    Profile the event loop thread, where all of the integration's tasks and callbacks run, for 'seconds' and write
+    a report to the config directory. Return the report's path.
+
+    cProfile sees everything on the loop, so the report lists the integration's own functions first and the whole
+    loop after, along with each client's per-stage frame handling times and optionally how late the loop ran.
+    """
+    if hass.data.get(DATA_PROFILING):
+        raise HomeAssistantError("An AirTouch2 profile is already running")
+    hass.data[DATA_PROFILING] = True
+    clients = {
+        entry_id: data.client
+        for entry_id, data in hass.data.get(DOMAIN, {}).items()
+        if isinstance(data, Airtouch2RuntimeData)
+    }
+    lag = Histogram("loop_lag", LOOP_LAG_BUCKETS)
+    lag_task: Optional[asyncio.Task[None]] = None
+    profiler = cProfile.Profile()
+    try:
+        try:
+            profiler.enable()
+        except ValueError as err:
+            # another profiler is active on the loop thread
+            raise HomeAssistantError(f"Could not start profiling: {err}") from err
+        for client in clients.values():
+            client.stages.start()
+        if loop_lag:
+            lag_task = hass.async_create_task(_async_measure_lag(lag))
+        started = time.monotonic()
+        await asyncio.sleep(seconds)
+        elapsed = time.monotonic() - started
+    finally:
+        profiler.disable()
+        stages = {entry_id: client.stages.stop() for entry_id, client in clients.items()}
+        if lag_task is not None:
+            lag_task.cancel()
+        hass.data[DATA_PROFILING] = False
+
+    path = hass.config.path(f"{DOMAIN}_profile_{time.strftime('%Y%m%d_%H%M%S')}.txt")
+    await hass.async_add_executor_job(
+        _write_report, path, profiler, elapsed, stages, lag if loop_lag else None
+    )
+    _LOGGER.info("AirTouch2 profile written to %s", path)
+    return path
+
+
+async def _async_measure_lag(lag: Histogram) -> None:
+    """Count how late each wakeup of a periodic sleep is, which is time the loop was busy with something else."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag.observe(max(loop.time() - expected, 0.0))
+
+
+def _write_report(
+    path: str,
+    profiler: cProfile.Profile,
+    elapsed: float,
+    stages: dict[str, dict[str, StageStats]],
+    lag: Optional[Histogram],
+) -> None:
+    """Write the profile report, in the executor since sorting the stats and writing the file block."""
+    out = StringIO()
+    out.write(f"AirTouch2 profile of {elapsed:.1f}s of event loop time\n\n")
+
+    out.write("Frame handling stages (wall time, read includes waiting for the controller, dispatch includes the\n")
+    out.write("callbacks made while dispatching)\n")
+    for entry_id, entry_stages in stages.items():
+        out.write(f"  Entry {entry_id}\n")
+        if not entry_stages:
+            out.write("    no frames handled\n")
+        for name, stats in sorted(entry_stages.items(), key=lambda item: -item[1].total):
+            out.write(
+                f"    {name:<10} {stats.count:>8} calls {stats.total * 1000:>10.1f}ms total "
+                f"{stats.mean * 1000:>8.3f}ms mean {stats.max * 1000:>8.3f}ms max\n"
+            )
+    out.write("\n")
+
+    if lag is not None:
+        out.write("Event loop lag\n")
+        if lag.count:
+            out.write(
+                f"  {lag.count} samples, mean {lag.mean * 1000:.1f}ms, p50 <= {lag.quantile(0.5) * 1000:.0f}ms, "
+                f"p99 <= {lag.quantile(0.99) * 1000:.0f}ms, over {LOOP_LAG_BUCKETS[-1] * 1000:.0f}ms: {lag.counts[-1]}\n"
+            )
+        else:
+            out.write("  no samples\n")
+        out.write("\n")
+
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE)
+    out.write("Integration functions by cumulative time\n")
+    stats.print_stats(re.escape(_INTEGRATION_DIR), REPORT_TOP_FUNCTIONS)
+    stats.sort_stats(pstats.SortKey.TIME)
+    out.write("Integration functions by own time\n")
+    stats.print_stats(re.escape(_INTEGRATION_DIR), REPORT_TOP_FUNCTIONS)
+    out.write("All functions on the event loop by own time\n")
+    stats.print_stats(REPORT_TOP_FUNCTIONS)
+
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(out.getvalue())
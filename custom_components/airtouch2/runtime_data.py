@@ -0,0 +1,19 @@
+"""Per config entry runtime data for the AirTouch2 integration."""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from .airtouch2.at2 import At2Client
+from .connection_monitor import AirTouch2ConnectionMonitor
+from .write_throttle import WriteThrottleSettings
+
+
+@dataclass(slots=True)
+class Airtouch2RuntimeData:
+    """What a config entry's platforms and services need, stored in hass.data[DOMAIN][entry_id]."""
+
+    # only AT2 controllers are in SUPPORTED_PROTOCOLS, the platforms and diagnostics use AT2 devices
+    client: At2Client
+    monitor: AirTouch2ConnectionMonitor
+    host: str
+    write_throttle: WriteThrottleSettings
@@ -0,0 +1,36 @@
+"""Controller scanning shared by the config flow and host recovery."""
+from __future__ import annotations
+
+from ipaddress import IPv4Network, ip_network
+import logging
+
+from .airtouch2.discovery import SubnetScanner
+
+from homeassistant.components import network
+from homeassistant.core import HomeAssistant, callback
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_SCANNER = f"{DOMAIN}_scanner"
+# Prefix length assumed for the network HA is on
+LOCAL_PREFIX_LENGTH = 24
+
+
+@callback
+def async_get_scanner(hass: HomeAssistant) -> SubnetScanner:
+    """Return the scanner, shared so scans reuse each other's results."""
+    if DATA_SCANNER not in hass.data:
+        hass.data[DATA_SCANNER] = SubnetScanner()
+    return hass.data[DATA_SCANNER]
+
+
+async def async_local_network(hass: HomeAssistant) -> IPv4Network | None:
+    """Return the network HA is on, None if it can't be determined."""
+    try:
+        source_ip = await network.async_get_source_ip(hass)
+    except Exception as err:  # pylint: disable=broad-except
+        _LOGGER.debug("Could not determine the local network: %s", err)
+        return None
+    return ip_network(f"{source_ip}/{LOCAL_PREFIX_LENGTH}", strict=False)
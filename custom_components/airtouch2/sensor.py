@@ -0,0 +1,119 @@
+"""Link quality sensors for the AirTouch 2 controller."""
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import timedelta
+import logging
+from typing import Callable, Optional
+
+from .airtouch2.at2 import At2Client
+from .airtouch2.common.Metrics import Counter, Histogram, MetricsRegistry
+from .const import DOMAIN
+from .runtime_data import Airtouch2RuntimeData
+
+from homeassistant.components.sensor import SensorEntity, SensorStateClass
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import PERCENTAGE, EntityCategory, UnitOfTime
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+_LOGGER = logging.getLogger(__name__)
+
+# The metrics are cheap to read, polling keeps the sensors from writing state on every frame
+SCAN_INTERVAL = timedelta(seconds=30)
+
+
+def _total(*names: str) -> Callable[[MetricsRegistry], Optional[float]]:
+    """Sum of the named counters, those a client doesn't have count as 0"""
+    def read(metrics: MetricsRegistry) -> Optional[float]:
+        return sum(metric.value for name in names if isinstance(metric := metrics.get(name), Counter))
+    return read
+
+
+def _gauge(name: str, scale: float = 1.0) -> Callable[[MetricsRegistry], Optional[float]]:
+    def read(metrics: MetricsRegistry) -> Optional[float]:
+        metric = metrics.get(name)
+        value = None if metric is None else metric.value
+        return None if value is None else round(value * scale, 3)
+    return read
+
+
+def _quantile(name: str, q: float) -> Callable[[MetricsRegistry], Optional[float]]:
+    def read(metrics: MetricsRegistry) -> Optional[float]:
+        metric = metrics.get(name)
+        return metric.quantile(q) if isinstance(metric, Histogram) else None
+    return read
+
+
+@dataclass(frozen=True, slots=True)
+class _LinkSensor:
+    key: str
+    name: str
+    value: Callable[[MetricsRegistry], Optional[float]]
+    unit: Optional[str] = None
+    state_class: SensorStateClass = SensorStateClass.MEASUREMENT
+    # report the change per minute of 'value' rather than 'value' itself
+    per_minute: bool = False
+
+
+_SENSORS = (
+    _LinkSensor("frame_rate", "Frames received", _total("frames_received"), "frames/min", per_minute=True),
+    _LinkSensor("bad_frames", "Bad frames", _total("parse_errors", "checksum_failures"), "frames",
+                SensorStateClass.TOTAL_INCREASING),
+    _LinkSensor("resyncs", "Resyncs", _total("resyncs"), None, SensorStateClass.TOTAL_INCREASING),
+    _LinkSensor("reconnects", "Reconnects", _total("connection_losses"), None, SensorStateClass.TOTAL_INCREASING),
+    _LinkSensor("queue_depth", "Send queue depth", _gauge("queue_depth"), "messages"),
+    _LinkSensor("response_latency", "Response latency", _gauge("response_latency"), UnitOfTime.SECONDS),
+    _LinkSensor("error_rate", "Link error rate", _gauge("error_rate", 100.0), PERCENTAGE),
+    _LinkSensor("confirm_latency_p90", "Command confirmation time (p90)", _quantile("confirm_latency", 0.9),
+                UnitOfTime.SECONDS),
+)
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up the AirTouch 2 link quality sensors."""
+    data: Airtouch2RuntimeData = hass.data[DOMAIN][config_entry.entry_id]
+    async_add_entities(
+        [AirTouch2LinkSensor(data.client, config_entry, description) for description in _SENSORS], True
+    )
+
+
+class AirTouch2LinkSensor(SensorEntity):
+    """A diagnostic sensor reading one of the client's link metrics."""
+
+    _attr_should_poll: bool = True
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, client: At2Client, config_entry: ConfigEntry, description: _LinkSensor) -> None:
+        """Initialize the sensor."""
+        self._metrics = client.metrics
+        self._description = description
+        self._attr_unique_id = f"at2_{config_entry.entry_id}_{description.key}"
+        self._attr_name = f"AirTouch 2 {description.name}"
+        self._attr_native_unit_of_measurement = description.unit
+        self._attr_state_class = description.state_class
+        self._attr_device_info = DeviceInfo(
+            identifiers={(DOMAIN, f"at2_controller_{config_entry.entry_id}")},
+            name="AirTouch 2 controller",
+            manufacturer="Polyaire",
+            model="Airtouch 2",
+        )
+        # last reading and when it was taken, for per minute rates
+        self._last: Optional[tuple[float, float]] = None
+
+    async def async_update(self) -> None:
+        """Read the metric."""
+        value = self._description.value(self._metrics)
+        if not self._description.per_minute:
+            self._attr_native_value = value
+            return
+        now = self.hass.loop.time()
+        last, self._last = self._last, ((now, value) if value is not None else None)
+        if value is None or last is None or now <= last[0] or value < last[1]:
+            self._attr_native_value = None
+        else:
+            self._attr_native_value = round((value - last[1]) * 60.0 / (now - last[0]), 1)
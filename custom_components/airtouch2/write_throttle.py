@@ -0,0 +1,114 @@
+"""Throttling of entity state writes for volatile readings."""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from typing import Any
+
+from .const import (
+    CONF_DAMPER_DEADBAND,
+    CONF_MIN_WRITE_INTERVAL,
+    CONF_TEMPERATURE_DEADBAND,
+    DEADBAND_FLUSH_INTERVAL,
+    DEFAULT_DAMPER_DEADBAND,
+    DEFAULT_MIN_WRITE_INTERVAL,
+    DEFAULT_TEMPERATURE_DEADBAND,
+)
+
+
+@dataclass(frozen=True, slots=True)
+class WriteThrottleSettings:
+    """The config entry's write throttling options."""
+
+    temperature_deadband: float = DEFAULT_TEMPERATURE_DEADBAND
+    damper_deadband: float = DEFAULT_DAMPER_DEADBAND
+    min_write_interval: float = DEFAULT_MIN_WRITE_INTERVAL
+
+    @staticmethod
+    def from_options(options: Mapping[str, Any]) -> WriteThrottleSettings:
+        """Build the settings from config entry options, defaulting the missing ones."""
+        return WriteThrottleSettings(
+            float(options.get(CONF_TEMPERATURE_DEADBAND, DEFAULT_TEMPERATURE_DEADBAND)),
+            float(options.get(CONF_DAMPER_DEADBAND, DEFAULT_DAMPER_DEADBAND)),
+            float(options.get(CONF_MIN_WRITE_INTERVAL, DEFAULT_MIN_WRITE_INTERVAL)),
+        )
+
+
+class StateWriteThrottle:
+    """
+    Decides when an entity writes its state, given the visible state as a dict of field values.
+
+    Fields with a deadband are volatile readings. A change to any other field is written straight away. A change
+    to volatile fields only is written straight away if it moved one of them by more than its deadband and the
+    last write was at least 'min_interval' ago. Otherwise a trailing flush writes the latest state later: after
+    'min_interval' for moves beyond the deadband, after DEADBAND_FLUSH_INTERVAL for moves within it, so flapping
+    readings are written rarely and the final value is never lost.
+    """
+
+    def __init__(self, write: Callable[[], None], deadbands: Mapping[str, float], min_interval: float) -> None:
+        """Initialize the throttle, 'write' writes the entity's current state."""
+        self._write = write
+        self._deadbands = deadbands
+        self._min_interval = min_interval
+        self._written: dict[str, Any] | None = None
+        self._written_at: float = 0.0
+        self._latest: dict[str, Any] | None = None
+        self._flush: asyncio.TimerHandle | None = None
+
+        self.writes = 0
+        self.suppressed = 0
+
+    def written(self, state: dict[str, Any]) -> None:
+        """Record 'state' as written by HA itself, e.g. when the entity was added."""
+        self._written = state
+        self._written_at = asyncio.get_running_loop().time()
+
+    def update(self, state: dict[str, Any], urgent: bool = False) -> None:
+        """Write 'state' now or later, 'urgent' writes any change straight away (e.g. the effect of a command)."""
+        self._latest = state
+        if state == self._written:
+            self.cancel()
+            return
+        written = self._written
+        if urgent or written is None or any(
+                state.get(field) != written.get(field) for field in state if field not in self._deadbands):
+            self._write_latest()
+            return
+        loop = asyncio.get_running_loop()
+        if self._beyond_deadband(state, written):
+            if loop.time() - self._written_at >= self._min_interval:
+                self._write_latest()
+                return
+            flush_at = self._written_at + self._min_interval
+        else:
+            flush_at = self._written_at + DEADBAND_FLUSH_INTERVAL
+        self.suppressed += 1
+        if self._flush is not None and self._flush.when() <= flush_at:
+            return
+        self.cancel()
+        self._flush = loop.call_at(flush_at, self._write_latest)
+
+    def cancel(self) -> None:
+        """Drop any pending trailing flush."""
+        if self._flush is not None:
+            self._flush.cancel()
+            self._flush = None
+
+    def _beyond_deadband(self, state: dict[str, Any], written: dict[str, Any]) -> bool:
+        for field, deadband in self._deadbands.items():
+            new, old = state.get(field), written.get(field)
+            if new == old:
+                continue
+            if new is None or old is None or abs(new - old) > deadband:
+                return True
+        return False
+
+    def _write_latest(self) -> None:
+        self.cancel()
+        if self._latest is None or self._latest == self._written:
+            return
+        self._written = self._latest
+        self._written_at = asyncio.get_running_loop().time()
+        self.writes += 1
+        self._write()
@@ -0,0 +1,6 @@
+"""Make the protocol library importable as 'airtouch2' without Home Assistant, which the integration needs."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "custom_components", "airtouch2"))
@@ -0,0 +1,71 @@
+import asyncio
+from dataclasses import replace
+
+from airtouch2.at2.At2Aircon import At2Aircon
+from airtouch2.at2.At2Client import At2Client
+from airtouch2.protocol.at2.messages.SystemInfo import AcInfo
+
+
+def make_aircon() -> tuple[At2Client, At2Aircon, list[str]]:
+    """An AC (off, set to 22) on a client whose sends are recorded instead of written"""
+    client = At2Client("127.0.0.1")
+    ac = At2Aircon(client, AcInfo.parse(0, 0x00, 0, 0, 1, 0x32, 22, 21, 2, 0xd, b"LIVING\0\0"))
+    sent: list[str] = []
+
+    async def send(message) -> None:
+        sent.append(type(message).__name__)
+
+    client.scheduler._send = send
+    client.scheduler.record_latency(0.01)
+    return client, ac, sent
+
+
+async def test_set_temp_already_reached_sends_and_expects_nothing():
+    client, ac, sent = make_aircon()
+    updates = []
+    ac.add_callback(lambda: updates.append(True))
+    assert await ac.set_set_temp(ac.info.set_temp) is True
+    result = await ac.set_set_temp(ac.info.set_temp, confirm=True)
+    assert result.confirmed and result.attempts == 0
+    await asyncio.sleep(0.01)
+    assert not ac.pending
+    assert sent == [] and updates == []
+    await client.scheduler.stop()
+
+
+def answer_state_requests(client: At2Client, ac: At2Aircon, sent: list[str], apply_toggles: bool) -> None:
+    """Reply to state requests with the AC's state, applying the toggles sent so far if 'apply_toggles'"""
+
+    async def send(message) -> None:
+        name = type(message).__name__
+        sent.append(name)
+        if name == "RequestState":
+            if apply_toggles:
+                ac.update(replace(ac.info, active=sent.count("ToggleAc") % 2 == 1))
+            for waiter in client._state_waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    client.scheduler._send = send
+
+
+async def test_late_toggle_is_not_sent_twice():
+    client, ac, sent = make_aircon()
+    # the toggle takes effect but no frame shows it until the state is requested
+    answer_state_requests(client, ac, sent, apply_toggles=True)
+    result = await ac.turn_on(confirm=True)
+    assert result.confirmed
+    assert sent.count("ToggleAc") == 1 and "RequestState" in sent
+    assert ac.info.active
+    await client.scheduler.stop()
+
+
+async def test_lost_toggle_is_resent_after_checking_the_state():
+    client, ac, sent = make_aircon()
+    answer_state_requests(client, ac, sent, apply_toggles=False)
+    result = await ac.turn_on(confirm=True, timeout=3.0)
+    assert not result.confirmed
+    assert sent.count("ToggleAc") == result.attempts > 1
+    # every resend was preceded by a state request showing the unit still off
+    assert sent.index("RequestState") < sent.index("ToggleAc", 1)
+    await client.scheduler.stop()
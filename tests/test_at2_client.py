@@ -0,0 +1,16 @@
+import pytest
+
+from airtouch2.at2.At2Client import At2Client
+
+
+async def test_dump_responses_is_a_deprecated_no_op():
+    with pytest.warns(DeprecationWarning):
+        client = At2Client("127.0.0.1", True)
+    with pytest.warns(DeprecationWarning):
+        At2Client("127.0.0.1", dump_responses=False)
+    assert client.recorder.frames() == []
+
+
+async def test_options_after_dump_responses_are_keyword_only():
+    with pytest.raises(TypeError):
+        At2Client("127.0.0.1", None, 16)  # type: ignore[misc]
@@ -0,0 +1,105 @@
+import asyncio
+
+from airtouch2.common.Coalescer import Coalescer
+
+
+class Device:
+    """A device whose confirmed value only changes when a frame reports it"""
+
+    def __init__(self, value: int):
+        self.confirmed = value
+        self.sent: list[int] = []
+        self.coalescer: Coalescer[int] = Coalescer(lambda: self.confirmed, self.apply)
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def apply(self) -> bool:
+        await self.release.wait()
+        self.sent.append(self.coalescer.target)
+        await asyncio.sleep(0)
+        return True
+
+
+async def test_target_already_reached_sends_nothing():
+    device = Device(30)
+    assert not device.coalescer.accepts(30)
+    assert await device.coalescer.set(30)
+    assert device.sent == []
+
+
+async def test_burst_sends_only_the_net_change():
+    device = Device(30)
+    device.release.clear()
+    calls = [asyncio.ensure_future(device.coalescer.set(target)) for target in (40, 50, 60, 70)]
+    await asyncio.sleep(0)
+    device.release.set()
+    assert await asyncio.gather(*calls) == [True] * 4
+    # the first run picks up the newest target when it gets to send
+    assert device.sent == [70]
+
+
+async def test_retarget_while_in_flight_runs_again():
+    device = Device(30)
+    device.release.clear()
+    first = asyncio.ensure_future(device.coalescer.set(40))
+    await asyncio.sleep(0)
+    device.release.set()
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(device.coalescer.set(50))
+    await asyncio.gather(first, second)
+    assert device.sent == [40, 50]
+    assert not device.coalescer.in_flight
+
+
+async def test_revert_before_confirmation_is_sent():
+    device = Device(30)
+    await device.coalescer.set(50)
+    # no frame has confirmed 50 yet, so the confirmed value is still 30
+    assert device.confirmed == 30
+    assert device.coalescer.accepts(30)
+    await device.coalescer.set(30)
+    assert device.sent == [50, 30]
+
+
+async def test_repeat_of_last_sent_target_is_dropped_once_confirmed():
+    device = Device(30)
+    await device.coalescer.set(50)
+    device.confirmed = 50
+    await device.coalescer.set(50)
+    assert device.sent == [50]
+
+
+async def test_cancelled_caller_doesnt_abort_the_change():
+    device = Device(30)
+    device.release.clear()
+    caller = asyncio.ensure_future(device.coalescer.set(40))
+    await asyncio.sleep(0)
+    caller.cancel()
+    device.release.set()
+    await asyncio.sleep(0.01)
+    assert device.sent == [40]
+
+
+async def test_change_made_elsewhere_replaces_the_last_sent_target():
+    device = Device(30)
+    await device.coalescer.set(50)
+    device.confirmed = 50
+    # changed from the wall panel
+    device.confirmed = 40
+    assert not device.coalescer.accepts(40)
+    await device.coalescer.set(40)
+    await device.coalescer.set(50)
+    assert device.sent == [50, 50]
+
+
+async def test_runs_are_started_with_the_task_creator():
+    tasks = []
+
+    def create_task(coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        tasks.append(task)
+        return task
+
+    coalescer: Coalescer[int] = Coalescer(lambda: 30, lambda: asyncio.sleep(0, True), create_task)
+    assert await coalescer.set(40)
+    assert len(tasks) == 1
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from airtouch2.common.CommandScheduler import (MAX_RESPONSE_TIMEOUT, MIN_RESPONSE_TIMEOUT, CommandScheduler,
+                                               Priority)
+from airtouch2.common.interfaces import Serializable
+
+
+class Message(Serializable):
+    def __init__(self, name: str):
+        self.name = name
+
+    def to_bytes(self) -> bytes:
+        return self.name.encode()
+
+
+def make_scheduler() -> tuple[CommandScheduler, list[str]]:
+    sent: list[str] = []
+
+    async def send(message: Message) -> None:
+        sent.append(message.name)
+
+    scheduler = CommandScheduler(send)
+    # keep pacing short
+    scheduler.record_latency(0.01)
+    return scheduler, sent
+
+
+async def test_sends_in_priority_order():
+    scheduler, sent = make_scheduler()
+    await asyncio.gather(
+        scheduler.submit(Message("poll"), Priority.BACKGROUND),
+        scheduler.submit(Message("confirm"), Priority.CONFIRM),
+        scheduler.submit(Message("user"), Priority.USER),
+    )
+    assert sent == ["user", "confirm", "poll"]
+    await scheduler.stop()
+
+
+async def test_never_reorders_messages_for_one_device():
+    scheduler, sent = make_scheduler()
+    await asyncio.gather(
+        scheduler.submit(Message("ac poll"), Priority.BACKGROUND, ("ac", 0)),
+        scheduler.submit(Message("group"), Priority.USER, ("group", 0)),
+        scheduler.submit(Message("ac user"), Priority.USER, ("ac", 0)),
+    )
+    # the AC's poll is promoted to its user command's priority and, being older, goes first
+    assert sent == ["ac poll", "group", "ac user"]
+    await scheduler.stop()
+
+
+async def test_frames_alone_dont_measure_latency():
+    scheduler = CommandScheduler(lambda message: asyncio.sleep(0))
+    await scheduler.submit(Message("a"))
+    scheduler.on_response()
+    assert scheduler.latency is None
+    assert scheduler.response_timeout() == MAX_RESPONSE_TIMEOUT
+    await scheduler.stop()
+
+
+async def test_latency_is_smoothed_and_bounds_the_response_timeout():
+    scheduler = CommandScheduler(lambda message: asyncio.sleep(0))
+    scheduler.record_latency(0.01)
+    assert scheduler.latency == pytest.approx(0.01)
+    assert scheduler.response_timeout() == MIN_RESPONSE_TIMEOUT
+    scheduler.record_latency(10.0)
+    assert 0.01 < scheduler.latency < 10.0
+    assert scheduler.response_timeout() == MAX_RESPONSE_TIMEOUT
+
+
+async def test_errors_stretch_the_interval_and_responses_recover_it():
+    scheduler = CommandScheduler(lambda message: asyncio.sleep(0))
+    base = scheduler.interval(Priority.USER)
+    for _ in range(5):
+        scheduler.on_error()
+    assert scheduler.interval(Priority.USER) > base
+    for _ in range(50):
+        scheduler.on_response()
+    assert scheduler.interval(Priority.USER) == pytest.approx(base, rel=0.01)
+
+
+async def test_stop_fails_queued_messages():
+    release = asyncio.Event()
+
+    async def send(message: Message) -> None:
+        await release.wait()
+
+    scheduler = CommandScheduler(send)
+    first = asyncio.ensure_future(scheduler.submit(Message("first")))
+    second = asyncio.ensure_future(scheduler.submit(Message("second")))
+    await asyncio.sleep(0.01)
+    await scheduler.stop()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    with pytest.raises(RuntimeError):
+        await second
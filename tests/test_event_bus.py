@@ -0,0 +1,137 @@
+import asyncio
+import gc
+import time
+
+from airtouch2.common.EventBus import DeviceUpdated, EventBus, LinkState, Topic
+
+
+class Listener:
+    def __init__(self):
+        self.events = []
+
+    def on_event(self, event) -> None:
+        self.events.append(event)
+
+
+def test_delivers_by_topic_and_device():
+    bus = EventBus()
+    everything, ac0 = Listener(), Listener()
+    bus.subscribe(Topic.DEVICE_UPDATED, everything.on_event)
+    bus.subscribe(Topic.DEVICE_UPDATED, ac0.on_event, ("ac", 0))
+    bus.publish(DeviceUpdated(("ac", 0)))
+    bus.publish(DeviceUpdated(("ac", 1)))
+    bus.publish(LinkState(None, True))
+    assert [event.device for event in everything.events] == [("ac", 0), ("ac", 1)]
+    assert [event.device for event in ac0.events] == [("ac", 0)]
+
+
+def test_exception_in_one_subscriber_doesnt_stop_the_others():
+    bus = EventBus()
+    listener = Listener()
+
+    def broken(event) -> None:
+        raise RuntimeError("boom")
+
+    bus.subscribe(Topic.DEVICE_UPDATED, broken)
+    bus.subscribe(Topic.DEVICE_UPDATED, listener.on_event)
+    bus.publish(DeviceUpdated(None))
+    assert len(listener.events) == 1
+
+
+def test_unsubscribe_only_removes_that_subscription():
+    bus = EventBus()
+    first, second = Listener(), Listener()
+    unsubscribe = bus.subscribe(Topic.DEVICE_UPDATED, first.on_event)
+    bus.subscribe(Topic.DEVICE_UPDATED, second.on_event)
+    unsubscribe()
+    unsubscribe()
+    bus.publish(DeviceUpdated(None))
+    assert first.events == [] and len(second.events) == 1
+
+
+def test_subscriber_may_unsubscribe_while_being_called():
+    bus = EventBus()
+    calls = []
+
+    def once(event) -> None:
+        calls.append(event)
+        unsubscribe()
+
+    unsubscribe = bus.subscribe(Topic.DEVICE_UPDATED, once)
+    bus.publish(DeviceUpdated(None))
+    bus.publish(DeviceUpdated(None))
+    assert len(calls) == 1
+    assert not bus._subscriptions
+
+
+def test_weak_subscription_ends_with_its_owner():
+    bus = EventBus()
+    listener = Listener()
+    bus.subscribe(Topic.DEVICE_UPDATED, listener.on_event, weak=True)
+    bus.publish(DeviceUpdated(None))
+    assert len(listener.events) == 1
+    del listener
+    gc.collect()
+    bus.publish(DeviceUpdated(None))
+    assert not bus._subscriptions
+
+
+def test_subscribers_are_timed():
+    bus = EventBus(slow_threshold=0.01)
+    bus.subscribe(Topic.DEVICE_UPDATED, lambda event: time.sleep(0.02), name="slow")
+    bus.subscribe(Topic.DEVICE_UPDATED, lambda event: None, name="fast")
+    bus.publish(DeviceUpdated(None))
+    stats = {stats.name: stats for stats in bus.subscriber_stats()}
+    assert stats["slow"].calls == 1 and stats["slow"].slow_calls == 1
+    assert stats["fast"].calls == 1 and stats["fast"].slow_calls == 0
+    assert bus.subscriber_stats()[0].name == "slow"
+
+
+async def test_chronically_slow_subscriber_is_offloaded():
+    bus = EventBus(offload_after=2, slow_threshold=0.01)
+    slow_calls, fast_calls = [], []
+    bus.subscribe(Topic.DEVICE_UPDATED, lambda event: (time.sleep(0.02), slow_calls.append(event.device)))
+    bus.subscribe(Topic.DEVICE_UPDATED, lambda event: fast_calls.append(event.device))
+    for device in range(4):
+        bus.publish(DeviceUpdated(device))
+    # the last two were queued rather than delivered inline
+    assert slow_calls == [0, 1] and fast_calls == [0, 1, 2, 3]
+    await asyncio.sleep(0.1)
+    assert slow_calls == [0, 1, 2, 3]
+    assert [stats.offloaded for stats in bus.subscriber_stats()] == [True, False]
+    bus.close()
+
+
+async def test_unsubscribed_offloaded_subscriber_gets_no_queued_events():
+    bus = EventBus(offload_after=1, slow_threshold=0.0)
+    calls = []
+    unsubscribe = bus.subscribe(Topic.DEVICE_UPDATED, calls.append)
+    bus.publish(DeviceUpdated(0))
+    bus.publish(DeviceUpdated(1))
+    unsubscribe()
+    await asyncio.sleep(0.01)
+    assert [event.device for event in calls] == [0]
+    bus.close()
+
+
+def test_subscriber_unsubscribed_during_publish_misses_that_event():
+    bus = EventBus()
+    listener = Listener()
+    unsubscribe_listener = None
+
+    def unsubscribe_other(event) -> None:
+        unsubscribe_listener()
+
+    bus.subscribe(Topic.DEVICE_UPDATED, unsubscribe_other)
+    unsubscribe_listener = bus.subscribe(Topic.DEVICE_UPDATED, listener.on_event)
+    bus.publish(DeviceUpdated(None))
+    assert listener.events == []
+
+
+def test_weak_subscription_to_builtin_method():
+    bus = EventBus()
+    received = []
+    handler = received.append
+    bus.subscribe(Topic.DEVICE_UPDATED, handler, weak=True)
+    bus.publish(DeviceUpdated(None))
+    assert len(received) == 1
@@ -0,0 +1,156 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from airtouch2.common.PendingLedger import MAX_CONFIRM_ATTEMPTS, PendingLedger
+
+
+@dataclass(frozen=True)
+class State:
+    active: bool = False
+    set_temp: int = 22
+
+
+async def test_pending_values_apply_over_the_confirmed_state():
+    ledger: PendingLedger[State] = PendingLedger()
+    ledger.expect("set_temp", 24)
+    assert ledger
+    assert ledger.apply(State()) == State(set_temp=24)
+
+
+async def test_frame_showing_the_value_confirms_the_intent():
+    ledger: PendingLedger[State] = PendingLedger()
+    ledger.expect("set_temp", 24)
+    waiter = ledger.wait("set_temp", 24)
+    ledger.confirm(State(set_temp=22))
+    assert ledger and not waiter.done()
+    ledger.confirm(State(set_temp=24))
+    assert not ledger
+    assert await waiter is True
+
+
+async def test_unconfirmed_intent_expires():
+    expired = []
+    ledger: PendingLedger[State] = PendingLedger(lambda: expired.append(True))
+    ledger.expect("active", True, timeout=0.02)
+    waiter = ledger.wait("active", True)
+    assert await asyncio.wait_for(waiter, 1) is False
+    assert not ledger
+    assert expired == [True]
+    assert ledger.apply(State()) == State()
+
+
+async def test_newer_command_supersedes_the_pending_one():
+    ledger: PendingLedger[State] = PendingLedger()
+    ledger.expect("set_temp", 24)
+    waiter = ledger.wait("set_temp", 24)
+    ledger.expect("set_temp", 25)
+    assert await waiter is False
+    assert ledger.get("set_temp") == 25
+
+
+async def test_repeating_the_pending_value_keeps_its_waiters():
+    ledger: PendingLedger[State] = PendingLedger()
+    ledger.expect("set_temp", 24)
+    waiter = ledger.wait("set_temp", 24)
+    ledger.expect("set_temp", 24)
+    ledger.confirm(State(set_temp=24))
+    assert await waiter is True
+
+
+async def test_discard_only_matching_value():
+    ledger: PendingLedger[State] = PendingLedger()
+    ledger.expect("set_temp", 24)
+    ledger.discard("set_temp", 25)
+    assert ledger.get("set_temp") == 24
+    ledger.discard("set_temp", 24)
+    assert not ledger
+
+
+async def test_accept_decides_what_confirms():
+    ledger: PendingLedger[State] = PendingLedger()
+    ledger.expect("set_temp", 24, accept=lambda reported: reported >= 24)
+    ledger.confirm(State(set_temp=26))
+    assert not ledger
+
+
+def make_command(ledger: PendingLedger[State], field: str, value: Any) -> tuple[list[int], Callable[[], Awaitable[None]]]:
+    sends: list[int] = []
+
+    async def send() -> None:
+        sends.append(len(sends))
+        ledger.expect(field, value)
+
+    return sends, send
+
+
+async def test_lost_command_is_resent_up_to_the_limit():
+    ledger: PendingLedger[State] = PendingLedger()
+    sends, send = make_command(ledger, "set_temp", 24)
+    lost = []
+    result = await ledger.until_confirmed("set_temp", 24, send, lambda: False, 5.0, lambda: 0.01,
+                                          lambda: lost.append(True))
+    assert not result.confirmed
+    assert len(sends) == MAX_CONFIRM_ATTEMPTS == result.attempts
+    assert len(lost) == MAX_CONFIRM_ATTEMPTS - 1
+    assert not ledger
+
+
+async def test_resent_command_confirmed_by_a_later_frame():
+    ledger: PendingLedger[State] = PendingLedger()
+    sends, send = make_command(ledger, "set_temp", 24)
+
+    async def confirm_second_send() -> None:
+        while len(sends) < 2:
+            await asyncio.sleep(0.005)
+        ledger.confirm(State(set_temp=24))
+
+    task = asyncio.ensure_future(confirm_second_send())
+    result = await ledger.until_confirmed("set_temp", 24, send, lambda: False, 5.0, lambda: 0.02)
+    await task
+    assert result.confirmed and result.attempts == 2
+
+
+async def test_command_already_applied_is_not_sent():
+    ledger: PendingLedger[State] = PendingLedger()
+    sends, send = make_command(ledger, "set_temp", 24)
+    result = await ledger.until_confirmed("set_temp", 24, send, lambda: True, 5.0, lambda: 0.02)
+    assert result.confirmed and sends == []
+
+
+async def test_superseded_command_fails_without_resending():
+    ledger: PendingLedger[State] = PendingLedger()
+    sends, send = make_command(ledger, "set_temp", 24)
+    call = asyncio.ensure_future(ledger.until_confirmed("set_temp", 24, send, lambda: False, 5.0, lambda: 1.0))
+    await asyncio.sleep(0.01)
+    ledger.expect("set_temp", 25)
+    result = await call
+    assert not result.confirmed and len(sends) == 1
+
+
+async def test_verify_finding_the_command_applied_prevents_a_resend():
+    ledger: PendingLedger[State] = PendingLedger()
+    sends, send = make_command(ledger, "active", True)
+    state = State()
+
+    async def verify() -> None:
+        # the fresh state shows the first send was applied after all
+        nonlocal state
+        state = State(active=True)
+        ledger.confirm(state)
+
+    result = await ledger.until_confirmed("active", True, send, lambda: state.active, 5.0, lambda: 0.01,
+                                          verify=verify)
+    assert result.confirmed and len(sends) == 1
+
+
+async def test_failed_verify_gives_up_without_resending():
+    ledger: PendingLedger[State] = PendingLedger()
+    sends, send = make_command(ledger, "active", True)
+
+    async def verify() -> None:
+        raise TimeoutError
+
+    result = await ledger.until_confirmed("active", True, send, lambda: False, 5.0, lambda: 0.01, verify=verify)
+    assert not result.confirmed and len(sends) == 1
+    assert not ledger
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from airtouch2.common.SingleFlight import SingleFlight
+
+
+async def test_concurrent_callers_share_one_fetch():
+    fetches = 0
+    release = asyncio.Event()
+
+    async def fetch() -> int:
+        nonlocal fetches
+        fetches += 1
+        await release.wait()
+        return fetches
+
+    flight = SingleFlight(fetch)
+    callers = [asyncio.ensure_future(flight.run()) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert flight.in_flight
+    release.set()
+    assert await asyncio.gather(*callers) == [1, 1, 1]
+    assert not flight.in_flight
+    # the next call starts a new fetch
+    assert await flight.run() == 2
+
+
+async def test_callers_share_the_exception():
+    async def fetch() -> None:
+        await asyncio.sleep(0)
+        raise TimeoutError
+
+    flight = SingleFlight(fetch)
+    results = await asyncio.gather(flight.run(), flight.run(), return_exceptions=True)
+    assert all(isinstance(result, TimeoutError) for result in results)
+    assert not flight.in_flight
+
+
+async def test_cancelled_caller_doesnt_cancel_the_fetch():
+    release = asyncio.Event()
+
+    async def fetch() -> str:
+        await release.wait()
+        return "state"
+
+    flight = SingleFlight(fetch)
+    first = asyncio.ensure_future(flight.run())
+    second = asyncio.ensure_future(flight.run())
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+    assert await second == "state"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+
+async def test_fetch_is_started_with_the_task_creator():
+    tasks = []
+
+    def create_task(coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        tasks.append(task)
+        return task
+
+    async def fetch() -> int:
+        return 1
+
+    flight = SingleFlight(fetch, create_task)
+    assert await flight.run() == 1
+    assert len(tasks) == 1
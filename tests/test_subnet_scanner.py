@@ -0,0 +1,94 @@
+import asyncio
+import sys
+
+import pytest
+
+from airtouch2.discovery import ControllerProtocol, ProbeResult, SubnetScanner
+
+
+class FakeProbe:
+    """Stands in for probe(), answering for 'controllers' and tracking how many probes run at once"""
+
+    def __init__(self, controllers: dict[str, ControllerProtocol]):
+        self.controllers = controllers
+        self.probed: list[str] = []
+        self.running = 0
+        self.most_running = 0
+
+    async def __call__(self, host: str, timeout: float, connect_timeout: float) -> ProbeResult | None:
+        self.probed.append(host)
+        self.running += 1
+        self.most_running = max(self.most_running, self.running)
+        await asyncio.sleep(0.001)
+        self.running -= 1
+        protocol = self.controllers.get(host)
+        return None if protocol is None else ProbeResult(host, protocol, 9200, 1, 0.001, host)
+
+
+@pytest.fixture
+def fake_probe(monkeypatch: pytest.MonkeyPatch) -> FakeProbe:
+    fake = FakeProbe({"10.0.0.5": ControllerProtocol.AT2, "10.0.0.9": ControllerProtocol.AT2PLUS})
+    # the package re-exports the class under its module's name, so patch the module itself
+    monkeypatch.setattr(sys.modules[SubnetScanner.__module__], "probe", fake)
+    return fake
+
+
+async def test_network_larger_than_limit_is_refused(fake_probe: FakeProbe):
+    scanner = SubnetScanner()
+    with pytest.raises(ValueError):
+        await scanner.scan("10.0.0.0/21")
+    assert fake_probe.probed == []
+    # a /22 is the largest accepted
+    await scanner.scan("10.0.0.0/22")
+    assert len(fake_probe.probed) == 1022
+
+
+async def test_probes_are_bounded_by_concurrency(fake_probe: FakeProbe):
+    scanner = SubnetScanner(concurrency=4)
+    found = await scanner.scan("10.0.0.0/24")
+    assert len(fake_probe.probed) == scanner.probes == 254
+    assert fake_probe.most_running == 4
+    assert {hit.host for hit in found} == {"10.0.0.5", "10.0.0.9"}
+
+
+async def test_rescan_skips_misses_unless_full(fake_probe: FakeProbe):
+    scanner = SubnetScanner()
+    await scanner.scan("10.0.0.0/28")
+    fake_probe.probed.clear()
+    found = await scanner.scan("10.0.0.0/28")
+    assert sorted(fake_probe.probed) == ["10.0.0.5", "10.0.0.9"]
+    assert len(found) == 2
+
+    fake_probe.probed.clear()
+    await scanner.scan("10.0.0.0/28", full=True)
+    assert len(fake_probe.probed) == 14
+
+
+async def test_misses_expire(fake_probe: FakeProbe):
+    scanner = SubnetScanner(miss_ttl=0.0)
+    await scanner.scan("10.0.0.0/29")
+    fake_probe.probed.clear()
+    await scanner.scan("10.0.0.0/29")
+    assert len(fake_probe.probed) == 6
+
+
+async def test_controller_that_stops_answering_is_dropped(fake_probe: FakeProbe):
+    scanner = SubnetScanner()
+    await scanner.scan("10.0.0.0/28")
+    del fake_probe.controllers["10.0.0.5"]
+    found = await scanner.scan("10.0.0.0/28")
+    assert [hit.host for hit in found] == ["10.0.0.9"]
+    assert [hit.host for hit in scanner.hits] == ["10.0.0.9"]
+
+
+async def test_find_filters_by_protocol_name_and_exclusions(fake_probe: FakeProbe):
+    scanner = SubnetScanner()
+    found = await scanner.find("10.0.0.0/28", ControllerProtocol.AT2)
+    assert found is not None and found.host == "10.0.0.5"
+    assert await scanner.find("10.0.0.0/28", ControllerProtocol.AT2, name="other") is None
+    assert await scanner.find("10.0.0.0/28", ControllerProtocol.AT2, exclude=["10.0.0.5"]) is None
+
+    # two controllers of the protocol can't be told apart
+    fake_probe.controllers["10.0.0.6"] = ControllerProtocol.AT2
+    scanner.forget("10.0.0.6")
+    assert await scanner.find("10.0.0.0/28", ControllerProtocol.AT2) is None